@@ -0,0 +1,181 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run_benchmarks import percentile
+from src.models.idealista.model import MODELS_PATH, latest_model_dir, publish
+
+CITIES = ['lisbon', 'porto', 'cascais', 'oeiras', 'sintra']
+LOCATIONS = ['Avenidas Novas, Lisboa', 'Estrela, Lisboa', 'Parque das Nações, Lisboa',
+             'Bonfim, Porto', 'Cedofeita, Porto', 'Carcavelos e Parede, Cascais']
+ENERGY = ['A+', 'A', 'B', 'B-', 'C', 'D', 'E', 'F', None]
+
+
+def make_inputs(count, seed):
+    """count distinct plausible listing inputs"""
+    rng = random.Random(seed)
+    inputs = []
+    for _ in range(count):
+        bedrooms = rng.randint(0, 5)
+        inputs.append({
+            'area_m2': round(rng.uniform(30, 60) + bedrooms * rng.uniform(20, 35), 1),
+            'bedrooms': bedrooms,
+            'bathrooms': max(1, bedrooms - rng.randint(0, 2)),
+            'operation': rng.choice(['sale', 'sale', 'rent']),
+            'property_type': 'homes',
+            'city': rng.choice(CITIES),
+            'location': rng.choice(LOCATIONS),
+            'energy_certificate': rng.choice(ENERGY),
+        })
+    return inputs
+
+
+class Client:
+    """One keep-alive HTTP connection per thread"""
+    local = threading.local()
+
+    def __init__(self, base_url):
+        parsed = urlparse(base_url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+
+    def post(self, path, payload):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        body = json.dumps(payload)
+        try:
+            connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            raise
+        return response.status, data
+
+    def get(self, path):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=5)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+
+def wait_ready(client, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, body = client.get('/health')
+            if status == 200 and json.loads(body).get('model'):
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def swap_model(models_root):
+    """Publish a copy of the current model under a new name (exercises hot reload)"""
+    source = latest_model_dir(models_root)
+    target = os.path.join(models_root, f"avm_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}_loadtest")
+    shutil.copytree(source, target)
+    publish(target, models_root)
+    return target
+
+
+def run_load(client, inputs, requests, concurrency, batch_size, burst, swap_at=None, on_swap=None):
+    """Send requests in bursts of `burst` concurrent calls; returns (latencies, errors, seconds)"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def one(i):
+        if batch_size:
+            path, payload = '/valuate/batch', {'listings': [inputs[(i * batch_size + j) % len(inputs)]
+                                                             for j in range(batch_size)]}
+        else:
+            path, payload = '/valuate', inputs[i % len(inputs)]
+        start = time.perf_counter()
+        try:
+            status, _ = client.post(path, payload)
+        except Exception as e:
+            status = repr(e)
+        elapsed = time.perf_counter() - start
+        with lock:
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors.append(status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for offset in range(0, requests, burst):
+            if swap_at is not None and offset <= swap_at < offset + burst:
+                on_swap()
+            list(executor.map(one, range(offset, min(offset + burst, requests))))
+    return latencies, errors, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the valuation service (p50/p99 latency, requests/s)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="service base URL")
+    parser.add_argument("--serve", action="store_true", help="start `src/main.py serve` on --url's port for the test")
+    parser.add_argument("--models", default=MODELS_PATH, help="with --serve/--swap-model: model directory")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32, help="client threads")
+    parser.add_argument("--burst", type=int, default=64, help="requests fired together before waiting for them")
+    parser.add_argument("--batch-size", type=int, default=0, help="listings per /valuate/batch call (0: /valuate)")
+    parser.add_argument("--unique", type=int, default=500, help="distinct inputs cycled through (cache hits)")
+    parser.add_argument("--swap-model", action="store_true", help="publish a model copy halfway and POST /reload")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    client = Client(args.url)
+    server = None
+    if args.serve:
+        server = subprocess.Popen([sys.executable, "src/main.py", "serve", "--port", str(client.port),
+                                   "--models", args.models])
+    try:
+        if not wait_ready(client):
+            print(f"Service at {args.url} not ready (is a model trained? python src/models/idealista/train.py)")
+            return 1
+        inputs = make_inputs(args.unique, args.seed)
+
+        def on_swap():
+            print(f"Published {swap_model(args.models)}, reload: {client.post('/reload', {})[1].decode()}")
+
+        latencies, errors, seconds = run_load(
+            client, inputs, args.requests, args.concurrency, args.batch_size, args.burst,
+            swap_at=args.requests // 2 if args.swap_model else None, on_swap=on_swap,
+        )
+        p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+        valuations = len(latencies) * (args.batch_size or 1)
+        print(f"{len(latencies)} ok, {len(errors)} errors in {seconds:.2f}s: {len(latencies) / seconds:.1f} requests/s, "
+              f"{valuations / seconds:.1f} valuations/s")
+        if latencies:
+            print(f"Latency p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+        if errors:
+            print(f"Errors (first 5): {errors[:5]}")
+        print(f"Service: {client.get('/health')[1].decode()}")
+        return 0 if not errors else 2
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipelines.idealista.reparse import find_pages, parse_page, reparse
+from src.scrapers.idealista.fetcher import PageFetcher
+from src.scrapers.idealista.listing_parser import parse_listing_html
+from src.scrapers.idealista.output_sink import BACKENDS, OutputSink
+from src.scrapers.idealista.search_parser import next_page_url, parse_search_page
+from src.scrapers.idealista.utils.replay_server import DEFAULT_RUN_DIRS, ReplayServer
+
+RESULTS_DIR = "benchmarks/results"
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of seconds; None when there is nothing to rank"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def replay_server(params):
+    return ReplayServer(
+        run_dirs=params['run_dirs'], latency=params['latency'], latency_jitter=params['jitter'],
+        error_rate=params['error_rate'], seed=params['seed'],
+    )
+
+
+def run_pages(run_dirs):
+    """Stored search and detail pages of the given run directories"""
+    return [path for run_dir in run_dirs
+            for path in find_pages(os.path.dirname(run_dir), {os.path.basename(run_dir)[len('run_'):]})]
+
+
+def search_routes(server):
+    return sorted(path for path in server.routes if '/imovel/' not in path and '/empreendimento/' not in path)
+
+
+def detail_routes(server):
+    # Every listing is routed twice (imovel + empreendimento); fetch each page once
+    return sorted(path for path in server.routes if path.startswith('/en/imovel/'))
+
+
+def timed_fetch(fetcher, url, parse, latencies):
+    """HTTP fetch + parse of one page; returns the parsed items, or None on an error response/failure
+
+    Goes through fetch_http so an empty results page (no cards, so the
+    scraper would try the browser) still counts as a served page.
+    """
+    start = time.perf_counter()
+    try:
+        status, html, _, _ = fetcher.fetch_http(url)
+        if status != 200:
+            return None
+        items = parse(html)
+    except Exception:
+        return None
+    latencies.append(time.perf_counter() - start)
+    return items
+
+
+def bench_search_pages(params):
+    """Search page fetch + card/link extraction over HTTP"""
+    latencies, items, errors = [], 0, 0
+    with replay_server(params) as server:
+        fetcher = PageFetcher()
+        for _ in range(params['repeat']):
+            for path in search_routes(server):
+                cards = timed_fetch(fetcher, server.base_url + path,
+                                    lambda html: parse_search_page(html, base_url=server.base_url), latencies)
+                if cards is None:
+                    errors += 1
+                else:
+                    items += len(cards)
+        fetcher.close()
+    return {'items': items, 'unit': 'listings', 'latencies': latencies, 'errors': errors}
+
+
+def bench_detail_pages(params):
+    """Detail page fetch + full field extraction over HTTP"""
+    latencies, items, errors = [], 0, 0
+    with replay_server(params) as server:
+        fetcher = PageFetcher()
+        for _ in range(params['repeat']):
+            for path in detail_routes(server):
+                url = server.base_url + path
+                record = timed_fetch(fetcher, url, lambda html: parse_listing_html(html, url=url), latencies)
+                if record is None:
+                    errors += 1
+                else:
+                    items += 1
+        fetcher.close()
+    return {'items': items, 'unit': 'listings', 'latencies': latencies, 'errors': errors}
+
+
+def bench_pagination(params):
+    """Walk every search from page 1 along its "Next" links until the fixtures run out"""
+    latencies, pages, errors = [], 0, 0
+    with replay_server(params) as server:
+        fetcher = PageFetcher()
+        starts = [path for path in search_routes(server) if 'pagina-' not in path]
+        for _ in range(params['repeat']):
+            for path in starts:
+                url = server.base_url + path
+                while url and url.replace(server.base_url, '', 1) in server.routes:
+                    next_url = timed_fetch(fetcher, url, lambda html: next_page_url(html, server.base_url) or '',
+                                           latencies)
+                    if next_url is None:
+                        errors += 1
+                        break
+                    pages += 1
+                    url = next_url
+        fetcher.close()
+    return {'items': pages, 'unit': 'pages', 'latencies': latencies, 'errors': errors}
+
+
+def sample_records(params, count=50):
+    records = []
+    for path in run_pages(params['run_dirs']):
+        if '/listings/' in path.replace(os.sep, '/'):
+            with open(path, 'r', encoding='utf-8') as f:
+                records.append(parse_listing_html(f.read()))
+        if len(records) >= count:
+            break
+    return records
+
+
+def bench_output_sink(params):
+    """OutputSink throughput per format; latencies are the put() calls the crawl thread pays"""
+    records = sample_records(params)
+    results, latencies = {}, []
+    for fmt in BACKENDS:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            sink = OutputSink(tmp, fmt=fmt)
+            for i in range(params['rows']):
+                put_start = time.perf_counter()
+                sink.put(records[i % len(records)])
+                latencies.append(time.perf_counter() - put_start)
+            stats = sink.close()
+            seconds = time.perf_counter() - start
+        results[fmt] = {'rows': stats['written'], 'seconds': round(seconds, 4),
+                        'rows_per_second': round(stats['written'] / seconds, 1),
+                        'write_seconds': round(stats['write_seconds'], 4)}
+    return {'items': params['rows'] * len(BACKENDS), 'unit': 'rows', 'latencies': latencies,
+            'errors': 0, 'formats': results}
+
+
+def bench_offline_parse(params):
+    """Parse every stored page from disk in this process (no network)"""
+    latencies, rows, errors = [], 0, 0
+    paths = run_pages(params['run_dirs'])
+    for path in paths:
+        start = time.perf_counter()
+        _, _, _, page_rows, _, error = parse_page(path)
+        latencies.append(time.perf_counter() - start)
+        if error:
+            errors += 1
+        rows += len(page_rows)
+    return {'items': rows, 'unit': 'listings', 'latencies': latencies, 'errors': errors, 'pages': len(paths)}
+
+
+def bench_reparse(params):
+    """The reparse pipeline end to end (process pool, CSV output)"""
+    paths = run_pages(params['run_dirs'])
+    with tempfile.TemporaryDirectory() as tmp:
+        summary = reparse(paths, tmp, workers=params['workers'], progress_every=3600)
+    return {'items': summary['rows'], 'unit': 'listings', 'latencies': [], 'errors': summary['errors'],
+            'pages': summary['pages'], 'workers': summary['workers']}
+
+
+BENCHMARKS = {
+    'search_pages': bench_search_pages,
+    'detail_pages': bench_detail_pages,
+    'pagination': bench_pagination,
+    'output_sink': bench_output_sink,
+    'offline_parse': bench_offline_parse,
+    'reparse': bench_reparse,
+}
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and its finished children (Linux reports KiB, macOS bytes)"""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_one(name, params):
+    """Run one benchmark in the current (fresh) process and summarize it"""
+    start = time.perf_counter()
+    result = BENCHMARKS[name](params)
+    seconds = time.perf_counter() - start
+    latencies = result.pop('latencies')
+    p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+    result.update(
+        seconds=round(seconds, 4),
+        per_second=round(result['items'] / seconds, 1) if seconds else 0.0,
+        p50_ms=round(p50 * 1000, 3) if p50 is not None else None,
+        p95_ms=round(p95 * 1000, 3) if p95 is not None else None,
+        peak_rss_mb=peak_rss_mb(),
+    )
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(previous, current):
+    """Print throughput and p95 changes against an earlier results file"""
+    print(f"\nvs {previous['commit']} ({previous['started_at']}):")
+    for name, result in current['results'].items():
+        before = previous['results'].get(name)
+        if not before:
+            continue
+        rate = (result['per_second'] - before['per_second']) / before['per_second'] * 100 if before['per_second'] else 0
+        line = f"  {name:<14} {before['per_second']:>10} -> {result['per_second']:>10} {result['unit']}/s ({rate:+.1f}%)"
+        if before.get('p95_ms') and result.get('p95_ms'):
+            line += f", p95 {before['p95_ms']} -> {result['p95_ms']} ms"
+        line += f", RSS {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scraper benchmarks against the local bronze replay server")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--runs", nargs="+", default=DEFAULT_RUN_DIRS, metavar="RUN_DIR",
+                        help="bronze run directories served and parsed")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the injected latency/errors")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the fixtures in the fetch benchmarks")
+    parser.add_argument("--rows", type=int, default=20000, help="rows per format in the output sink benchmark")
+    parser.add_argument("--workers", type=int, help="reparse processes (default: CPU count)")
+    parser.add_argument("--out", help=f"results file (default: {RESULTS_DIR}/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", metavar="RESULTS_JSON", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    params = {'run_dirs': args.runs, 'latency': args.latency, 'jitter': args.jitter,
+              'error_rate': args.error_rate, 'seed': args.seed, 'repeat': args.repeat,
+              'rows': args.rows, 'workers': args.workers}
+    report = {
+        'commit': git_commit(), 'started_at': datetime.now().isoformat(),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'params': params, 'results': {},
+    }
+
+    # A fresh process per benchmark keeps peak RSS and warm caches from leaking between them
+    context = multiprocessing.get_context('spawn')
+    for name in args.only or BENCHMARKS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_one, name, params).result()
+        report['results'][name] = result
+        latency = f", p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms" if result['p50_ms'] is not None else ''
+        print(f"{name:<14} {result['items']:>7} {result['unit']} in {result['seconds']:.2f}s: "
+              f"{result['per_second']} {result['unit']}/s{latency}, errors {result['errors']}, "
+              f"peak RSS {result['peak_rss_mb']} MB")
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}_{report['commit']}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results: {out}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
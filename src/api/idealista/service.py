@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+
+from src.models.idealista.model import MODELS_PATH, AvmModel, latest_model_dir
+
+log = logging.getLogger('api.valuation')
+
+
+class ListingInput(BaseModel):
+    area_m2: float = Field(gt=0)
+    bedrooms: Optional[int] = Field(default=None, ge=0)
+    bathrooms: Optional[int] = Field(default=None, ge=0)
+    completion_year: Optional[int] = None
+    operation: str = 'sale'
+    property_type: Optional[str] = None
+    city: Optional[str] = None
+    property_type_detail: Optional[str] = None
+    energy_certificate: Optional[str] = None
+    status: Optional[str] = None
+    location: Optional[str] = None
+
+
+class BatchInput(BaseModel):
+    listings: List[ListingInput] = Field(max_length=1000)
+
+
+class Valuation(BaseModel):
+    price_per_m2: float
+    price: float
+    model: str
+    cached: bool = False
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key"""
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'size': len(self.data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                    'hit_ratio': round(self.hits / total, 3) if total else 0.0}
+
+
+class ModelHolder:
+    """
+    The model being served, swapped in one assignment when LATEST changes.
+    - load_latest() loads the new model completely before the swap, so requests never
+      see a half-loaded model; batches already running finish on the model they started with
+    - A model that fails to load leaves the current one in place
+    """
+    def __init__(self, root=MODELS_PATH, nthread=None):
+        self.root = root
+        self.nthread = nthread
+        self.current = None  # (model directory, AvmModel)
+        self.reloads = 0
+        self.lock = threading.Lock()
+
+    def load_latest(self):
+        """Load the model LATEST points at if it is not the one served; returns True on a swap"""
+        with self.lock:
+            path = latest_model_dir(self.root)
+            if self.current is not None and os.path.normpath(path) == os.path.normpath(self.current[0]):
+                return False
+            model = AvmModel.load(path, nthread=self.nthread)
+            self.current = (path, model)
+            self.reloads += 1
+            return True
+
+    def name(self):
+        return os.path.basename(os.path.normpath(self.current[0])) if self.current else None
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent valuation requests into one vectorized predict call.
+    - The first waiting request opens a batch; whatever else arrives within max_wait
+      seconds (up to max_batch) joins it
+    - predict runs on a dedicated thread, so the event loop keeps accepting requests and
+      the next batch fills up meanwhile
+    """
+    def __init__(self, holder, max_batch=64, max_wait=0.005):
+        self.holder = holder
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predict")
+        self.task = None
+        self.stats = {'requests': 0, 'batches': 0, 'largest_batch': 0, 'predict_seconds': 0.0}
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, item):
+        """(price per m², price, model name) for one listing dict"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    def drain(self, batch):
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    def predict(self, items):
+        path, model = self.holder.current
+        start = time.perf_counter()
+        frame = model.predict(items)
+        self.stats['predict_seconds'] += time.perf_counter() - start
+        name = os.path.basename(os.path.normpath(path))
+        return [(float(ppm2), float(price), name)
+                for ppm2, price in zip(frame['price_per_m2'].to_numpy(), frame['price'].to_numpy())]
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            self.drain(batch)
+            if len(batch) < self.max_batch and self.max_wait > 0:
+                await asyncio.sleep(self.max_wait)
+                self.drain(batch)
+            self.stats['requests'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def cache_key(model_name, item):
+    return model_name + "|" + json.dumps(item, sort_keys=True)
+
+
+def create_app(models_root=MODELS_PATH, max_batch=64, max_wait_ms=5.0, cache_size=10000,
+               reload_interval=10.0, nthread=None):
+    """FastAPI app serving the LATEST model under models_root"""
+    holder = ModelHolder(models_root, nthread=nthread)
+    cache = LRUCache(cache_size)
+    state = {}
+
+    def reload_model():
+        swapped = holder.load_latest()
+        if swapped:
+            # Keys carry the model name, so stale entries could not be served; drop them for the memory
+            cache.clear()
+            log.info(f"Serving model {holder.name()}")
+        return swapped
+
+    async def watch_latest():
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(reload_interval)
+            try:
+                await loop.run_in_executor(None, reload_model)
+            except Exception as e:
+                log.error(f"Model reload failed, keeping {holder.name()}: {e}")
+
+    @asynccontextmanager
+    async def lifespan(app):
+        try:
+            reload_model()
+        except Exception as e:
+            log.warning(f"No model loaded yet from {models_root}: {e}")
+        state['batcher'] = MicroBatcher(holder, max_batch, max_wait_ms / 1000).start()
+        watcher = asyncio.get_running_loop().create_task(watch_latest()) if reload_interval else None
+        yield
+        if watcher is not None:
+            watcher.cancel()
+        await state['batcher'].stop()
+
+    app = FastAPI(title="Idealista valuation service", lifespan=lifespan)
+
+    async def valuate_items(listings):
+        if holder.current is None:
+            raise HTTPException(status_code=503, detail="No model loaded")
+        model_name = holder.name()
+        items = [listing.model_dump() for listing in listings]
+        keys = [cache_key(model_name, item) for item in items]
+        results = [cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            computed = await asyncio.gather(*(state['batcher'].submit(items[i]) for i in missing))
+            for i, (ppm2, price, name) in zip(missing, computed):
+                results[i] = Valuation(price_per_m2=ppm2, price=price, model=name)
+                cache.put(cache_key(name, items[i]), results[i])
+        hits = set(range(len(items))) - set(missing)
+        return [result.model_copy(update={'cached': True}) if i in hits else result
+                for i, result in enumerate(results)]
+
+    @app.post("/valuate", response_model=Valuation)
+    async def valuate(listing: ListingInput):
+        return (await valuate_items([listing]))[0]
+
+    @app.post("/valuate/batch", response_model=List[Valuation])
+    async def valuate_batch(batch: BatchInput):
+        return await valuate_items(batch.listings)
+
+    @app.post("/reload")
+    async def reload():
+        try:
+            swapped = await asyncio.get_running_loop().run_in_executor(None, reload_model)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+        return {'swapped': swapped, 'model': holder.name()}
+
+    @app.get("/health")
+    async def health():
+        batcher = state.get('batcher')
+        meta = holder.current[1].meta if holder.current else {}
+        stats = dict(batcher.stats) if batcher else {}
+        if stats.get('batches'):
+            stats['avg_batch'] = round(stats['requests'] / stats['batches'], 2)
+            stats['predict_seconds'] = round(stats['predict_seconds'], 3)
+        return {
+            'model': holder.name(), 'trained_at': meta.get('trained_at'),
+            'valid_metrics': meta.get('metrics', {}).get('valid'), 'reloads': holder.reloads,
+            'batching': stats, 'cache': cache.stats(),
+        }
+
+    return app
@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipelines.idealista.reparse import BRONZE_ROOT, archive_pages, find_pages, reparse
+from src.scrapers.idealista.metrics import compare_summaries, load_summary
+from src.scrapers.idealista.page_archive import ARCHIVE_PATH, PageArchive
+from src.scrapers.idealista.work_queue import merge_shards, shard_paths
+
+
+def cmd_reparse(args):
+    """Re-extract stored bronze HTML offline, no browser or network"""
+    if args.archive:
+        archive = PageArchive(args.archive)
+        paths = [key for run_id in (args.runs or [None]) for key in archive.keys(run_id)]
+        archive.close()
+    else:
+        paths = find_pages(args.root, set(args.runs) if args.runs else None)
+    if not paths:
+        print(f"No stored pages found under {args.archive or args.root}")
+        return 1
+
+    out_dir = args.out or os.path.join(args.root, f"reparse_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}")
+    print(f"Re-parsing {len(paths)} pages into {out_dir}")
+    summary = reparse(paths, out_dir, workers=args.workers, archive_path=args.archive)
+
+    with open(os.path.join(out_dir, "summary.json"), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Done: {summary['search']} search pages, {summary['detail']} detail pages, "
+          f"{summary['rows']} rows, {summary['errors']} errors in {summary['seconds']}s "
+          f"({summary['pages_per_second']} pages/s)")
+    print(f"Silver: python src/pipelines/idealista/silver.py --bronze '{out_dir}/run_*/idealista_data.csv'")
+    return 0 if summary['errors'] == 0 else 2
+
+
+def cmd_archive(args):
+    """Pack stored bronze page files into the compressed, deduplicated page archive"""
+    paths = find_pages(args.root, set(args.runs) if args.runs else None)
+    archive = PageArchive(args.path, codec=args.codec)
+    try:
+        added = archive_pages(paths, archive)
+    finally:
+        archive.close()
+    stats = archive.stats
+    ratio = stats['raw_bytes'] / stats['stored_bytes'] if stats['stored_bytes'] else 0
+    print(f"Archived {added} pages into {args.path}: {stats['stored']} new blobs, "
+          f"{stats['deduplicated']} duplicates, {stats['raw_bytes'] / 1e6:.1f} MB -> "
+          f"{stats['stored_bytes'] / 1e6:.1f} MB ({ratio:.1f}x)")
+    return 0
+
+
+def cmd_metrics(args):
+    """Compare the timing histograms of two runs' metrics.json, biggest p95 changes first"""
+    old, new = load_summary(args.old), load_summary(args.new)
+    print(f"Wall: {old['wall_seconds']}s -> {new['wall_seconds']}s")
+    print(f"Time split: {old['time_split']} -> {new['time_split']}")
+    print(f"{'metric':<50} {'p50 old':>9} {'p50 new':>9} {'p95 old':>9} {'p95 new':>9} {'p95 %':>8}")
+    regressions = 0
+    for key, p50_old, p50_new, p95_old, p95_new, change in compare_summaries(old, new, args.min_count):
+        flag = " <-" if change >= args.threshold else ""
+        regressions += bool(flag)
+        print(f"{key[:50]:<50} {p50_old:>9.4f} {p50_new:>9.4f} {p95_old:>9.4f} {p95_new:>9.4f} {change:>+7.1f}%{flag}")
+    for key in sorted(set(old['counters']) | set(new['counters'])):
+        print(f"{key}: {old['counters'].get(key, 0)} -> {new['counters'].get(key, 0)}")
+    return 2 if regressions else 0
+
+
+def cmd_merge_shards(args):
+    """Merge the per-worker outputs of a shared run into its run directory"""
+    run_path = args.run if os.path.isdir(args.run) else os.path.join(BRONZE_ROOT, f"run_{args.run}")
+    if not shard_paths(run_path):
+        print(f"No shards under {run_path}")
+        return 1
+    merged = merge_shards(run_path)
+    print(f"Merged {len(merged['shards'])} shards into {run_path}: {merged['total_rows']} rows, "
+          f"{len(merged['chunks'])} chunks ({merged['format']})")
+    if not merged['closed']:
+        print("Some shards are still open (worker running or crashed): their unwritten rows are missing")
+    return 0
+
+
+def cmd_serve(args):
+    """Serve valuations of the latest trained AVM over HTTP"""
+    import uvicorn
+    from src.api.idealista.service import create_app
+    from src.models.idealista.model import MODELS_PATH
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+    app = create_app(args.models or MODELS_PATH, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+                     cache_size=args.cache_size, reload_interval=args.reload_interval, nthread=args.threads)
+    uvicorn.run(app, host=args.host, port=args.port, access_log=False, log_level="warning")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Real estate data tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reparse_parser = commands.add_parser("reparse", help="re-extract stored bronze pages with the current parsers")
+    reparse_parser.add_argument("--runs", nargs="+", metavar="RUN_ID",
+                                help="runs to re-parse, e.g. 2025-10-02T12-42-39 (default: all)")
+    reparse_parser.add_argument("--root", default=BRONZE_ROOT, help="bronze directory holding run_* folders")
+    reparse_parser.add_argument("--out", help="output directory (default: <root>/reparse_<timestamp>)")
+    reparse_parser.add_argument("--workers", type=int, help="parser processes (default: CPU count)")
+    reparse_parser.add_argument("--archive", metavar="PATH", help="read pages from a page archive instead of files")
+    reparse_parser.set_defaults(func=cmd_reparse)
+
+    archive_parser = commands.add_parser("archive", help="pack stored bronze pages into the page archive")
+    archive_parser.add_argument("--runs", nargs="+", metavar="RUN_ID", help="runs to pack (default: all)")
+    archive_parser.add_argument("--root", default=BRONZE_ROOT, help="bronze directory holding run_* folders")
+    archive_parser.add_argument("--path", default=ARCHIVE_PATH, help="archive directory")
+    archive_parser.add_argument("--codec", choices=["zstd", "gzip"], help="default: zstd when installed")
+    archive_parser.set_defaults(func=cmd_archive)
+
+    metrics_parser = commands.add_parser("metrics", help="compare the metrics.json of two runs")
+    metrics_parser.add_argument("old", help="baseline run directory or metrics.json")
+    metrics_parser.add_argument("new", help="run directory or metrics.json to check")
+    metrics_parser.add_argument("--threshold", type=float, default=20.0,
+                                help="flag p95 increases of at least this many percent (default: 20)")
+    metrics_parser.add_argument("--min-count", type=int, default=5,
+                                help="ignore histograms with fewer observations (default: 5)")
+    metrics_parser.set_defaults(func=cmd_metrics)
+
+    merge_parser = commands.add_parser("merge-shards", help="merge the worker outputs of a shared (--join) run")
+    merge_parser.add_argument("run", help="run id or run directory")
+    merge_parser.set_defaults(func=cmd_merge_shards)
+
+    serve_parser = commands.add_parser("serve", help="HTTP valuation service (POST /valuate, /valuate/batch)")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--models", help="model directory holding LATEST (default: data/models/idealista)")
+    serve_parser.add_argument("--max-batch", type=int, default=64, help="most requests predicted together")
+    serve_parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                              help="how long a batch waits for more requests (default: 5)")
+    serve_parser.add_argument("--cache-size", type=int, default=10000, help="LRU entries of recent valuations")
+    serve_parser.add_argument("--reload-interval", type=float, default=10.0,
+                              help="seconds between checks of LATEST for a new model (0: only POST /reload)")
+    serve_parser.add_argument("--threads", type=int, help="XGBoost predict threads (default: CPU count)")
+    serve_parser.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from src.models.idealista.features import fold
+from src.pipelines.idealista.canonical import CANONICAL_PATH, CanonicalTable
+
+COMPS_PATH = "data/models/idealista/comps"
+MANIFEST_NAME = "manifest.json"
+
+# Distance weights after robust scaling; city is a one-hot, so a different city costs its weight
+WEIGHTS = {
+    'log_area': 2.0,
+    'bedrooms': 1.0,
+    'bathrooms': 0.5,
+    'log_price_per_m2': 1.0,
+    'location_level': 1.5,
+    'city': 3.0,
+}
+NUMERIC = ['log_area', 'bedrooms', 'bathrooms', 'log_price_per_m2', 'location_level']
+LEAF_SIZE = 40
+
+INPUT_COLUMNS = ['listing_id', 'operation', 'property_type', 'city', 'location', 'area_m2', 'bedrooms',
+                 'bathrooms', 'price_eur', 'url']
+
+
+def neighbourhood(location):
+    """First part of 'Avenidas Novas, Lisboa', folded; '' when unknown"""
+    if not isinstance(location, str):
+        return ''
+    return fold(location.split(',')[0])
+
+
+def partition_name(operation, property_type):
+    return re.sub(r'[^a-z0-9_]+', '-', f"{operation}__{property_type}".lower())
+
+
+def numeric(series):
+    return pd.to_numeric(series, errors='coerce').astype('float64').to_numpy(na_value=np.nan)
+
+
+def location_levels(df):
+    """Median log price per m² per (city, neighbourhood) and per city: how expensive a place is"""
+    ppm2 = np.log(numeric(df['price_eur']) / numeric(df['area_m2']))
+    frame = pd.DataFrame({'city': df['city'].fillna('').to_numpy(), 'hood': df['location'].map(neighbourhood).to_numpy(),
+                          'ppm2': ppm2}).dropna(subset=['ppm2'])
+    hoods = frame.groupby(['city', 'hood'])['ppm2'].median()
+    return {
+        'hood': {f"{city}|{hood}": float(value) for (city, hood), value in hoods.items() if hood},
+        'city': {city: float(value) for city, value in frame.groupby('city')['ppm2'].median().items()},
+        'all': float(frame['ppm2'].median()) if len(frame) else 0.0,
+    }
+
+
+def raw_features(df, levels):
+    """Unscaled comparison features; a missing price per m² falls back to the place's level"""
+    cities = df['city'].fillna('').to_numpy()
+    hoods = df['location'].map(neighbourhood).to_numpy()
+    level = np.array([levels['hood'].get(f"{city}|{hood}", levels['city'].get(city, levels['all']))
+                      for city, hood in zip(cities, hoods)], dtype='float64')
+    area = numeric(df['area_m2'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ppm2 = np.log(numeric(df['price_eur']) / area) if 'price_eur' in df else np.full(len(df), np.nan)
+    features = np.column_stack([
+        np.log(area), numeric(df['bedrooms']), numeric(df['bathrooms']), np.where(np.isfinite(ppm2), ppm2, level), level,
+    ])
+    return features, cities
+
+
+class CompsPartition:
+    """KDTree over one (operation, property_type) slice plus what is needed to scale queries"""
+    def __init__(self, df, levels):
+        features, cities = raw_features(df, levels)
+        self.center = np.nanmedian(features, axis=0)
+        iqr = np.nanpercentile(features, 75, axis=0) - np.nanpercentile(features, 25, axis=0)
+        std = np.nanstd(features, axis=0)
+        self.scale = np.where(iqr > 0, iqr / 1.349, np.where(std > 0, std, 1.0))
+        self.cities = sorted(set(cities))
+        self.levels = levels
+        self.ids = df['listing_id'].to_numpy(dtype=np.int64)
+        self.attributes = {
+            'area_m2': numeric(df['area_m2']), 'bedrooms': numeric(df['bedrooms']),
+            'bathrooms': numeric(df['bathrooms']), 'price_eur': numeric(df['price_eur']),
+        }
+        self.labels = {'city': cities, 'location': df['location'].fillna('').to_numpy(dtype=object),
+                       'url': df['url'].fillna('').to_numpy(dtype=object)}
+        self.tree = KDTree(self.transform(features, cities), leaf_size=LEAF_SIZE)
+
+    def transform(self, features, cities):
+        """Scaled, weighted points: missing rooms count as the partition median"""
+        scaled = (features - self.center) / self.scale
+        scaled = np.where(np.isnan(scaled), 0.0, scaled) * np.array([WEIGHTS[name] for name in NUMERIC])
+        one_hot = (np.asarray(cities)[:, None] == np.array(self.cities, dtype=object)[None, :]).astype('float64')
+        return np.hstack([scaled, one_hot * WEIGHTS['city']])
+
+    def query(self, df, k):
+        features, cities = raw_features(df, self.levels)
+        k = min(k, len(self.ids))
+        return self.tree.query(self.transform(features, cities), k=k)
+
+
+def partition_digest(df, levels):
+    """Content hash of a partition's input rows and price levels, to skip rebuilding unchanged trees"""
+    ordered = df.sort_values('listing_id')[INPUT_COLUMNS]
+    digest = hashlib.blake2b(pd.util.hash_pandas_object(ordered, index=False).to_numpy().tobytes(), digest_size=16)
+    digest.update(json.dumps(levels, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CompsIndex:
+    """
+    Comparable-listings index over the canonical listings table.
+    - One KDTree per (operation, property_type), on robust-scaled, weighted area, rooms,
+      price per m², the place's price level (median of its neighbourhood within the partition)
+      and a city one-hot
+    - Each tree is a joblib file loaded with mmap_mode='r'; build() only rebuilds the
+      partitions whose input rows changed since the last build (manifest.json digests)
+    - query() takes a batch of listings and answers each partition's queries with one tree call
+    """
+    def __init__(self, path=COMPS_PATH):
+        self.path = path
+        self.manifest_path = os.path.join(path, MANIFEST_NAME)
+        self.manifest = {'partitions': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        self.partitions = {}
+
+    def partition_path(self, name):
+        return os.path.join(self.path, f"{name}.joblib")
+
+    def build(self, listings):
+        """(Re)build the trees of changed partitions from canonical rows; returns {'built': [...], 'kept': [...]}"""
+        os.makedirs(self.path, exist_ok=True)
+        df = listings[listings['area_m2'].notna() & (listings['area_m2'] > 0)].reindex(columns=INPUT_COLUMNS)
+        summary = {'built': [], 'kept': []}
+        partitions = {}
+        for (operation, property_type), part in df.groupby(['operation', 'property_type']):
+            name = partition_name(operation, property_type)
+            # Levels are per partition: rent and sale prices per m² must not share a median
+            levels = location_levels(part)
+            digest = partition_digest(part, levels)
+            previous = self.manifest['partitions'].get(name)
+            partitions[name] = {'operation': operation, 'property_type': property_type,
+                                'rows': len(part), 'digest': digest}
+            if previous and previous['digest'] == digest and os.path.exists(self.partition_path(name)):
+                partitions[name]['built_at'] = previous['built_at']
+                summary['kept'].append(name)
+                continue
+            partition = CompsPartition(part.reset_index(drop=True), levels)
+            joblib.dump(partition, self.partition_path(name) + ".tmp")
+            os.replace(self.partition_path(name) + ".tmp", self.partition_path(name))
+            partitions[name]['built_at'] = datetime.now().isoformat()
+            summary['built'].append(name)
+        for name in set(self.manifest['partitions']) - set(partitions):
+            if os.path.exists(self.partition_path(name)):
+                os.remove(self.partition_path(name))
+        self.manifest = {'partitions': partitions, 'updated_at': datetime.now().isoformat()}
+        with open(self.manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        self.partitions = {}
+        return summary
+
+    def partition(self, operation, property_type):
+        name = partition_name(operation, property_type)
+        if name not in self.partitions:
+            if name not in self.manifest['partitions']:
+                self.partitions[name] = None
+            else:
+                self.partitions[name] = joblib.load(self.partition_path(name), mmap_mode='r')
+        return self.partitions[name]
+
+    def query(self, listings, k=10, exclude_self=True):
+        """Top-k comps of each listing (dicts or a DataFrame with operation, property_type, city,
+        location, area_m2, bedrooms, bathrooms and optionally price_eur / listing_id)
+
+        Returns one DataFrame: query (row position of the input), rank, distance,
+        and the comp's listing_id, price, area, rooms, location and url.
+        """
+        df = listings if isinstance(listings, pd.DataFrame) else pd.DataFrame.from_records(list(listings))
+        df = df.reindex(columns=INPUT_COLUMNS).reset_index(drop=True)
+        frames = []
+        for (operation, property_type), group in df.groupby(['operation', 'property_type'], dropna=False):
+            partition = self.partition(operation, property_type)
+            if partition is None:
+                continue
+            distances, positions = partition.query(group, k + 1 if exclude_self else k)
+            keep = np.ones(positions.shape, dtype=bool)
+            if exclude_self:
+                query_ids = pd.to_numeric(group['listing_id'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                keep = partition.ids[positions] != query_ids[:, None]
+                # Rows that did not meet themselves drop their farthest neighbour instead
+                keep &= np.cumsum(keep, axis=1) <= k
+            rows, cols = np.nonzero(keep)
+            picked = positions[rows, cols]
+            frames.append(pd.DataFrame({
+                'query': group.index.to_numpy()[rows],
+                'rank': np.cumsum(keep, axis=1)[rows, cols],
+                'distance': np.round(distances[rows, cols], 4),
+                'listing_id': partition.ids[picked],
+                **{name: values[picked] for name, values in partition.attributes.items()},
+                **{name: values[picked] for name, values in partition.labels.items()},
+            }))
+        if not frames:
+            return pd.DataFrame(columns=['query', 'rank', 'distance', 'listing_id'])
+        result = pd.concat(frames, ignore_index=True)
+        result['price_per_m2'] = np.round(result['price_eur'] / result['area_m2'], 2)
+        return result.sort_values(['query', 'rank']).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the comparable-listings index")
+    parser.add_argument("--canonical", default=CANONICAL_PATH, help="canonical listings table directory")
+    parser.add_argument("--path", default=COMPS_PATH, help="comps index directory")
+    parser.add_argument("--listing", type=int, nargs="+", help="show the comps of these listing ids")
+    parser.add_argument("-k", type=int, default=5, help="comps per listing")
+    args = parser.parse_args()
+
+    listings = CanonicalTable(args.canonical).read()
+    index = CompsIndex(args.path)
+    start = time.perf_counter()
+    summary = index.build(listings)
+    print(f"Comps index: rebuilt {summary['built'] or 'nothing'}, kept {len(summary['kept'])} partitions "
+          f"({time.perf_counter() - start:.2f}s)")
+    if args.listing:
+        queries = listings[listings['listing_id'].isin(args.listing)]
+        start = time.perf_counter()
+        comps = index.query(queries, k=args.k)
+        print(f"{len(queries)} queries in {(time.perf_counter() - start) * 1000:.1f} ms")
+        print(comps.drop(columns=['url']).to_string(index=False))
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import re
+import shutil
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import scipy.sparse as sp
+from sklearn.feature_extraction import FeatureHasher
+
+FEATURES_PATH = "data/features/idealista"
+
+# Bump when the encoding changes: every cached matrix is rebuilt
+FEATURE_VERSION = 1
+
+NUMERIC_FEATURES = ['area_m2', 'bedrooms', 'bathrooms', 'completion_year']
+# One-hot categories, hashed together with the location tokens into HASH_DIM columns
+CATEGORICAL_FEATURES = ['operation', 'property_type', 'city', 'property_type_detail', 'energy_certificate', 'status']
+HASH_DIM = 2 ** 12
+
+# Columns the features need from the canonical table (the target comes from price_eur / area_m2)
+INPUT_COLUMNS = ['listing_id', 'price_eur'] + NUMERIC_FEATURES + CATEGORICAL_FEATURES + ['location']
+
+LOCATION_STOPWORDS = {'de', 'da', 'do', 'das', 'dos', 'e', 'em', 'na', 'no', 'the', 'of'}
+
+HASHER = FeatureHasher(n_features=HASH_DIM, input_type='string', alternate_sign=False)
+
+
+def fold(text):
+    """Lowercase ASCII form: 'São Domingos de Benfica' -> 'sao domingos de benfica'"""
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower().strip()
+
+
+def location_tokens(location):
+    """'Avenidas Novas, Lisboa' -> each comma part (neighbourhood, parish, city) plus its words"""
+    if not isinstance(location, str) or not location:
+        return []
+    tokens = []
+    for part in (fold(part) for part in location.split(',')):
+        if not part:
+            continue
+        tokens.append(f"loc={part}")
+        tokens.extend(f"loc_word={word}" for word in re.findall(r'[a-z0-9]+', part)
+                      if len(word) > 1 and word not in LOCATION_STOPWORDS)
+    return tokens
+
+
+def row_tokens(df):
+    """Hashed-feature tokens per row: 'field=value' one-hots and location tokens"""
+    columns = [df[column].astype(object).where(df[column].notna(), None).tolist() for column in CATEGORICAL_FEATURES]
+    locations = df['location'].tolist()
+    return [
+        [f"{name}={fold(str(value))}" for name, value in zip(CATEGORICAL_FEATURES, values) if value not in (None, '')]
+        + location_tokens(location)
+        for values, location in zip(zip(*columns), locations)
+    ]
+
+
+def numeric_block(df):
+    """Numeric columns as CSR; missing values are left out (xgboost: missing), zeros are kept"""
+    values = np.column_stack([pd.to_numeric(df[column], errors='coerce').astype('float64').to_numpy(na_value=np.nan)
+                              for column in NUMERIC_FEATURES]).astype(np.float32)
+    rows, cols = np.nonzero(~np.isnan(values))
+    return sp.csr_matrix((values[rows, cols], (rows, cols)), shape=values.shape)
+
+
+def featurize(df):
+    """CSR feature matrix (numeric columns first, then HASH_DIM hashed one-hot columns) of listing rows"""
+    if df.empty:
+        return sp.csr_matrix((0, len(NUMERIC_FEATURES) + HASH_DIM), dtype=np.float32)
+    hashed = HASHER.transform(row_tokens(df)).astype(np.float32)
+    return sp.hstack([numeric_block(df), hashed], format='csr', dtype=np.float32)
+
+
+def target(df):
+    """log price per m² - the label only, never a feature"""
+    price = pd.to_numeric(df['price_eur'], errors='coerce').astype('float64').to_numpy(na_value=np.nan)
+    area = pd.to_numeric(df['area_m2'], errors='coerce').astype('float64').to_numpy(na_value=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log(price / area)
+
+
+def feature_names():
+    return NUMERIC_FEATURES + [f"hash_{i}" for i in range(HASH_DIM)]
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Feature matrices of the canonical table's bucket parts, cached on disk.
+    - Each part is featurized once per content: the cache key is the hash of the Parquet
+      file plus FEATURE_VERSION/HASH_DIM, so after a run only the buckets it touched are redone
+    - Entries are plain .npy arrays (CSR data/indices/indptr, target, listing ids) loaded
+      with mmap_mode='r'; entries no longer matching any part are removed
+    - Only rows with a usable label (price and area) are kept
+    """
+    def __init__(self, path=FEATURES_PATH):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.stats = {'cached': 0, 'featurized': 0, 'rows': 0}
+
+    def key(self, part_path):
+        return f"v{FEATURE_VERSION}-h{HASH_DIM}-{file_digest(part_path)}"
+
+    def save(self, entry_dir, X, y, ids):
+        tmp_dir = entry_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, values in (('data', X.data), ('indices', X.indices), ('indptr', X.indptr), ('y', y), ('ids', ids)):
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+        os.replace(tmp_dir, entry_dir)
+
+    def load(self, entry_dir):
+        arrays = {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r')
+                  for name in ('data', 'indices', 'indptr', 'y', 'ids')}
+        X = sp.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                          shape=(len(arrays['indptr']) - 1, len(NUMERIC_FEATURES) + HASH_DIM))
+        return X, arrays['y'], arrays['ids']
+
+    def part(self, part_path):
+        """(X, y, ids) of one bucket part, from the cache or featurized now"""
+        entry_dir = os.path.join(self.path, self.key(part_path))
+        if os.path.isdir(entry_dir):
+            self.stats['cached'] += 1
+            return entry_dir, self.load(entry_dir)
+        df = pq.read_table(part_path, columns=INPUT_COLUMNS).to_pandas()
+        y = target(df)
+        labelled = np.isfinite(y)
+        df = df[labelled]
+        X, y, ids = featurize(df), y[labelled], df['listing_id'].to_numpy(dtype=np.int64)
+        self.save(entry_dir, X, y, ids)
+        self.stats['featurized'] += 1
+        return entry_dir, (X, y, ids)
+
+    def matrix(self, listings_dir):
+        """(X, y, ids) over every part in listings_dir (the canonical table's listings/)"""
+        parts = sorted(os.path.join(listings_dir, name) for name in os.listdir(listings_dir)
+                       if name.endswith(".parquet"))
+        blocks, used = [], set()
+        for part_path in parts:
+            entry_dir, block = self.part(part_path)
+            used.add(os.path.basename(entry_dir))
+            blocks.append(block)
+        for name in os.listdir(self.path):
+            if name not in used:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        if not blocks:
+            return featurize(pd.DataFrame()), np.zeros(0), np.zeros(0, dtype=np.int64)
+        X = sp.vstack([block[0] for block in blocks], format='csr')
+        y = np.concatenate([block[1] for block in blocks])
+        ids = np.concatenate([block[2] for block in blocks])
+        self.stats['rows'] = len(y)
+        return X, y, ids
@@ -0,0 +1,73 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from src.models.idealista.features import (
+    CATEGORICAL_FEATURES, FEATURE_VERSION, HASH_DIM, NUMERIC_FEATURES, featurize,
+)
+
+MODELS_PATH = "data/models/idealista"
+LATEST_NAME = "LATEST"
+MODEL_NAME = "model.json"
+META_NAME = "meta.json"
+
+
+def latest_model_dir(root=MODELS_PATH):
+    """Directory named by root/LATEST, the last model training published"""
+    with open(os.path.join(root, LATEST_NAME), 'r', encoding='utf-8') as f:
+        return os.path.join(root, f.read().strip())
+
+
+def publish(model_dir, root=MODELS_PATH):
+    """Point LATEST at model_dir (replaced atomically, so readers see the old or the new name)"""
+    tmp_path = os.path.join(root, LATEST_NAME + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(os.path.basename(os.path.normpath(model_dir)))
+    os.replace(tmp_path, os.path.join(root, LATEST_NAME))
+
+
+def input_frame(records):
+    """Listing inputs (dicts or a DataFrame) with every feature column, missing ones as None"""
+    df = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(list(records))
+    return df.reindex(columns=NUMERIC_FEATURES + CATEGORICAL_FEATURES + ['location'])
+
+
+class AvmModel:
+    """
+    A trained valuation model: XGBoost booster plus the meta it was trained with.
+    - predicts price per m² (the booster works on its log) and price = price per m² x area
+    - refuses boosters trained on another feature encoding
+    """
+    def __init__(self, booster, meta, path=None):
+        if meta['feature_version'] != FEATURE_VERSION or meta['hash_dim'] != HASH_DIM:
+            raise ValueError(f"{path}: model built for feature version {meta['feature_version']}/"
+                             f"{meta['hash_dim']}, code is at {FEATURE_VERSION}/{HASH_DIM}")
+        self.booster = booster
+        self.meta = meta
+        self.path = path
+        self.iteration_range = (0, meta['best_iteration'] + 1)
+
+    @classmethod
+    def load(cls, path=None, nthread=None):
+        """Model in path (a model directory), or the LATEST one under MODELS_PATH"""
+        path = path or latest_model_dir()
+        with open(os.path.join(path, META_NAME), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        booster = xgb.Booster(params={'nthread': nthread or os.cpu_count()})
+        booster.load_model(os.path.join(path, MODEL_NAME))
+        return cls(booster, meta, path)
+
+    def predict_matrix(self, X):
+        """Price per m² of featurized rows"""
+        log_ppm2 = self.booster.predict(xgb.DMatrix(X), iteration_range=self.iteration_range)
+        return np.exp(log_ppm2.astype(np.float64))
+
+    def predict(self, records):
+        """DataFrame of price_per_m2 and price (NaN without an area) per input listing"""
+        df = input_frame(records)
+        ppm2 = self.predict_matrix(featurize(df))
+        area = pd.to_numeric(df['area_m2'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        return pd.DataFrame({'price_per_m2': np.round(ppm2, 2), 'price': np.round(ppm2 * area, -2)}, index=df.index)
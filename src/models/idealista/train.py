@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import xgboost as xgb
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from src.models.idealista.features import FEATURE_VERSION, FEATURES_PATH, HASH_DIM, FeatureCache
+from src.models.idealista.model import META_NAME, MODEL_NAME, MODELS_PATH, publish
+from src.pipelines.idealista.canonical import CANONICAL_PATH, CanonicalTable
+from src.pipelines.idealista.silver import BRONZE_GLOB
+
+XGB_PARAMS = {
+    'objective': 'reg:squarederror',
+    'eval_metric': 'mae',
+    'tree_method': 'hist',
+    'max_depth': 8,
+    'eta': 0.05,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'min_child_weight': 2,
+}
+
+MIN_TRAIN_ROWS = 10
+
+
+def split(n, valid_fraction, seed):
+    """Shuffled (train, valid) row indices; at least one row on each side"""
+    order = np.random.default_rng(seed).permutation(n)
+    n_valid = min(max(1, int(round(n * valid_fraction))), n - 1)
+    return np.sort(order[n_valid:]), np.sort(order[:n_valid])
+
+
+def evaluate(y_true, y_pred):
+    """Errors of log price per m² predictions, reported on the price per m² scale"""
+    actual, predicted = np.exp(y_true), np.exp(y_pred)
+    return {
+        'rows': int(len(y_true)),
+        'mae_per_m2': round(float(np.mean(np.abs(predicted - actual))), 2),
+        'mape': round(float(np.mean(np.abs(predicted - actual) / actual) * 100), 2),
+        'median_ape': round(float(np.median(np.abs(predicted - actual) / actual) * 100), 2),
+        'rmse_log': round(float(np.sqrt(np.mean((y_pred - y_true) ** 2))), 4),
+    }
+
+
+def train(X, y, nthread=None, valid_fraction=0.2, num_boost_round=2000, early_stopping_rounds=50,
+          seed=42, params=None):
+    """XGBoost on log price per m² with early stopping on a held-out split; returns (booster, metrics)"""
+    if len(y) < MIN_TRAIN_ROWS:
+        raise ValueError(f"Only {len(y)} labelled listings, need at least {MIN_TRAIN_ROWS} to train")
+    train_rows, valid_rows = split(len(y), valid_fraction, seed)
+    nthread = nthread or os.cpu_count()
+    dtrain = xgb.DMatrix(X[train_rows], label=y[train_rows], nthread=nthread)
+    dvalid = xgb.DMatrix(X[valid_rows], label=y[valid_rows], nthread=nthread)
+    booster = xgb.train(
+        dict(XGB_PARAMS, **(params or {}), nthread=nthread, seed=seed), dtrain,
+        num_boost_round=num_boost_round, evals=[(dtrain, 'train'), (dvalid, 'valid')],
+        early_stopping_rounds=early_stopping_rounds, verbose_eval=100,
+    )
+    iterations = (0, booster.best_iteration + 1)
+    metrics = {
+        'best_iteration': int(booster.best_iteration),
+        'train': evaluate(y[train_rows], booster.predict(dtrain, iteration_range=iterations)),
+        'valid': evaluate(y[valid_rows], booster.predict(dvalid, iteration_range=iterations)),
+    }
+    return booster, metrics
+
+
+def save_model(booster, meta, root=MODELS_PATH):
+    """Write model + meta to a new directory under root and publish it as LATEST"""
+    model_dir = os.path.join(root, f"avm_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}")
+    os.makedirs(model_dir, exist_ok=True)
+    booster.save_model(os.path.join(model_dir, MODEL_NAME))
+    with open(os.path.join(model_dir, META_NAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    publish(model_dir, root)
+    return model_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the AVM (XGBoost on log price per m²) on the canonical listings")
+    parser.add_argument("--bronze", default=BRONZE_GLOB, help="glob of bronze run outputs (csv, jsonl or parquet)")
+    parser.add_argument("--canonical", default=CANONICAL_PATH, help="canonical listings table directory")
+    parser.add_argument("--features", default=FEATURES_PATH, help="feature matrix cache directory")
+    parser.add_argument("--models", default=MODELS_PATH, help="model output directory")
+    parser.add_argument("--threads", type=int, help="XGBoost threads (default: CPU count)")
+    parser.add_argument("--rounds", type=int, default=2000, help="maximum boosting rounds")
+    parser.add_argument("--early-stopping", type=int, default=50, help="rounds without validation gain before stopping")
+    parser.add_argument("--valid-fraction", type=float, default=0.2, help="share of listings held out for validation")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-update", action="store_true", help="train on the canonical table as it is")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    table = CanonicalTable(args.canonical)
+    if not args.skip_update:
+        summary = table.update(args.bronze)
+        print(f"Canonical: {summary['runs']} new runs -> {summary['listings']} listings")
+
+    cache = FeatureCache(args.features)
+    X, y, _ = cache.matrix(table.listings_dir)
+    featurized = time.perf_counter()
+    print(f"Features: {X.shape[0]} x {X.shape[1]} ({X.nnz} non-zero), {cache.stats['featurized']} parts featurized, "
+          f"{cache.stats['cached']} from cache ({featurized - start:.2f}s)")
+
+    booster, metrics = train(X, y, args.threads, args.valid_fraction, args.rounds, args.early_stopping, args.seed)
+    meta = {
+        'trained_at': datetime.now().isoformat(),
+        'feature_version': FEATURE_VERSION,
+        'hash_dim': HASH_DIM,
+        'best_iteration': metrics['best_iteration'],
+        'rows': int(len(y)),
+        'metrics': metrics,
+        'params': dict(XGB_PARAMS, rounds=args.rounds, early_stopping=args.early_stopping, seed=args.seed),
+        'train_seconds': round(time.perf_counter() - featurized, 2),
+    }
+    model_dir = save_model(booster, meta, args.models)
+    print(f"Validation: {metrics['valid']} (best iteration {metrics['best_iteration']})")
+    print(f"Model: {model_dir} ({time.perf_counter() - start:.2f}s total)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from src.pipelines.idealista.silver import BRONZE_GLOB, SILVER_SCHEMA, normalize, run_id_from_path
+from src.scrapers.idealista.listing_parser import RECORD_COLUMNS
+from src.scrapers.idealista.output_sink import find_outputs, iter_output
+
+CANONICAL_PATH = "data/silver/idealista_listings"
+STATE_NAME = "state.json"
+BUCKETS = 64
+CHUNK_ROWS = 100_000
+
+# Observations as staged per bucket: the silver columns without the run_date partition
+STAGE_SCHEMA = pa.schema([field for field in SILVER_SCHEMA if field.name != 'run_date'])
+
+# Attribute columns resolved by recency: the newest non-null value wins
+VALUE_COLUMNS = [name for name in STAGE_SCHEMA.names if name not in ('listing_id', 'run_id', 'scraped_at')]
+
+CANONICAL_SCHEMA = pa.schema(
+    [STAGE_SCHEMA.field('listing_id')]
+    + [STAGE_SCHEMA.field(name) for name in VALUE_COLUMNS]
+    + [
+        ('first_seen', pa.timestamp('us')),
+        ('last_seen', pa.timestamp('us')),
+        ('first_run', pa.string()),
+        ('last_run', pa.string()),
+        ('observations', pa.int32()),
+    ]
+)
+
+PANDAS_TYPES = {
+    pa.int64(): pd.Int64Dtype(), pa.int32(): pd.Int32Dtype(), pa.int16(): pd.Int16Dtype(),
+    pa.float64(): pd.Float64Dtype(), pa.bool_(): pd.BooleanDtype(),
+}
+
+
+def bucket_of(listing_ids, buckets=BUCKETS):
+    """Bucket number per listing id (Knuth multiplicative hash, so id ranges spread evenly)"""
+    ids = np.asarray(listing_ids, dtype=np.uint64)
+    return ((ids * np.uint64(2654435761)) % np.uint64(2 ** 32) % np.uint64(buckets)).astype(np.int32)
+
+
+def iter_run_chunks(path, chunk_rows=CHUNK_ROWS):
+    """One bronze run output as typed silver chunks of at most chunk_rows rows"""
+    run_id = run_id_from_path(path)
+    for chunk in iter_output(path, chunk_rows):
+        if chunk.empty:
+            continue
+        chunk = chunk.reindex(columns=RECORD_COLUMNS, fill_value='')
+        chunk['run_id'] = run_id
+        yield normalize(chunk)
+
+
+def read_table(path, schema):
+    return pq.read_table(path, schema=schema).to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+def write_table(df, path, schema, metadata=None):
+    table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    if metadata:
+        table = table.replace_schema_metadata({key: json.dumps(value) for key, value in metadata.items()})
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return table.num_rows
+
+
+def resolve(observations):
+    """One row per listing_id: newest non-null value per column, first/last seen, observation count
+
+    observations hold staged rows (observations=1) and current canonical rows
+    (scraped_at = their last_seen, observations = how many they stand for).
+    """
+    df = observations.sort_values(['scraped_at', 'run_id'], kind='stable')
+    groups = df.groupby('listing_id', sort=True)
+    # GroupBy.last() skips nulls, so a field missing from the newest page keeps its last known value
+    merged = groups[VALUE_COLUMNS].last()
+    merged['first_seen'] = groups['first_seen'].min()
+    merged['first_run'] = df.loc[groups['first_seen'].idxmin(), ['listing_id', 'first_run']].set_index('listing_id')
+    merged['last_seen'] = groups['scraped_at'].max()
+    merged['last_run'] = df.loc[groups['scraped_at'].idxmax(), ['listing_id', 'run_id']].set_index('listing_id')
+    merged['observations'] = groups['observations'].sum().astype('Int32')
+    # Price and area may come from different observations now
+    merged['price_per_m2'] = (merged['price_eur'] / merged['area_m2']).round(2)
+    return merged.reset_index()
+
+
+class CanonicalTable:
+    """
+    One row per listing across every bronze run.
+    - New runs are read in chunks and their rows hash-partitioned by listing_id into
+      staging/bucket-NNN/, so a merge only ever holds one bucket in memory
+    - Each touched bucket is merged with its canonical part (listings/bucket-NNN.parquet):
+      the newest non-null value wins, first/last seen and observation counts are kept
+    - state.json lists the runs already merged; re-running only picks up new runs, and a
+      bucket part records its runs too, so a merge interrupted halfway is not double counted
+    """
+    def __init__(self, path=CANONICAL_PATH, buckets=BUCKETS):
+        self.path = path
+        self.listings_dir = os.path.join(path, "listings")
+        self.staging_dir = os.path.join(path, "staging")
+        self.state_path = os.path.join(path, STATE_NAME)
+        os.makedirs(self.listings_dir, exist_ok=True)
+        self.state = self.load_state()
+        if self.state['buckets'] != buckets and self.state['runs']:
+            raise ValueError(f"{path} was built with {self.state['buckets']} buckets, not {buckets}")
+        self.state['buckets'] = buckets
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return {'buckets': BUCKETS, 'runs': []}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_state(self):
+        self.state['updated_at'] = datetime.now().isoformat()
+        with open(self.state_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def bucket_path(self, bucket):
+        return os.path.join(self.listings_dir, f"bucket-{bucket:03d}.parquet")
+
+    def stage_run(self, path, chunk_rows=CHUNK_ROWS):
+        """Split one bronze CSV into per-bucket staging files; returns (rows, buckets touched)"""
+        run_id = run_id_from_path(path)
+        rows, touched = 0, set()
+        for seq, chunk in enumerate(iter_run_chunks(path, chunk_rows)):
+            rows += len(chunk)
+            for bucket, part in chunk.groupby(bucket_of(chunk['listing_id'], self.state['buckets'])):
+                bucket_dir = os.path.join(self.staging_dir, f"bucket-{bucket:03d}")
+                os.makedirs(bucket_dir, exist_ok=True)
+                write_table(part, os.path.join(bucket_dir, f"{run_id}_{seq:05d}.parquet"), STAGE_SCHEMA)
+                touched.add(int(bucket))
+        return rows, touched
+
+    def merge_bucket(self, bucket):
+        """Fold a bucket's staged observations into its canonical part; returns its row count"""
+        bucket_dir = os.path.join(self.staging_dir, f"bucket-{bucket:03d}")
+        part_path = self.bucket_path(bucket)
+        frames, merged_runs = [], []
+        if os.path.exists(part_path):
+            metadata = pq.read_schema(part_path).metadata or {}
+            merged_runs = json.loads(metadata.get(b'runs', b'[]'))
+            current = read_table(part_path, CANONICAL_SCHEMA)
+            frames.append(current.rename(columns={'last_seen': 'scraped_at', 'last_run': 'run_id'}))
+        runs = set(merged_runs)
+        for name in sorted(os.listdir(bucket_dir)) if os.path.isdir(bucket_dir) else []:
+            run_id = name.rsplit('_', 1)[0]
+            if run_id in merged_runs:
+                continue
+            staged = read_table(os.path.join(bucket_dir, name), STAGE_SCHEMA)
+            staged['first_seen'] = staged['scraped_at']
+            staged['first_run'] = staged['run_id']
+            staged['observations'] = 1
+            frames.append(staged)
+            runs.add(run_id)
+        if not frames:
+            return 0
+        rows = write_table(resolve(pd.concat(frames, ignore_index=True)), part_path, CANONICAL_SCHEMA,
+                           metadata={'runs': sorted(runs)})
+        shutil.rmtree(bucket_dir, ignore_errors=True)
+        return rows
+
+    def update(self, pattern=BRONZE_GLOB, run_ids=None, chunk_rows=CHUNK_ROWS):
+        """Stage and merge every bronze run not merged yet; returns a summary"""
+        done = set(self.state['runs'])
+        paths = [path for path in find_outputs(pattern)
+                 if run_id_from_path(path) and run_id_from_path(path) not in done
+                 and (run_ids is None or run_id_from_path(path) in run_ids)]
+        rows, touched = 0, set()
+        # Buckets left staged by an interrupted update are merged along with the new ones
+        if os.path.isdir(self.staging_dir):
+            touched.update(int(name[len("bucket-"):]) for name in os.listdir(self.staging_dir))
+        for path in paths:
+            run_rows, run_touched = self.stage_run(path, chunk_rows)
+            rows += run_rows
+            touched |= run_touched
+        for bucket in sorted(touched):
+            self.merge_bucket(bucket)
+        self.state['runs'] = sorted(done | {run_id_from_path(path) for path in paths})
+        self.save_state()
+        return {'runs': len(paths), 'rows': rows, 'buckets': len(touched), 'listings': self.count()}
+
+    def count(self):
+        return sum(pq.read_metadata(os.path.join(self.listings_dir, name)).num_rows
+                   for name in os.listdir(self.listings_dir) if name.endswith(".parquet"))
+
+    def read(self, columns=None, filters=None):
+        """The canonical table (only the requested columns / matching row groups are read)"""
+        if not self.count():
+            return pd.DataFrame(columns=columns or CANONICAL_SCHEMA.names)
+        return pd.read_parquet(self.listings_dir, engine='pyarrow', columns=columns, filters=filters)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge all bronze runs into one row per listing")
+    parser.add_argument("--bronze", default=BRONZE_GLOB, help="glob of bronze run outputs (csv, jsonl or parquet)")
+    parser.add_argument("--out", default=CANONICAL_PATH, help="canonical table directory")
+    parser.add_argument("--buckets", type=int, default=BUCKETS, help="hash buckets (fixed once built)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="bronze rows read at a time")
+    parser.add_argument("--rebuild", action="store_true", help="drop the table and merge every run again")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        shutil.rmtree(args.out, ignore_errors=True)
+    start = time.perf_counter()
+    summary = CanonicalTable(args.out, args.buckets).update(args.bronze, chunk_rows=args.chunk_rows)
+    print(f"Canonical: {summary['runs']} new runs, {summary['rows']} rows over {summary['buckets']} buckets "
+          f"-> {summary['listings']} listings in {args.out} ({time.perf_counter() - start:.2f}s)")
@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from src.pipelines.idealista.silver import BRONZE_GLOB, normalize, read_bronze, run_id_from_path
+from src.scrapers.idealista.output_sink import find_outputs
+
+HISTORY_PATH = "data/silver/idealista_price_history"
+
+# One segment per run: the raw observations, never rewritten
+SEGMENT_SCHEMA = pa.schema([
+    ('listing_id', pa.int32()),
+    ('observed_at', pa.timestamp('s')),
+    ('price', pa.int64()),
+    ('area', pa.float32()),
+    ('status', pa.string()),
+])
+NO_PRICE = -1
+INT32_MAX = np.iinfo(np.int32).max
+
+# Compacted spans: one row per stretch of runs where price, area and status stayed the same
+SPAN_COLUMNS = ('listing_id', 'first_at', 'last_at', 'price', 'area', 'status', 'observations')
+SPANS_META = "spans.json"
+
+DAY = 86400
+
+
+def observations_from_silver(df):
+    """Segment table from typed silver rows (one per listing and run)"""
+    ids = df['listing_id'].astype('Int64')
+    if len(ids) and ids.max() > INT32_MAX:
+        raise ValueError(f"listing_id {ids.max()} does not fit the int32 id column")
+    return pa.table({
+        'listing_id': pa.array(ids.to_numpy(dtype=np.int32), type=pa.int32()),
+        'observed_at': pa.array(df['scraped_at'].dt.floor('s').to_numpy(dtype='datetime64[s]'), type=pa.timestamp('s')),
+        'price': pa.array(df['price_eur'].fillna(NO_PRICE).to_numpy(dtype=np.int64), type=pa.int64()),
+        'area': pa.array(df['area_m2'].astype('float32').to_numpy(na_value=np.nan), type=pa.float32()),
+        'status': pa.array(df['status'].astype(object).where(df['status'].notna(), None), type=pa.string()),
+    }, schema=SEGMENT_SCHEMA)
+
+
+def group_starts(keys):
+    """Start index of every run of equal values in a sorted array"""
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+
+
+def build_spans(ids, observed, price, area, status):
+    """Collapse observations into spans; inputs are numpy columns in any order"""
+    if not len(ids):
+        return {'listing_id': ids, 'first_at': observed, 'last_at': observed, 'price': price,
+                'area': area, 'status': status, 'observations': np.zeros(0, dtype=np.int32)}
+    order = np.lexsort((observed, ids))
+    ids, observed, price, area, status = (column[order] for column in (ids, observed, price, area, status))
+    same_area = (area[1:] == area[:-1]) | (np.isnan(area[1:]) & np.isnan(area[:-1]))
+    changed = np.r_[True, (ids[1:] != ids[:-1]) | (price[1:] != price[:-1])
+                    | ~same_area | (status[1:] != status[:-1])]
+    starts = np.flatnonzero(changed)
+    return {
+        'listing_id': ids[starts],
+        'first_at': observed[starts],
+        'last_at': np.maximum.reduceat(observed, starts),
+        'price': price[starts],
+        'area': area[starts],
+        'status': status[starts],
+        'observations': np.diff(np.r_[starts, len(ids)]).astype(np.int32),
+    }
+
+
+class PriceHistory:
+    """
+    Append-only price history of every listing across runs.
+    - append() writes one Parquet segment of (listing_id, observed_at, price, area, status)
+      per run; runs already in the store are skipped, so appending is incremental
+    - The segments are compacted into spans (a listing's price/area/status unchanged from
+      first_at to last_at), stored as .npy columns: int32 ids, int64 epoch seconds and prices,
+      float32 areas, int8 status codes, memory-mapped on load
+    - latest(), price_drops(), time_on_market() and signals() are vectorized over the spans
+    """
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        self.segments_dir = os.path.join(path, "segments")
+        self.spans_dir = os.path.join(path, "spans")
+        os.makedirs(self.segments_dir, exist_ok=True)
+        self.loaded = None
+
+    def segment_path(self, run_id):
+        return os.path.join(self.segments_dir, f"run_{run_id}.parquet")
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.segments_dir) if name.endswith(".parquet"))
+
+    def runs(self):
+        return {name[len("run_"):-len(".parquet")] for name in self.segments()}
+
+    def append(self, df, run_id):
+        """Add one run's typed silver rows; returns the rows written (0 if the run is already stored)"""
+        path = self.segment_path(run_id)
+        if os.path.exists(path):
+            return 0
+        table = observations_from_silver(df)
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.loaded = None
+        return table.num_rows
+
+    def append_bronze(self, pattern=BRONZE_GLOB, run_ids=None):
+        """Append every bronze run not in the store yet; returns {run_id: rows}"""
+        stored = self.runs()
+        added = {}
+        for run_id in sorted({run_id_from_path(p) for p in find_outputs(pattern)} - stored - {''}):
+            if run_ids is not None and run_id not in run_ids:
+                continue
+            bronze = read_bronze(pattern, {run_id})
+            added[run_id] = self.append(normalize(bronze), run_id) if not bronze.empty else 0
+            if bronze.empty:
+                # Keep an empty segment so the run is not re-read next time
+                pq.write_table(SEGMENT_SCHEMA.empty_table(), self.segment_path(run_id))
+        return added
+
+    def compact(self):
+        """Rebuild the span columns from every segment"""
+        segments = self.segments()
+        table = pa.concat_tables(
+            [pq.read_table(os.path.join(self.segments_dir, name), schema=SEGMENT_SCHEMA) for name in segments]
+        ) if segments else SEGMENT_SCHEMA.empty_table()
+        codes, status_values = pd.factorize(table['status'].to_pandas(), use_na_sentinel=True)
+        spans = build_spans(
+            table['listing_id'].to_numpy(),
+            table['observed_at'].cast(pa.int64()).to_numpy(),
+            table['price'].to_numpy(),
+            table['area'].to_numpy(zero_copy_only=False),
+            codes.astype(np.int8),
+        )
+        os.makedirs(self.spans_dir, exist_ok=True)
+        for name, values in spans.items():
+            tmp_path = os.path.join(self.spans_dir, f"{name}.tmp.npy")
+            np.save(tmp_path, values)
+            os.replace(tmp_path, os.path.join(self.spans_dir, f"{name}.npy"))
+        meta = {'segments': segments, 'status_values': [str(v) for v in status_values],
+                'observations': table.num_rows, 'spans': len(spans['listing_id']),
+                'built_at': datetime.now().isoformat()}
+        # Written last: the columns only count as current once the meta lists their segments
+        with open(os.path.join(self.spans_dir, SPANS_META + ".tmp"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(os.path.join(self.spans_dir, SPANS_META + ".tmp"), os.path.join(self.spans_dir, SPANS_META))
+        self.loaded = None
+        return meta
+
+    def spans(self):
+        """Span columns (memory-mapped) and their meta; compacts first when segments were added"""
+        if self.loaded is not None:
+            return self.loaded
+        meta_path = os.path.join(self.spans_dir, SPANS_META)
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        if meta is None or meta['segments'] != self.segments():
+            meta = self.compact()
+        columns = {name: np.load(os.path.join(self.spans_dir, f"{name}.npy"), mmap_mode='r') for name in SPAN_COLUMNS}
+        self.loaded = (columns, meta)
+        return self.loaded
+
+    def listing_groups(self):
+        """(span columns, index of each listing's first span, index of its last span)"""
+        columns, _ = self.spans()
+        starts = group_starts(columns['listing_id'])
+        ends = np.r_[starts[1:], len(columns['listing_id'])] - 1
+        return columns, starts, ends
+
+    def status_names(self, codes):
+        _, meta = self.spans()
+        values = np.array(meta['status_values'] + [None], dtype=object)
+        return values[np.where(codes < 0, len(values) - 1, codes)]
+
+    def latest(self, listing_ids=None):
+        """Last known price, area and status per listing"""
+        columns, _, ends = self.listing_groups()
+        frame = pd.DataFrame({
+            'listing_id': columns['listing_id'][ends],
+            'price': columns['price'][ends],
+            'area': columns['area'][ends],
+            'status': self.status_names(columns['status'][ends]),
+            'last_seen': pd.to_datetime(columns['last_at'][ends], unit='s'),
+        })
+        frame['price'] = frame['price'].where(frame['price'] != NO_PRICE).astype('Int64')
+        if listing_ids is not None:
+            frame = frame[frame['listing_id'].isin(listing_ids)]
+        return frame.reset_index(drop=True)
+
+    def price_drops(self, days=30, min_pct=0.0, now=None):
+        """Listings seen in the last `days` whose latest price is below their peak in that window
+
+        now defaults to the newest observation in the store.
+        """
+        columns, starts, ends = self.listing_groups()
+        if not len(starts):
+            return pd.DataFrame(columns=['listing_id', 'peak_price', 'price', 'drop', 'drop_pct', 'last_seen'])
+        last_at = columns['last_at']
+        now = int(pd.Timestamp(now).timestamp()) if now is not None else int(last_at.max())
+        window_start = now - days * DAY
+
+        price = columns['price']
+        in_window = (last_at >= window_start) & (price != NO_PRICE)
+        peak = np.maximum.reduceat(np.where(in_window, price, NO_PRICE), starts)
+        latest = price[ends]
+        dropped = (last_at[ends] >= window_start) & (latest != NO_PRICE) & (peak > latest)
+        drop = (peak - latest)[dropped]
+        frame = pd.DataFrame({
+            'listing_id': columns['listing_id'][ends][dropped],
+            'peak_price': peak[dropped],
+            'price': latest[dropped],
+            'drop': drop,
+            'drop_pct': np.round(drop / peak[dropped] * 100, 2),
+            'last_seen': pd.to_datetime(last_at[ends][dropped], unit='s'),
+        })
+        return frame[frame['drop_pct'] >= min_pct].sort_values('drop_pct', ascending=False).reset_index(drop=True)
+
+    def time_on_market(self):
+        """First/last sighting, days between them, runs seen and price changes per listing"""
+        columns, starts, ends = self.listing_groups()
+        first, last = columns['first_at'][starts], columns['last_at'][ends]
+        price = columns['price']
+        # Span boundaries where a known price moved (not just area/status, or the price went missing)
+        moved = np.r_[False, (price[1:] != price[:-1]) & (price[1:] != NO_PRICE) & (price[:-1] != NO_PRICE)]
+        moved[starts] = False
+        return pd.DataFrame({
+            'listing_id': columns['listing_id'][starts],
+            'first_seen': pd.to_datetime(first, unit='s'),
+            'last_seen': pd.to_datetime(last, unit='s'),
+            'days_on_market': np.round((last - first) / DAY, 2),
+            'observations': np.add.reduceat(columns['observations'], starts) if len(starts) else [],
+            'price_changes': np.add.reduceat(moved.astype(np.int32), starts) if len(starts) else [],
+        })
+
+    def signals(self, days=30, now=None):
+        """One row per listing with its latest price, time on market and recent drop, for the AVM"""
+        frame = self.latest().merge(self.time_on_market().drop(columns=['last_seen']), on='listing_id')
+        drops = self.price_drops(days, now=now)[['listing_id', 'peak_price', 'drop_pct']]
+        frame = frame.merge(drops, on='listing_id', how='left')
+        frame['drop_pct'] = frame['drop_pct'].fillna(0.0)
+        return frame
+
+    def history(self, listing_id):
+        """Spans of one listing, oldest first (binary search on the sorted id column)"""
+        columns, _ = self.spans()
+        ids = columns['listing_id']
+        low, high = np.searchsorted(ids, listing_id, 'left'), np.searchsorted(ids, listing_id, 'right')
+        frame = pd.DataFrame({name: np.asarray(columns[name][low:high]) for name in SPAN_COLUMNS})
+        frame['first_at'] = pd.to_datetime(frame['first_at'], unit='s')
+        frame['last_at'] = pd.to_datetime(frame['last_at'], unit='s')
+        frame['price'] = frame['price'].where(frame['price'] != NO_PRICE).astype('Int64')
+        frame['status'] = self.status_names(frame['status'].to_numpy())
+        return frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-listing price history across bronze runs")
+    parser.add_argument("--bronze", default=BRONZE_GLOB, help="glob of bronze run outputs (csv, jsonl or parquet)")
+    parser.add_argument("--path", default=HISTORY_PATH, help="price history store directory")
+    parser.add_argument("--drops", type=int, metavar="DAYS", help="list price drops within the last DAYS")
+    parser.add_argument("--min-pct", type=float, default=0.0, help="with --drops: smallest drop in percent")
+    parser.add_argument("--listing", type=int, help="show one listing's price history")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    history = PriceHistory(args.path)
+    added = history.append_bronze(args.bronze)
+    _, meta = history.spans()
+    print(f"Price history: {len(added)} new runs ({sum(added.values())} rows), {meta['observations']} observations "
+          f"in {meta['spans']} spans ({time.perf_counter() - start:.2f}s)")
+    if args.listing is not None:
+        print(history.history(args.listing).to_string(index=False))
+    if args.drops is not None:
+        drops = history.price_drops(args.drops, args.min_pct)
+        print(f"{len(drops)} price drops in the last {args.drops} days")
+        print(drops.head(50).to_string(index=False))
@@ -0,0 +1,200 @@
+import csv
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from src.scrapers.idealista.description_log import DescriptionLog, description_entry
+from src.scrapers.idealista.listing_parser import CSV_FIELDS, parse_listing_html
+from src.scrapers.idealista.page_archive import PageArchive, page_key, parse_key
+from src.scrapers.idealista.search_parser import parse_search_page
+
+BRONZE_ROOT = "data/bronze/idealista"
+
+# run_<id>/<operation>/<property_type>/<city>/page_<n>.html
+SEARCH_PAGE_RE = re.compile(r'run_(?P<run_id>[^/]+)/(?P<operation>[^/]+)/(?P<property_type>[^/]+)/'
+                            r'(?P<city>[^/]+)/page_(?P<page>\d+)\.html$')
+# run_<id>/<operation>/<property_type>/<city>/listings/<listing_id>.html
+DETAIL_PAGE_RE = re.compile(r'run_(?P<run_id>[^/]+)/(?P<operation>[^/]+)/(?P<property_type>[^/]+)/'
+                            r'(?P<city>[^/]+)/listings/(?P<listing_id>[^/]+)\.html$')
+
+
+def find_pages(root=BRONZE_ROOT, run_ids=None):
+    """Stored search and detail pages of the selected runs (all runs by default), sorted"""
+    paths = []
+    for run_dir in sorted(glob.glob(os.path.join(root, "run_*"))):
+        if run_ids and os.path.basename(run_dir)[len("run_"):] not in run_ids:
+            continue
+        paths.extend(glob.glob(os.path.join(run_dir, "**", "*.html"), recursive=True))
+    return sorted(paths)
+
+
+def run_timestamp(run_id):
+    """2025-10-02T12-42-39 -> 2025-10-02T12:42:39, the best scraped_at a stored page has"""
+    try:
+        return datetime.strptime(run_id, "%Y-%m-%dT%H-%M-%S").isoformat()
+    except ValueError:
+        return ''
+
+
+def page_context(path):
+    """(kind, context) from a stored page path; kind is 'search', 'detail' or None"""
+    normalized = path.replace(os.sep, '/')
+    match = DETAIL_PAGE_RE.search(normalized)
+    if match:
+        return 'detail', match.groupdict()
+    match = SEARCH_PAGE_RE.search(normalized)
+    if match:
+        return 'search', match.groupdict()
+    return None, None
+
+
+def parse_stored(html, kind, context):
+    """(CSV rows, full descriptions) of one stored search or detail page"""
+    fields = {name: context[name] for name in ('operation', 'property_type', 'city')}
+    if kind == 'detail':
+        record = parse_listing_html(html, **fields)
+        if not record.listing_id:
+            record.listing_id = context['listing_id']
+        records = [record]
+    else:
+        records = parse_search_page(html, **fields)
+
+    scraped_at = run_timestamp(context['run_id'])
+    for record in records:
+        record.scraped_at = scraped_at
+    descriptions = [description_entry(record) for record in records] if kind == 'detail' else []
+    return [record.to_row() for record in records], [entry for entry in descriptions if entry]
+
+
+def parse_page(path):
+    """Parse one stored page file in a worker process: (path, run_id, kind, CSV rows, descriptions, error)"""
+    kind, context = page_context(path)
+    if kind is None:
+        return path, '', 'unknown', [], [], "path does not look like a search or detail page"
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return (path, context['run_id'], kind) + parse_stored(f.read(), kind, context) + (None,)
+    except Exception as e:
+        return path, '', 'error', [], [], f"{type(e).__name__}: {e}"
+
+
+# One read-only archive handle per worker process
+_archive = None
+
+
+def open_worker_archive(path):
+    global _archive
+    _archive = PageArchive(path)
+
+
+def parse_archived(key):
+    """Parse one archived page in a worker process: (key, run_id, kind, CSV rows, descriptions, error)"""
+    try:
+        context = parse_key(key)
+        kind = 'detail' if 'listing_id' in context else 'search'
+        html = _archive.get(key)
+        if html is None:
+            return key, '', 'error', [], [], "key not in archive"
+        return (key, context['run_id'], kind) + parse_stored(html, kind, context) + (None,)
+    except Exception as e:
+        return key, '', 'error', [], [], f"{type(e).__name__}: {e}"
+
+
+def archive_pages(paths, archive):
+    """Copy stored bronze page files into a PageArchive; returns the number of pages added"""
+    added = 0
+    for path in paths:
+        kind, context = page_context(path)
+        if kind is None:
+            continue
+        page = context.get('page')
+        key = page_key(context['run_id'], context['operation'], context['property_type'], context['city'],
+                       page=int(page) if page else None, listing_id=context.get('listing_id'))
+        with open(path, 'rb') as f:
+            archive.put(key, f.read())
+        added += 1
+    return added
+
+
+class RunWriters:
+    """One idealista_data.csv (+ descriptions.jsonl.gz) per source run, laid out like bronze: out_dir/run_<id>/"""
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.files = {}
+        self.writers = {}
+        self.descriptions = {}
+
+    def get(self, run_id):
+        if run_id not in self.writers:
+            run_dir = os.path.join(self.out_dir, f"run_{run_id}")
+            os.makedirs(run_dir, exist_ok=True)
+            self.files[run_id] = open(os.path.join(run_dir, "idealista_data.csv"), 'w', newline='', encoding='utf-8')
+            self.writers[run_id] = csv.writer(self.files[run_id])
+            self.writers[run_id].writerow(CSV_FIELDS)
+        return self.writers[run_id]
+
+    def description_log(self, run_id):
+        if run_id not in self.descriptions:
+            self.descriptions[run_id] = DescriptionLog(os.path.join(self.out_dir, f"run_{run_id}"), append=False)
+        return self.descriptions[run_id]
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        for descriptions in self.descriptions.values():
+            descriptions.close()
+
+
+def reparse(paths, out_dir, workers=None, chunksize=4, progress_every=1.0, archive_path=None):
+    """Re-extract every page into out_dir/run_<id>/idealista_data.csv (+ out_dir/errors.csv)
+
+    paths are page files, or archive keys when archive_path is given.
+    Returns the summary dict (page/row/error counts, throughput).
+    """
+    if archive_path:
+        worker, pool_args = parse_archived, {'initializer': open_worker_archive, 'initargs': (archive_path,)}
+    else:
+        worker, pool_args = parse_page, {}
+    os.makedirs(out_dir, exist_ok=True)
+    errors_path = os.path.join(out_dir, "errors.csv")
+    summary = {'pages': len(paths), 'search': 0, 'detail': 0, 'rows': 0, 'errors': 0}
+    outputs = RunWriters(out_dir)
+
+    start = last_report = time.perf_counter()
+    try:
+        with open(errors_path, 'w', newline='', encoding='utf-8') as errors_file, \
+                ProcessPoolExecutor(max_workers=workers, **pool_args) as executor:
+            errors = csv.writer(errors_file)
+            errors.writerow(['path', 'error'])
+
+            # map() keeps input order, so the output is identical from run to run
+            results = executor.map(worker, paths, chunksize=chunksize)
+            for done, (path, run_id, kind, rows, descriptions, error) in enumerate(results, 1):
+                if error:
+                    summary['errors'] += 1
+                    errors.writerow([path, error])
+                else:
+                    summary[kind] += 1
+                    summary['rows'] += len(rows)
+                    outputs.get(run_id).writerows(rows)
+                    for entry in descriptions:
+                        outputs.description_log(run_id).add_entry(entry)
+
+                now = time.perf_counter()
+                if now - last_report >= progress_every or done == len(paths):
+                    last_report = now
+                    elapsed = now - start
+                    print(f"[{done}/{len(paths)}] {summary['rows']} rows, {summary['errors']} errors, "
+                          f"{done / elapsed if elapsed else 0:.1f} pages/s")
+    finally:
+        outputs.close()
+
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    summary['pages_per_second'] = round(len(paths) / summary['seconds'], 1) if summary['seconds'] else 0.0
+    summary['workers'] = workers or os.cpu_count()
+    summary['runs'] = sorted(outputs.writers)
+    summary['output'] = out_dir
+    return summary
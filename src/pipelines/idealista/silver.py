@@ -0,0 +1,193 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from src.scrapers.idealista.feature_extractor import extract_features_frame
+from src.scrapers.idealista.listing_parser import RECORD_COLUMNS
+from src.scrapers.idealista.output_sink import find_outputs, read_output
+
+BRONZE_GLOB = "data/bronze/idealista/run_*/idealista_data*"
+SILVER_PATH = "data/silver/idealista"
+PARTITION_COLS = ['operation', 'property_type', 'city', 'run_date']
+
+RUN_ID_RE = re.compile(r'run_(\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2})')
+MONTHS = {
+    name: number for number, name in enumerate(
+        ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+         'august', 'september', 'october', 'november', 'december'], start=1)
+}
+MONTHS.update({name[:3]: number for name, number in list(MONTHS.items())})
+
+# Typed silver schema; partition columns live in the directory names
+SILVER_SCHEMA = pa.schema([
+    ('listing_id', pa.int64()),
+    ('url', pa.string()),
+    ('run_id', pa.string()),
+    ('scraped_at', pa.timestamp('us')),
+    ('title', pa.string()),
+    ('price_eur', pa.int64()),
+    ('price_per_month', pa.bool_()),
+    ('area_m2', pa.float64()),
+    ('price_per_m2', pa.float64()),
+    ('bedrooms', pa.int16()),
+    ('bathrooms', pa.int16()),
+    ('location', pa.string()),
+    ('description', pa.string()),
+    ('property_type_detail', pa.string()),
+    ('updated_on', pa.timestamp('us')),
+    ('completion_year', pa.int16()),
+    ('status', pa.string()),
+    ('agency', pa.string()),
+    ('energy_certificate', pa.string()),
+    ('operation', pa.string()),
+    ('property_type', pa.string()),
+    ('city', pa.string()),
+    ('run_date', pa.string()),
+])
+
+
+def run_id_from_path(path):
+    match = RUN_ID_RE.search(path)
+    return match.group(1) if match else ''
+
+
+def read_bronze(pattern=BRONZE_GLOB, run_ids=None):
+    """All bronze run outputs (CSV, JSONL or parquet) as one string DataFrame, aligned on the current record fields
+
+    Older runs wrote other column sets; reading by header and reindexing keeps
+    them usable.
+    """
+    frames = []
+    for path in find_outputs(pattern):
+        run_id = run_id_from_path(path)
+        if run_ids is not None and run_id not in run_ids:
+            continue
+        frame = read_output(path)
+        if frame.empty:
+            continue
+        frame = frame.reindex(columns=RECORD_COLUMNS, fill_value='')
+        frame['run_id'] = run_id
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=RECORD_COLUMNS + ['run_id'], dtype=str)
+    return pd.concat(frames, ignore_index=True)
+
+
+def parse_number(series, pattern):
+    """First number matched by pattern, thousands separators stripped"""
+    digits = series.str.extract(pattern, expand=False).str.replace(',', '', regex=False)
+    return pd.to_numeric(digits, errors='coerce')
+
+
+def parse_update_date(text, scraped_at):
+    """"Listing updated on 24 September" / card ages ("3 days", "25 Sep") as timestamps
+
+    The year is not on the page: it is the scrape's year, minus one when the
+    month lies after the scrape month.
+    """
+    text = text.str.strip().str.lower()
+
+    absolute = text.str.extract(r'(\d{1,2})\s+([a-z]+)$')
+    month = absolute[1].map(MONTHS)
+    year = scraped_at.dt.year - (month > scraped_at.dt.month).astype('Int64')
+    dates = pd.to_datetime(
+        pd.DataFrame({'year': year, 'month': month, 'day': pd.to_numeric(absolute[0], errors='coerce')}),
+        errors='coerce'
+    )
+
+    age = text.str.extract(r'^(\d+)\s*(minute|hour|day)s?$')
+    ago = pd.to_timedelta(age[0].astype(float), unit='m') * age[1].map({'minute': 1, 'hour': 60, 'day': 1440})
+    return dates.fillna(scraped_at - ago)
+
+
+def normalize(bronze):
+    """Typed silver frame from raw bronze strings, one vectorized pass per column"""
+    df = pd.DataFrame(index=bronze.index)
+    df['listing_id'] = pd.to_numeric(bronze['listing_id'].where(bronze['listing_id'].str.fullmatch(r'\d+')),
+                                     errors='coerce').astype('Int64')
+    df['url'] = bronze['url']
+    df['run_id'] = bronze['run_id']
+    df['scraped_at'] = pd.to_datetime(bronze['scraped_at'], errors='coerce', format='ISO8601')
+
+    df['title'] = bronze['title']
+    df['price_eur'] = parse_number(bronze['price'], r'(\d[\d,]*)').astype('Int64')
+    df['price_per_month'] = bronze['price'].str.contains('month', case=False)
+    df['area_m2'] = parse_number(bronze['area'], r'(\d[\d,]*(?:\.\d+)?)\s*m²').astype('Float64')
+    df['price_per_m2'] = (df['price_eur'] / df['area_m2']).round(2)
+    df['bedrooms'] = parse_number(bronze['bedrooms'], r'^\s*[Tt]?(\d+)\s*$').astype('Int16')
+    df['bathrooms'] = parse_number(bronze['bathrooms'], r'^\s*(\d+)\s*$').astype('Int16')
+
+    for column in ('location', 'description', 'property_type_detail', 'status', 'agency', 'energy_certificate'):
+        df[column] = bronze[column].replace('', None)
+    df['updated_on'] = parse_update_date(bronze['update_date'], df['scraped_at'])
+    df['completion_year'] = parse_number(bronze['completion_year'], r'((?:19|20)\d{2})').astype('Int16')
+
+    # Runs written before status/energy were exported: re-derive them from the description
+    derived = extract_features_frame(bronze['description'], bronze['description'])
+    for column in ('status', 'energy_certificate'):
+        df[column] = df[column].where(df[column].notna(), derived[column])
+
+    for column in ('operation', 'property_type', 'city'):
+        df[column] = bronze[column].str.strip().str.lower()
+    df['run_date'] = bronze['run_id'].str.slice(0, 10)
+
+    # Rows a broken writer shifted out of place have no usable id or timestamp
+    valid = df['listing_id'].notna() & df['scraped_at'].notna() & (df['operation'] != '')
+    df = df[valid]
+    # One row per listing per run, the last write wins
+    return df.drop_duplicates(['run_id', 'listing_id'], keep='last').reset_index(drop=True)
+
+
+def write_silver(df, path=SILVER_PATH):
+    """Write hive-partitioned Parquet; partitions being rewritten are replaced, others are kept"""
+    table = pa.Table.from_pandas(df[SILVER_SCHEMA.names], schema=SILVER_SCHEMA, preserve_index=False)
+    ds.write_dataset(
+        table, path, format='parquet',
+        partitioning=ds.partitioning(pa.schema([SILVER_SCHEMA.field(c) for c in PARTITION_COLS]), flavor='hive'),
+        existing_data_behavior='delete_matching',
+        basename_template='part-{i}.parquet',
+    )
+    return table.num_rows
+
+
+def read_silver(path=SILVER_PATH, columns=None, filters=None):
+    """Load silver listings; only the requested columns and matching partitions/row groups are read
+
+    filters use the pandas/pyarrow form, e.g.
+    [('city', '=', 'lisbon'), ('operation', '=', 'sale'), ('price_eur', '<', 500000)]
+    """
+    return pd.read_parquet(path, engine='pyarrow', columns=columns, filters=filters,
+                           partitioning='hive')
+
+
+def build_silver(pattern=BRONZE_GLOB, path=SILVER_PATH, run_ids=None):
+    """bronze runs -> typed, partitioned silver Parquet; returns (rows read, rows written)"""
+    if run_ids is not None:
+        # A run_date partition holds every run of that day, so rebuild the whole day
+        dates = {run_id[:10] for run_id in run_ids}
+        run_ids = {run_id_from_path(p) for p in find_outputs(pattern) if run_id_from_path(p)[:10] in dates}
+    bronze = read_bronze(pattern, run_ids)
+    if bronze.empty:
+        return 0, 0
+    silver = normalize(bronze)
+    return len(bronze), write_silver(silver, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the typed Parquet silver layer from bronze runs")
+    parser.add_argument("--bronze", default=BRONZE_GLOB, help="glob of bronze run outputs (csv, jsonl or parquet)")
+    parser.add_argument("--out", default=SILVER_PATH, help="silver dataset directory")
+    parser.add_argument("--runs", nargs="+", metavar="RUN_ID", help="only rebuild the days of these runs")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    read, written = build_silver(args.bronze, args.out, set(args.runs) if args.runs else None)
+    print(f"Silver: {read} bronze rows -> {written} rows in {args.out} ({time.perf_counter() - start:.2f}s)")
@@ -0,0 +1,388 @@
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from src.models.idealista.features import fold
+from src.scrapers.idealista.description_log import DESCRIPTIONS_NAME, read_descriptions
+
+TEXT_INDEX_PATH = "data/silver/idealista_text"
+BRONZE_ROOT = "data/bronze/idealista"
+DESCRIPTION_GLOBS = [
+    os.path.join(BRONZE_ROOT, "run_*", DESCRIPTIONS_NAME),
+    os.path.join(BRONZE_ROOT, "run_*", "shards", "*", DESCRIPTIONS_NAME),
+]
+
+STATE_NAME = "state.json"
+MAX_SEGMENTS = 8
+# Width of the fixed-size vocabulary entries; longer terms are cut (the same way in queries)
+TERM_CHARS = 32
+INT32_MAX = np.iinfo(np.int32).max
+
+DESCRIPTION_SCHEMA = pa.schema([
+    ('listing_id', pa.int32()),
+    ('scraped_at', pa.string()),
+    ('description', pa.string()),
+])
+
+STOPWORDS = frozenset("""
+a o as os e de da do das dos em no na nos nas num numa um uma uns umas com sem para por pelo pela pelos pelas
+que se ao aos mais muito muita sua seu suas seus ou este esta estes estas isto esse essa sao ser tem ter ja
+the an and of to in on with for is are this that by at from or its it be as has have very all
+""".split())
+
+# English listing vocabulary mapped onto the Portuguese term, applied after stemming
+SYNONYMS = {
+    'pool': 'piscina', 'swimming': 'piscina', 'garage': 'garagem', 'parking': 'estacionamento',
+    'terrace': 'terraco', 'balcony': 'varanda', 'garden': 'jardim', 'lift': 'elevador', 'elevator': 'elevador',
+    'river': 'rio', 'sea': 'mar', 'ocean': 'mar', 'beach': 'praia', 'view': 'vista', 'gym': 'ginasio',
+    'condominium': 'condominio', 'storage': 'arrecadacao', 'fireplace': 'lareira', 'kitchen': 'cozinha',
+    'renovated': 'remodelado', 'remodelada': 'remodelado', 'furnished': 'mobilado', 'mobilada': 'mobilado',
+    'equipped': 'equipado', 'equipada': 'equipado', 'concierge': 'porteiro', 'doorman': 'porteiro',
+}
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+QUERY_TOKEN_RE = re.compile(r'"[^"]*"|\(|\)|[^\s()"]+')
+OPERATORS = {'AND', 'OR', 'NOT'}
+
+
+def stem(token):
+    """Light plural folding shared by Portuguese and English: garagens -> garagem, piscinas -> piscina"""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith(('oes', 'aes')):
+        return token[:-3] + 'ao'
+    if token.endswith('ns'):
+        return token[:-2] + 'm'
+    if token.endswith('ies') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith('is') and len(token) > 4 and token[-3] in 'aeo':
+        return token[:-2] + 'l'
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Normalized terms of a text, in order: folded accents, no stopwords, stemmed, English mapped"""
+    terms = []
+    for token in TOKEN_RE.findall(fold(text or '')):
+        if token in STOPWORDS:
+            continue
+        token = stem(token)
+        terms.append(SYNONYMS.get(token, token)[:TERM_CHARS])
+    return terms
+
+
+def bigram(first, second):
+    return f"{first} {second}"[:TERM_CHARS]
+
+
+def index_terms(text):
+    """Distinct terms of a text plus its adjacent pairs, so two-word phrases are one lookup"""
+    terms = tokenize(text)
+    return set(terms) | {bigram(first, second) for first, second in zip(terms, terms[1:])}
+
+
+def contains_phrase(terms, phrase):
+    n = len(phrase)
+    return any(terms[i:i + n] == phrase for i in range(len(terms) - n + 1))
+
+
+def latest_entries(entries):
+    """One row per listing id (the last scraped), with an int32 id; ids that are not numbers are dropped"""
+    df = pd.DataFrame(entries, columns=['listing_id', 'scraped_at', 'description'])
+    df['listing_id'] = pd.to_numeric(df['listing_id'], errors='coerce')
+    df = df.dropna(subset=['listing_id', 'description'])
+    if len(df) and df['listing_id'].max() > INT32_MAX:
+        raise ValueError(f"listing_id {df['listing_id'].max()} does not fit the int32 id column")
+    df['listing_id'] = df['listing_id'].astype(np.int32)
+    df['scraped_at'] = df['scraped_at'].fillna('').astype(str)
+    return df.sort_values(['listing_id', 'scraped_at'], kind='stable').drop_duplicates('listing_id', keep='last')
+
+
+def write_segment(path, df):
+    """Compressed descriptions plus the segment's inverted index: terms, offsets, postings, ids (.npy)"""
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    table = pa.Table.from_pandas(df.reset_index(drop=True), schema=DESCRIPTION_SCHEMA, preserve_index=False)
+    pq.write_table(table, os.path.join(tmp_path, "descriptions.parquet"), compression='zstd')
+
+    ids = df['listing_id'].to_numpy(dtype=np.int32)
+    pair_terms, pair_ids = [], []
+    for listing_id, text in zip(ids, df['description']):
+        terms = index_terms(text)
+        pair_terms.extend(terms)
+        pair_ids.extend([listing_id] * len(terms))
+    pair_terms = np.array(pair_terms, dtype=f'<U{TERM_CHARS}')
+    pair_ids = np.array(pair_ids, dtype=np.int32)
+    order = np.lexsort((pair_ids, pair_terms))
+    pair_terms, pair_ids = pair_terms[order], pair_ids[order]
+    terms, starts = np.unique(pair_terms, return_index=True)
+    np.save(os.path.join(tmp_path, "terms.npy"), terms)
+    np.save(os.path.join(tmp_path, "offsets.npy"), np.append(starts, len(pair_ids)).astype(np.int64))
+    np.save(os.path.join(tmp_path, "postings.npy"), pair_ids)
+    np.save(os.path.join(tmp_path, "ids.npy"), np.sort(ids))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+class TextSegment:
+    """One immutable index segment, its arrays memory-mapped"""
+    def __init__(self, path):
+        self.path = path
+        self.terms = np.load(os.path.join(path, "terms.npy"), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode='r')
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r')
+        self.live = self.ids
+
+    def lookup(self, term):
+        """Sorted listing ids whose description has the term (this segment's copy, live or not)"""
+        i = np.searchsorted(self.terms, term)
+        if i >= len(self.terms) or self.terms[i] != term:
+            return np.zeros(0, dtype=np.int32)
+        return np.asarray(self.postings[self.offsets[i]:self.offsets[i + 1]])
+
+    def descriptions(self, ids):
+        table = pq.read_table(os.path.join(self.path, "descriptions.parquet"),
+                              filters=[('listing_id', 'in', [int(i) for i in ids])])
+        return dict(zip(table.column('listing_id').to_pylist(), table.column('description').to_pylist()))
+
+
+class TextIndex:
+    """
+    Full listing descriptions and an inverted index over them, keyed by listing id.
+    - update() turns each new (or grown) run descriptions file into an immutable segment:
+      zstd Parquet of the texts plus memory-mapped terms/offsets/postings arrays
+    - A listing belongs to the newest segment that has it, so re-scraped descriptions
+      replace older ones; past MAX_SEGMENTS, segments are compacted into one
+    - search() evaluates boolean queries (AND, OR, NOT, parentheses, "quoted phrases")
+      and term_features() returns per-listing amenity flags for many terms at once
+    """
+    def __init__(self, path=TEXT_INDEX_PATH):
+        self.path = path
+        self.segments_dir = os.path.join(path, "segments")
+        self.state_path = os.path.join(path, STATE_NAME)
+        self.state = {'segments': [], 'sources': {}, 'next_segment': 0}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+        self.loaded = None
+
+    def save_state(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.state['updated_at'] = datetime.now().isoformat()
+        with open(self.state_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def new_segment(self, df):
+        name = f"seg-{self.state['next_segment']:06d}"
+        write_segment(os.path.join(self.segments_dir, name), df)
+        self.state['next_segment'] += 1
+        return name
+
+    def segments(self):
+        """Loaded segments, newest first, each with .live = the ids it still owns"""
+        if self.loaded is None:
+            self.loaded = [TextSegment(os.path.join(self.segments_dir, name)) for name in reversed(self.state['segments'])]
+            seen = np.zeros(0, dtype=np.int32)
+            for segment in self.loaded:
+                segment.live = np.setdiff1d(segment.ids, seen, assume_unique=True)
+                seen = np.union1d(seen, segment.ids)
+        return self.loaded
+
+    def update(self, patterns=DESCRIPTION_GLOBS, max_segments=MAX_SEGMENTS):
+        """Index description files not seen yet (or grown since); returns a summary dict"""
+        summary = {'files': 0, 'descriptions': 0, 'compacted': False}
+        for pattern in [patterns] if isinstance(patterns, str) else patterns:
+            for source in sorted(glob.glob(pattern)):
+                key = os.path.relpath(source).replace(os.sep, '/')
+                size = os.path.getsize(source)
+                if self.state['sources'].get(key) == size:
+                    continue
+                df = latest_entries(list(read_descriptions(source)))
+                if len(df):
+                    self.state['segments'].append(self.new_segment(df))
+                    summary['descriptions'] += len(df)
+                self.state['sources'][key] = size
+                summary['files'] += 1
+        self.save_state()
+        self.loaded = None
+        if len(self.state['segments']) > max_segments:
+            self.compact()
+            summary['compacted'] = True
+        summary['segments'] = len(self.state['segments'])
+        summary['listings'] = len(self)
+        return summary
+
+    def compact(self):
+        """Rewrite every segment's live descriptions into a single segment"""
+        old = list(self.state['segments'])
+        frames = []
+        for segment in self.segments():
+            if len(segment.live):
+                table = pq.read_table(os.path.join(segment.path, "descriptions.parquet"),
+                                      filters=[('listing_id', 'in', segment.live.tolist())])
+                frames.append(table.to_pandas())
+        self.loaded = None
+        if frames:
+            df = pd.concat(frames, ignore_index=True).sort_values('listing_id')
+            self.state['segments'] = [self.new_segment(df)]
+        else:
+            self.state['segments'] = []
+        self.save_state()
+        for name in old:
+            shutil.rmtree(os.path.join(self.segments_dir, name), ignore_errors=True)
+        return len(self.state['segments'])
+
+    def __len__(self):
+        return int(sum(len(segment.live) for segment in self.segments()))
+
+    def all_ids(self):
+        segments = self.segments()
+        return np.sort(np.concatenate([segment.live for segment in segments])) if segments else np.zeros(0, np.int32)
+
+    def descriptions(self, ids):
+        """Full description of each id found, as a Series indexed by listing id"""
+        wanted = np.unique(np.asarray(ids, dtype=np.int64))
+        found = {}
+        for segment in self.segments():
+            own = np.intersect1d(segment.live, wanted)
+            if len(own):
+                found.update(segment.descriptions(own))
+        return pd.Series(found, dtype=object).sort_index()
+
+    def term_ids(self, term):
+        """Sorted ids of the listings whose current description has one normalized term"""
+        parts = [np.intersect1d(segment.lookup(term), segment.live, assume_unique=True) for segment in self.segments()]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, np.int32)
+
+    def phrase_ids(self, text):
+        """Ids matching a word or phrase; phrase words must be adjacent (stopwords aside).
+        A text of stopwords only matches everything."""
+        phrase = tokenize(text)
+        if not phrase:
+            return self.all_ids()
+        if len(phrase) == 1:
+            return self.term_ids(phrase[0])
+        pairs = list(zip(phrase, phrase[1:]))
+        ids = self.term_ids(bigram(*pairs[0]))
+        for pair in pairs[1:]:
+            ids = np.intersect1d(ids, self.term_ids(bigram(*pair)), assume_unique=True)
+        # Pairs only prove adjacency two by two; longer (or cut) phrases are checked on the text
+        if (len(phrase) > 2 or any(len(" ".join(pair)) > TERM_CHARS for pair in pairs)) and len(ids):
+            texts = self.descriptions(ids)
+            ids = np.array([i for i, text in texts.items() if contains_phrase(tokenize(text), phrase)], dtype=np.int32)
+        return ids
+
+    def search(self, query):
+        """Sorted listing ids matching a boolean query, e.g. 'piscina AND (garagem OR parking) NOT "rés do chão"'
+
+        Words next to each other are ANDed; operators must be upper case.
+        """
+        tokens = QUERY_TOKEN_RE.findall(query)
+        position = 0
+
+        def peek():
+            return tokens[position] if position < len(tokens) else None
+
+        def take():
+            nonlocal position
+            position += 1
+            return tokens[position - 1]
+
+        def parse_or():
+            ids = parse_and()
+            while peek() == 'OR':
+                take()
+                ids = np.union1d(ids, parse_and())
+            return ids
+
+        def parse_and():
+            ids = parse_not()
+            while peek() is not None and peek() not in ('OR', ')'):
+                if peek() == 'AND':
+                    take()
+                ids = np.intersect1d(ids, parse_not(), assume_unique=True)
+            return ids
+
+        def parse_not():
+            if peek() == 'NOT':
+                take()
+                return np.setdiff1d(self.all_ids(), parse_not(), assume_unique=True)
+            return parse_atom()
+
+        def parse_atom():
+            token = take() if peek() is not None else None
+            if token is None or token in OPERATORS or token == ')':
+                raise ValueError(f"Query {query!r}: expected a word, phrase or '(' at {token!r}")
+            if token == '(':
+                ids = parse_or()
+                if peek() != ')':
+                    raise ValueError(f"Query {query!r}: missing ')'")
+                take()
+                return ids
+            return self.phrase_ids(token.strip('"'))
+
+        ids = parse_or()
+        if peek() is not None:
+            raise ValueError(f"Query {query!r}: unexpected {peek()!r}")
+        return ids
+
+    def term_features(self, terms, ids=None):
+        """Boolean DataFrame (listing id x term): whether each description mentions the word or phrase"""
+        index = self.all_ids() if ids is None else np.asarray(ids, dtype=np.int64)
+        return pd.DataFrame({term: np.isin(index, self.phrase_ids(term)) for term in terms},
+                            index=pd.Index(index, name='listing_id'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-description store and keyword index over the bronze runs")
+    parser.add_argument("--descriptions", nargs="+", default=DESCRIPTION_GLOBS,
+                        help="globs of run descriptions files (descriptions.jsonl.gz)")
+    parser.add_argument("--out", default=TEXT_INDEX_PATH, help="text index directory")
+    parser.add_argument("--rebuild", action="store_true", help="drop the index and re-read every run")
+    parser.add_argument("--compact", action="store_true", help="merge all segments into one")
+    parser.add_argument("--search", help='boolean query, e.g. \'piscina AND "vista rio" NOT garagem\'')
+    parser.add_argument("--features", nargs="+", help="words or phrases to count across the listings")
+    parser.add_argument("--listing", type=int, help="print the full description of a listing")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        shutil.rmtree(args.out, ignore_errors=True)
+    start = time.perf_counter()
+    index = TextIndex(args.out)
+    summary = index.update(args.descriptions)
+    if args.compact and not summary['compacted']:
+        summary['segments'] = index.compact()
+    print(f"Text index: {summary['files']} new files, {summary['descriptions']} descriptions -> "
+          f"{summary['listings']} listings in {summary['segments']} segments ({time.perf_counter() - start:.2f}s)")
+
+    if args.search:
+        start = time.perf_counter()
+        try:
+            ids = index.search(args.search)
+        except ValueError as e:
+            parser.error(f"--search: {e}")
+        print(f"{len(ids)} listings match {args.search!r} ({(time.perf_counter() - start) * 1000:.1f} ms): "
+              f"{ids[:20].tolist()}{' ...' if len(ids) > 20 else ''}")
+    if args.features:
+        features = index.term_features(args.features)
+        print(features.sum().rename('listings').to_string())
+    if args.listing:
+        print(index.descriptions([args.listing]).get(args.listing, f"No description for {args.listing}"))
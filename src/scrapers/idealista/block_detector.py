@@ -0,0 +1,172 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+from src.scrapers.idealista.metrics import METRICS
+
+log = logging.getLogger('scraper.blocks')
+
+# Markers that a response is a bot challenge instead of the page
+CHALLENGE_MARKERS = (
+    'captcha-delivery.com',
+    'var dd={',
+    'Please enable JS and disable any ad blocker',
+)
+CHALLENGE_STATUSES = (401, 403, 405, 429, 503)
+
+# Hard blocks: the site refuses this client outright
+BLOCK_MARKERS = (
+    'uso indebido',
+    'Access to this page has been denied',
+    'You have been blocked',
+    'El acceso se ha bloqueado',
+)
+BLOCK_STATUSES = (401, 403, 405, 429)
+GONE_STATUSES = (404, 410)
+
+# Marker that must be in the HTML for the page to be usable without JS
+SEARCH_PAGE_MARKER = 'item-link'
+DETAIL_PAGE_MARKER = 'main-info__title-main'
+
+NO_RESULTS_RE = re.compile(r'There are no listings|No hay anuncios|Não há anúncios', re.IGNORECASE)
+
+SERVED = 'served'          # the content we came for
+EMPTY = 'empty'            # a real search page without results
+GONE = 'gone'              # 404/410: listing removed
+CHALLENGE = 'challenge'    # captcha / JS challenge
+BLOCKED = 'blocked'        # refused outright
+UNRECOGNIZED = 'unrecognized'  # none of the above, e.g. not rendered yet
+
+BLOCKING = (CHALLENGE, BLOCKED)
+
+
+class PageBlocked(Exception):
+    """The site answered with a challenge or block page"""
+    def __init__(self, url, verdict):
+        super().__init__(f"{verdict} page for {url}")
+        self.url = url
+        self.verdict = verdict
+
+
+class PageUnavailable(Exception):
+    """The page loaded but holds no listing: removed (gone), empty or unrecognized"""
+    def __init__(self, url, verdict):
+        super().__init__(f"{verdict} page for {url}")
+        self.url = url
+        self.verdict = verdict
+
+
+def classify_page(html, status=200, required_marker=None):
+    """Verdict for one loaded page, from its status and markers in the source (no waiting)"""
+    if any(marker in html for marker in CHALLENGE_MARKERS):
+        return CHALLENGE
+    if any(marker in html for marker in BLOCK_MARKERS) or status in BLOCK_STATUSES:
+        return BLOCKED
+    if status in GONE_STATUSES:
+        return GONE
+    if status >= 500:
+        return UNRECOGNIZED
+    if required_marker is None or required_marker in html:
+        return SERVED
+    if NO_RESULTS_RE.search(html):
+        return EMPTY
+    return UNRECOGNIZED
+
+
+class HostCircuit:
+    def __init__(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_until = 0.0
+        self.trips = 0
+        self.consecutive_trips = 0
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker fed with page verdicts.
+    - failure_threshold blocks in a row open the host's circuit: before_request() then
+      sleeps until the cooldown ends; the next response (half-open probe) closes it again
+      or reopens it with a doubled cooldown (up to max_cooldown)
+    - exhausted() turns True after max_trips openings without a served page in between,
+      so the crawl can stop and be resumed later instead of grinding through the block
+    - Counts every verdict, i.e. served vs blocked pages of the run
+    """
+    def __init__(self, failure_threshold=3, cooldown=60, max_cooldown=900, max_trips=5,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_trips = max_trips
+        self.sleep = sleep
+        self.clock = clock
+        self.hosts = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        return cls(**config.get('block', {}), **kwargs)
+
+    def host(self, url):
+        host = urlparse(url).netloc
+        circuit = self.hosts.get(host)
+        if circuit is None:
+            circuit = self.hosts[host] = HostCircuit()
+        return circuit
+
+    def before_request(self, url):
+        """Block while url's host is paused; returns the seconds slept"""
+        with self.lock:
+            circuit = self.host(url)
+            # Requests arriving during the probe wait out the same cooldown
+            delay = circuit.opened_until - self.clock() if circuit.state != 'closed' else 0.0
+            if circuit.state == 'open':
+                circuit.state = 'half_open'
+        if delay > 0:
+            log.warning(f"Circuit open for {urlparse(url).netloc}: pausing {delay:.0f}s")
+            self.sleep(delay)
+            METRICS.observe('sleep', delay, reason='circuit_open')
+        return max(delay, 0.0)
+
+    def record(self, url, verdict):
+        """Feed back the verdict of one loaded page"""
+        METRICS.inc('pages', verdict=verdict)
+        with self.lock:
+            self.counts[verdict] += 1
+            circuit = self.host(url)
+            if verdict in BLOCKING:
+                circuit.failures += 1
+                if circuit.state == 'half_open' or circuit.failures >= self.failure_threshold:
+                    self.trip(circuit)
+            elif verdict != UNRECOGNIZED:
+                circuit.failures = 0
+                circuit.consecutive_trips = 0
+                circuit.state = 'closed'
+
+    def trip(self, circuit):
+        circuit.trips += 1
+        circuit.consecutive_trips += 1
+        circuit.failures = 0
+        cooldown = min(self.max_cooldown, self.cooldown * 2 ** (circuit.consecutive_trips - 1))
+        circuit.state = 'open'
+        circuit.opened_until = self.clock() + cooldown
+        METRICS.inc('circuit_trips')
+        log.warning(f"Circuit breaker tripped ({circuit.consecutive_trips} in a row): next requests wait {cooldown:.0f}s")
+
+    def exhausted(self):
+        with self.lock:
+            return any(circuit.consecutive_trips >= self.max_trips for circuit in self.hosts.values())
+
+    def stats(self):
+        with self.lock:
+            blocked = sum(self.counts[verdict] for verdict in BLOCKING)
+            total = sum(self.counts.values())
+            return {
+                **dict(self.counts),
+                'block_ratio': round(blocked / total, 3) if total else 0.0,
+                'hosts': {host: {'state': c.state, 'trips': c.trips} for host, c in self.hosts.items()},
+            }
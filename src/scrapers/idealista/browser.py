@@ -0,0 +1,178 @@
+import logging
+import os
+
+from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from webdriver_manager.chrome import ChromeDriverManager
+
+from src.scrapers.idealista.metrics import METRICS
+from src.scrapers.idealista.settings import load_scraping_config
+
+log = logging.getLogger('scraper.browser')
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# Where the chromedriver path found by webdriver-manager is remembered between starts
+DRIVER_PATH_CACHE = "data/.cache/chromedriver_path"
+
+# Network.setBlockedURLs patterns for lean mode: heavy resources and third-party trackers/ads.
+# The challenge provider (captcha-delivery.com) must stay reachable
+BLOCKED_RESOURCE_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3', '*.m3u8',
+]
+BLOCKED_THIRD_PARTY_PATTERNS = [
+    '*googletagmanager.com*', '*google-analytics.com*', '*doubleclick.net*', '*googlesyndication.com*',
+    '*googleadservices.com*', '*facebook.net*', '*facebook.com/tr*', '*hotjar.com*', '*criteo.*',
+    '*adnxs.com*', '*taboola.com*', '*outbrain.com*', '*bing.com/bat*', '*tiktok.com*',
+    '*onetrust.com*', '*cookielaw.org*', '*newrelic.com*', '*nr-data.net*', '*youtube.com*',
+]
+
+
+def cached_driver_path(cache_path=DRIVER_PATH_CACHE):
+    """chromedriver path saved by an earlier download, or None when there is none or the binary is gone"""
+    if not os.path.exists(cache_path):
+        return None
+    with open(cache_path, 'r', encoding='utf-8') as f:
+        cached = f.read().strip()
+    return cached if cached and os.path.exists(cached) else None
+
+
+def resolve_driver_path(configured=None, cache_path=DRIVER_PATH_CACHE, refresh=False):
+    """chromedriver binary: configured path, else the cached one, else download once and cache it
+
+    refresh drops the cached path and downloads again (the cached driver no longer matches Chrome).
+    """
+    if configured:
+        return configured
+    if refresh:
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+    else:
+        cached = cached_driver_path(cache_path)
+        if cached:
+            return cached
+    path = ChromeDriverManager().install()
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        f.write(path)
+    return path
+
+
+def lean_arguments(js_heap_mb=None, disk_cache_mb=None, renderer_processes=None):
+    """Chrome switches of lean mode: no images or background work, capped heap/cache/renderers"""
+    arguments = [
+        '--blink-settings=imagesEnabled=false',
+        '--disable-gpu',
+        '--disable-background-networking',
+        '--disable-component-update',
+        '--disable-default-apps',
+        '--disable-sync',
+        '--mute-audio',
+        '--no-first-run',
+    ]
+    if js_heap_mb:
+        arguments.append(f'--js-flags=--max-old-space-size={int(js_heap_mb)}')
+    if disk_cache_mb is not None:
+        arguments.append(f'--disk-cache-size={int(disk_cache_mb) * 1024 * 1024}')
+    if renderer_processes:
+        arguments.append(f'--renderer-process-limit={int(renderer_processes)}')
+    return arguments
+
+
+def block_resources(driver, patterns):
+    """Drop matching requests in the browser's network stack (CDP Network.setBlockedURLs)"""
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(patterns)})
+
+
+def create_chrome_driver(user_agent=USER_AGENT, browser_config=None, **overrides):
+    """Headless Chrome with the anti-detection options used by every scraper driver
+
+    browser_config is the browser section of scraping_config.yaml (loaded when
+    omitted); keyword overrides apply to this instance only, e.g. a smaller
+    js_heap_mb for pool workers.
+    """
+    config = dict(browser_config if browser_config is not None else load_scraping_config()['browser'])
+    config.update(overrides)
+
+    chrome_options = Options()
+    chrome_options.add_argument('--headless=new')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    chrome_options.add_argument('--disable-extensions')
+    chrome_options.add_argument(f'--user-agent={user_agent}')
+    chrome_options.page_load_strategy = config['page_load_strategy']
+    if config['lean']:
+        for argument in lean_arguments(config['js_heap_mb'], config['disk_cache_mb'], config['renderer_processes']):
+            chrome_options.add_argument(argument)
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.default_content_setting_values.notifications': 2,
+        })
+
+    from_cache = not config['driver_path'] and cached_driver_path() is not None
+    try:
+        driver = webdriver.Chrome(service=Service(resolve_driver_path(config['driver_path'])), options=chrome_options)
+    except SessionNotCreatedException as e:
+        if not from_cache:
+            raise
+        # Chrome updated itself past the cached chromedriver: fetch a matching one, once
+        log.warning(f"Cached chromedriver rejected ({e.msg}); downloading a new one")
+        driver = webdriver.Chrome(service=Service(resolve_driver_path(refresh=True)), options=chrome_options)
+
+    # FIXED JavaScript - removed arrow function
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: function() { return undefined; }})")
+    if config['lean']:
+        try:
+            block_resources(driver, BLOCKED_RESOURCE_PATTERNS + BLOCKED_THIRD_PARTY_PATTERNS
+                            + list(config['blocked_urls']))
+        except Exception as e:
+            log.warning(f"Resource blocking unavailable: {e}")
+    return driver
+
+
+def process_tree_rss_mb(pid):
+    """Resident memory of a process and all its descendants (Linux /proc), or None"""
+    total, pending, seen = 0, [pid], set()
+    try:
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            with open(f"/proc/{current}/statm", 'r') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children", 'r') as f:
+                    pending.extend(int(child) for child in f.read().split())
+    except (OSError, ValueError, AttributeError):
+        return None
+    return round(total / (1024 * 1024), 1)
+
+
+def browser_rss_mb(driver):
+    """RSS of chromedriver plus every Chrome process it started"""
+    try:
+        return process_tree_rss_mb(driver.service.process.pid)
+    except AttributeError:
+        return None
+
+
+def wait_for_element(driver, selector, timeout, by=By.CSS_SELECTOR):
+    """WebDriverWait for an element, timed per selector; timeouts are counted, then re-raised"""
+    with METRICS.timer('wait', selector=selector):
+        try:
+            return WebDriverWait(driver, timeout).until(EC.presence_of_element_located((by, selector)))
+        except Exception:
+            METRICS.inc('wait_timeouts', selector=selector)
+            raise
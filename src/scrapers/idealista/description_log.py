@@ -0,0 +1,86 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import zlib
+
+log = logging.getLogger('scraper.output')
+
+DESCRIPTIONS_NAME = "descriptions.jsonl.gz"
+FLUSH_ROWS = 200
+
+
+def description_entry(record):
+    """The line kept for a detail record, or None when it has no description"""
+    if not record.description or not record.listing_id:
+        return None
+    return {'listing_id': record.listing_id, 'scraped_at': record.scraped_at, 'description': record.description}
+
+
+class DescriptionLog:
+    """
+    Full listing descriptions of one run, next to its output (the CSV keeps a 200-char preview).
+    - One JSON line per detail record: listing_id, scraped_at, description
+    - Buffered lines are appended as a self-contained gzip member every FLUSH_ROWS records,
+      so a crash loses at most the unflushed buffer and a resumed run simply appends
+    """
+    def __init__(self, run_path, flush_rows=FLUSH_ROWS, append=True):
+        self.path = os.path.join(run_path, DESCRIPTIONS_NAME)
+        self.flush_rows = flush_rows
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.written = 0
+        os.makedirs(run_path, exist_ok=True)
+        if not append and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def add(self, record):
+        """Queue the description of a detail record (records without one are skipped)"""
+        self.add_entry(description_entry(record))
+
+    def add_entry(self, entry):
+        if entry is None:
+            return
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) >= self.flush_rows:
+                self.flush_locked()
+
+    def flush_locked(self):
+        if not self.buffer:
+            return
+        data = ("\n".join(self.buffer) + "\n").encode('utf-8')
+        try:
+            with open(self.path, 'ab') as f:
+                f.write(gzip.compress(data, compresslevel=6, mtime=0))
+            self.written += len(self.buffer)
+            self.buffer = []
+        except OSError as e:
+            log.error(f"Could not write descriptions to {self.path}: {e}")
+
+    def close(self):
+        with self.lock:
+            self.flush_locked()
+        return self.written
+
+
+def read_descriptions(path):
+    """Yield the records of a descriptions file; a truncated last member (crash mid-write) is skipped"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    while data:
+        inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            text = inflater.decompress(data)
+        except zlib.error as e:
+            log.warning(f"{path}: unreadable gzip member, skipping the rest: {e}")
+            return
+        if not inflater.eof:
+            log.warning(f"{path}: truncated last member skipped")
+            return
+        for line in text.decode('utf-8').splitlines():
+            if line:
+                yield json.loads(line)
+        data = inflater.unused_data
@@ -0,0 +1,154 @@
+import re
+
+BATHROOM_PATTERNS = [
+    r'(\d+)\s*bathroom',
+    r'(\d+)\s*banho',
+    r'(\d+)\s*casa de banho',
+    r'(\d+)\s*wc',
+    r'(\d+)\s*bath'
+]
+
+BEDROOM_PATTERNS = [
+    r'(\d+)\s*bedroom',
+    r'(\d+)\s*quarto',
+    r't(\d+)',  # T3, T2 etc.
+    r'(\d+)\s*quartos',
+    r'(\d+)\s*room',
+    r'(\d+)\s*hab'
+]
+
+TYPE_PATTERNS = [
+    r'terraced house', r'apartment', r'studio', r'villa',
+    r'house', r'flat', r'penthouse'
+]
+
+STATUS_PATTERNS = [
+    r'new build', r'new construction', r'renovated', r'to renovate',
+    r'new home', r'brand new'
+]
+
+ENERGY_PATTERNS = [
+    r'Energy Rating:\s*([A-Z][+\-]?)',
+    r'Energy Certificate:\s*([A-Z][+\-]?)',
+    r'Energy certification:\s*([A-Z][+\-]?)',
+    r'Certificado Energético:\s*([A-Z][+\-]?)',
+    r'Classificação Energética:\s*([A-Z][+\-]?)'
+]
+
+YEAR_PATTERN = r'(\d{4})'
+MIN_YEAR, MAX_YEAR = 1900, 2030  # exclusive, realistic completion years
+
+FEATURE_FIELDS = ('bathrooms', 'bedrooms', 'property_type_detail', 'completion_year', 'status')
+
+
+def field_group(name, patterns):
+    """One optional group of zero-width lookaheads, one branch per pattern.
+
+    Every branch is tried from the start of the text in list order, so the
+    first pattern that matches anywhere wins - the same priority the old
+    loop of re.search calls had - but all fields come out of a single
+    compiled regex. The capture of branch i is the named group <name>_<i>.
+    """
+    branches = []
+    for i, pattern in enumerate(patterns):
+        if '(' in pattern:
+            pattern = pattern.replace('(', f'(?P<{name}_{i}>', 1)
+        else:
+            pattern = f'(?P<{name}_{i}>{pattern})'
+        branches.append(f'(?=.*?{pattern})')
+    return f"(?:{'|'.join(branches)})?"
+
+
+# Features block (lower-cased): every field in one anchored match
+FEATURES_RE = re.compile('^' + ''.join([
+    field_group('bathrooms', BATHROOM_PATTERNS),
+    field_group('bedrooms', BEDROOM_PATTERNS),
+    field_group('property_type_detail', TYPE_PATTERNS),
+    field_group('completion_year', [YEAR_PATTERN]),
+    field_group('status', STATUS_PATTERNS),
+]), re.DOTALL)
+
+ENERGY_RE = re.compile('^' + field_group('energy_certificate', ENERGY_PATTERNS), re.DOTALL | re.IGNORECASE)
+TYPE_RE = re.compile('^' + field_group('property_type_detail', TYPE_PATTERNS), re.DOTALL)
+
+
+def first_group(groups, name):
+    """Capture of the first branch of field `name` that matched, or None"""
+    for key, value in groups.items():
+        if value is not None and key.rsplit('_', 1)[0] == name:
+            return value
+    return None
+
+
+def as_year(value):
+    if value is None:
+        return None
+    year = int(value)
+    return year if MIN_YEAR < year < MAX_YEAR else None
+
+
+def match_type(text):
+    """First TYPE_PATTERNS entry found in text (e.g. a card title), or None"""
+    return first_group(TYPE_RE.match(text.lower()).groupdict(), 'property_type_detail') if text else None
+
+
+def extract_energy(*texts):
+    """Energy certificate from the first text that mentions one"""
+    for text in texts:
+        if text:
+            value = first_group(ENERGY_RE.match(text).groupdict(), 'energy_certificate')
+            if value is not None:
+                return value
+    return None
+
+
+def extract_features(features_text, description='', extra_text=''):
+    """Bedrooms, bathrooms, type, year, status and energy certificate of one listing"""
+    features = dict.fromkeys(FEATURE_FIELDS)
+    if features_text:
+        groups = FEATURES_RE.match(features_text.lower()).groupdict()
+        for name in FEATURE_FIELDS:
+            features[name] = first_group(groups, name)
+        for name in ('bathrooms', 'bedrooms'):
+            if features[name] is not None:
+                features[name] = int(features[name])
+        features['completion_year'] = as_year(features['completion_year'])
+
+    # Energy certificate: description first, then the rest of the page text
+    features['energy_certificate'] = extract_energy(description, extra_text)
+    return features
+
+
+def coalesce_groups(frame, name):
+    """Per row, the capture of the first matching branch of field `name`"""
+    columns = [c for c in frame.columns if c.rsplit('_', 1)[0] == name]
+    values = frame[columns[0]]
+    for column in columns[1:]:
+        values = values.combine_first(frame[column])
+    return values
+
+
+def extract_features_frame(features_text, description=None, extra_text=None):
+    """extract_features() over whole pandas Series at once (str.extract), e.g. to backfill old runs
+
+    Returns a DataFrame with FEATURE_FIELDS + energy_certificate, aligned on features_text's index.
+    """
+    import pandas as pd
+
+    groups = features_text.fillna('').astype(str).str.lower().str.extract(FEATURES_RE)
+    result = pd.DataFrame(index=features_text.index)
+    for name in FEATURE_FIELDS:
+        result[name] = coalesce_groups(groups, name)
+    for name in ('bathrooms', 'bedrooms'):
+        result[name] = pd.to_numeric(result[name]).astype('Int64')
+    year = pd.to_numeric(result['completion_year']).astype('Int64')
+    result['completion_year'] = year.where((year > MIN_YEAR) & (year < MAX_YEAR))
+
+    energy = pd.Series(None, index=features_text.index, dtype=object)
+    for texts in (description, extra_text):
+        if texts is None:
+            continue
+        found = coalesce_groups(texts.fillna('').astype(str).str.extract(ENERGY_RE), 'energy_certificate')
+        energy = energy.combine_first(found)
+    result['energy_certificate'] = energy
+    return result
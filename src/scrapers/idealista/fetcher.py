@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+import requests
+from requests.adapters import HTTPAdapter
+from selenium.webdriver.common.by import By
+
+from src.scrapers.idealista.block_detector import (
+    BLOCKING, CHALLENGE_MARKERS, CHALLENGE_STATUSES, DETAIL_PAGE_MARKER, EMPTY, GONE, SEARCH_PAGE_MARKER,
+    SERVED, UNRECOGNIZED, PageBlocked, classify_page
+)
+from src.scrapers.idealista.browser import USER_AGENT, wait_for_element
+from src.scrapers.idealista.metrics import METRICS
+
+log = logging.getLogger('scraper.fetcher')
+
+
+class BrowserRequired(Exception):
+    """The page needs a real browser but the fetcher has no driver"""
+
+
+@dataclass
+class FetchResult:
+    url: str
+    html: str
+    status: int
+    via: str
+    elapsed: float
+    verdict: str = SERVED
+
+
+@dataclass
+class FetcherStats:
+    http_hits: int = 0
+    browser_fallbacks: int = 0
+    http_errors: int = 0
+    http_bytes: int = 0
+    browser_bytes: int = 0
+    http_seconds: float = 0.0
+    browser_seconds: float = 0.0
+
+    def to_dict(self):
+        data = asdict(self)
+        data['http_avg_latency'] = self.http_seconds / self.http_hits if self.http_hits else 0.0
+        data['browser_avg_latency'] = self.browser_seconds / self.browser_fallbacks if self.browser_fallbacks else 0.0
+        return data
+
+
+class PageFetcher:
+    """
+    HTTP-first page fetcher.
+    - Tries a pooled keep-alive requests.Session with the browser's user agent and cookies
+    - Falls back to the Selenium driver only for challenges / JS-only responses
+    - Keeps FetcherStats (HTTP hits vs browser fallbacks, bytes, latency)
+    - Every request, HTTP or browser, is paced by the shared HostRateScheduler
+    - Every loaded page is classified (block_detector); challenge/block pages raise PageBlocked
+      at once instead of waiting for selectors, and feed the shared CircuitBreaker
+    """
+    def __init__(self, driver=None, user_agent=USER_AGENT, pool_size=10, timeout=15, scheduler=None, breaker=None):
+        self.driver = driver
+        self.scheduler = scheduler
+        self.breaker = breaker
+        self.timeout = timeout
+        self.stats = FetcherStats()
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': user_agent,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9,pt;q=0.8',
+        })
+        self.sync_cookies_from_driver()
+
+    def sync_cookies_from_driver(self):
+        """Copy the browser's cookies (e.g. a solved challenge) into the HTTP session"""
+        if self.driver is None:
+            return
+        try:
+            for cookie in self.driver.get_cookies():
+                self.session.cookies.set(
+                    cookie['name'], cookie['value'],
+                    domain=cookie.get('domain'), path=cookie.get('path', '/')
+                )
+        except Exception as e:
+            log.warning(f"Could not copy driver cookies: {e}")
+
+    def is_challenge(self, status, html):
+        return status in CHALLENGE_STATUSES or any(marker in html for marker in CHALLENGE_MARKERS)
+
+    def reset(self, driver=None):
+        """Start over with a fresh cookie jar (and a new driver) after a block"""
+        self.driver = driver
+        self.session.cookies.clear()
+        self.sync_cookies_from_driver()
+
+    def pace(self, url):
+        if self.breaker is not None:
+            self.breaker.before_request(url)
+        if self.scheduler is not None:
+            self.scheduler.wait(url)
+
+    def feedback(self, url, elapsed=None, blocked=False):
+        if self.scheduler is not None:
+            self.scheduler.record(url, elapsed, blocked=blocked)
+
+    def verdict(self, url, verdict):
+        """Report a final page verdict to the breaker; challenge/block pages raise PageBlocked"""
+        if self.breaker is not None:
+            self.breaker.record(url, verdict)
+        else:
+            METRICS.inc('pages', verdict=verdict)
+        if verdict in BLOCKING:
+            raise PageBlocked(url, verdict)
+
+    def fetch_http(self, url):
+        self.pace(url)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            self.feedback(url, time.perf_counter() - start, blocked=True)
+            METRICS.inc('http_errors')
+            raise
+        elapsed = time.perf_counter() - start
+        METRICS.observe('page_load', elapsed, via='http')
+        self.feedback(url, elapsed, blocked=self.is_challenge(response.status_code, response.text))
+        return response.status_code, response.text, len(response.content), elapsed
+
+    def fetch_browser(self, url, wait_selector=None, required_marker=None):
+        if self.driver is None:
+            raise BrowserRequired(url)
+        self.pace(url)
+        start = time.perf_counter()
+        with METRICS.timer('page_load', via='browser'):
+            self.driver.get(url)
+        wait_for_element(self.driver, "body", 20, by=By.TAG_NAME)
+        html = self.driver.page_source
+        verdict = classify_page(html, 200, required_marker)
+        # Only a page that is neither done nor a block/challenge page is worth waiting for
+        if wait_selector and verdict == UNRECOGNIZED:
+            try:
+                wait_for_element(self.driver, wait_selector, 10)
+            except Exception:
+                pass
+            html = self.driver.page_source
+            verdict = classify_page(html, 200, required_marker)
+        elapsed = time.perf_counter() - start
+        # Render time isn't comparable to the HTTP latency target; only report blocks
+        self.feedback(url, None, blocked=verdict in BLOCKING)
+        return html, elapsed, verdict
+
+    def fetch(self, url, required_marker=None, wait_selector=None):
+        """Return a FetchResult, from HTTP when possible, from the browser otherwise
+
+        Raises PageBlocked when the final answer is a challenge or block page.
+        """
+        try:
+            status, html, size, elapsed = self.fetch_http(url)
+            verdict = classify_page(html, status, required_marker)
+            # Empty searches and removed listings are final answers too, no browser needed
+            if verdict in (SERVED, EMPTY, GONE):
+                with self.lock:
+                    self.stats.http_hits += 1
+                    self.stats.http_bytes += size
+                    self.stats.http_seconds += elapsed
+                self.verdict(url, verdict)
+                return FetchResult(url=url, html=html, status=status, via='http', elapsed=elapsed, verdict=verdict)
+        except requests.RequestException as e:
+            log.warning(f"HTTP fetch failed for {url}: {e}")
+            with self.lock:
+                self.stats.http_errors += 1
+
+        html, elapsed, verdict = self.fetch_browser(url, wait_selector, required_marker)
+        with self.lock:
+            self.stats.browser_fallbacks += 1
+            self.stats.browser_bytes += len(html.encode('utf-8'))
+            self.stats.browser_seconds += elapsed
+        self.verdict(url, verdict)
+        self.sync_cookies_from_driver()
+        return FetchResult(url=url, html=html, status=200, via='browser', elapsed=elapsed, verdict=verdict)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,207 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+KINDS = ('pages', 'listings')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS {kind} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT UNIQUE NOT NULL,
+    operation TEXT,
+    property_type TEXT,
+    city TEXT,
+    page INTEGER,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at TEXT,
+    lease_owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS {kind}_state ON {kind} (state, id);
+"""
+
+# Columns added after the first runs; frontiers of older runs get them on open
+LEASE_COLUMNS = (('lease_owner', 'TEXT'), ('lease_expires', 'REAL'))
+
+
+class CrawlFrontier:
+    """
+    Persistent crawl frontier backed by SQLite.
+    - pages: search result pages, listings: detail URLs
+    - Every URL moves pending -> in_flight -> done | failed
+    - recover() puts in_flight URLs back to pending after a crash, so a run resumes where it stopped
+    - With lease_seconds, a claim is a lease held by worker_id: several processes can share
+      the file, and a URL whose lease runs out (worker died) is claimed again by the next
+      claim() of any worker, as another attempt. Implements WorkQueue (work_queue.py)
+    """
+    def __init__(self, path, max_attempts=3, worker_id=None, lease_seconds=None):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        # Other processes may hold the write lock for a moment
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for kind in KINDS:
+            self.conn.executescript(SCHEMA.format(kind=kind))
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({kind})")}
+            for column, column_type in LEASE_COLUMNS:
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE {kind} ADD COLUMN {column} {column_type}")
+
+    def now(self):
+        return datetime.now().isoformat()
+
+    def add(self, kind, url, operation='', property_type='', city='', page=None):
+        """Queue a URL; already known URLs keep their state. Returns True if it was new"""
+        with self.lock:
+            cursor = self.conn.execute(
+                f"INSERT OR IGNORE INTO {kind} (url, operation, property_type, city, page, state, updated_at) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, operation, property_type, city, page, PENDING, self.now())
+            )
+            return cursor.rowcount == 1
+
+    def add_many(self, kind, urls, operation='', property_type='', city='', pages=None):
+        """Queue many URLs in one transaction (pages: their page numbers); returns how many were new"""
+        pages = pages or [None] * len(urls)
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO {kind} (url, operation, property_type, city, page, state, updated_at) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(url, operation, property_type, city, page, PENDING, self.now()) for url, page in zip(urls, pages)]
+            )
+            self.conn.execute("COMMIT")
+            return self.conn.total_changes - before
+
+    def has(self, kind, url):
+        with self.lock:
+            return self.conn.execute(f"SELECT 1 FROM {kind} WHERE url = ?", (url,)).fetchone() is not None
+
+    def lease_expiry(self):
+        return time.time() + self.lease_seconds if self.lease_seconds else None
+
+    def claim(self, kind):
+        """Oldest pending URL of `kind` as a dict, marked in_flight; None when nothing is pending
+
+        Expired leases go back to pending first (failed once out of attempts).
+        BEGIN IMMEDIATE makes select + update atomic across processes too.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = self.now()
+                self.conn.execute(
+                    f"UPDATE {kind} SET state = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                    f"error = 'lease expired', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                    f"WHERE state = ? AND lease_expires < ?",
+                    (self.max_attempts, PENDING, FAILED, now, IN_FLIGHT, time.time())
+                )
+                row = self.conn.execute(
+                    f"SELECT id, url, operation, property_type, city, page, attempts FROM {kind} "
+                    f"WHERE state = ? ORDER BY id LIMIT 1",
+                    (PENDING,)
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        f"UPDATE {kind} SET state = ?, attempts = attempts + 1, lease_owner = ?, "
+                        f"lease_expires = ?, updated_at = ? WHERE id = ?",
+                        (IN_FLIGHT, self.worker_id, self.lease_expiry(), now, row[0])
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        keys = ('id', 'url', 'operation', 'property_type', 'city', 'page', 'attempts')
+        item = dict(zip(keys, row))
+        item['attempts'] += 1
+        return item
+
+    def extend_leases(self):
+        """Push back the expiry of every lease this worker holds; returns how many"""
+        if not self.lease_seconds:
+            return 0
+        renewed = 0
+        with self.lock:
+            for kind in KINDS:
+                cursor = self.conn.execute(
+                    f"UPDATE {kind} SET lease_expires = ? WHERE state = ? AND lease_owner IS ?",
+                    (self.lease_expiry(), IN_FLIGHT, self.worker_id)
+                )
+                renewed += cursor.rowcount
+        return renewed
+
+    def mark_done(self, kind, url):
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE {kind} SET state = ?, error = NULL, lease_owner = NULL, lease_expires = NULL, "
+                f"updated_at = ? WHERE url = ?",
+                (DONE, self.now(), url)
+            )
+
+    def mark_failed(self, kind, url, error='', retry=True):
+        """Back to pending while attempts remain (and retry is allowed), failed afterwards
+
+        Only URLs in flight under this worker's lease are affected, so a URL already
+        failed for good stays failed and one re-leased by another worker keeps running.
+        """
+        max_attempts = self.max_attempts if retry else 0
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE {kind} SET state = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                f"error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                f"WHERE url = ? AND state = ? AND lease_owner IS ?",
+                (max_attempts, PENDING, FAILED, str(error)[:500], self.now(), url, IN_FLIGHT, self.worker_id)
+            )
+
+    def requeue(self, kind, url):
+        """Back to pending without counting the attempt (the page was blocked, not broken)"""
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE {kind} SET state = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, "
+                f"lease_expires = NULL, updated_at = ? WHERE url = ? AND state = ? AND lease_owner IS ?",
+                (PENDING, self.now(), url, IN_FLIGHT, self.worker_id)
+            )
+
+    def recover(self):
+        """Requeue everything left in_flight by a crashed or killed run
+
+        A shared frontier (worker_id set) only takes back this worker's own
+        URLs; those of other workers come back when their leases expire.
+        """
+        owner = "" if self.worker_id is None else " AND lease_owner = ?"
+        params = () if self.worker_id is None else (self.worker_id,)
+        recovered = 0
+        with self.lock:
+            for kind in KINDS:
+                cursor = self.conn.execute(
+                    f"UPDATE {kind} SET state = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                    f"WHERE state = ?{owner}",
+                    (PENDING, self.now(), IN_FLIGHT) + params
+                )
+                recovered += cursor.rowcount
+        return recovered
+
+    def counts(self):
+        with self.lock:
+            return {
+                kind: dict(self.conn.execute(f"SELECT state, COUNT(*) FROM {kind} GROUP BY state").fetchall())
+                for kind in KINDS
+            }
+
+    def close(self):
+        self.conn.close()
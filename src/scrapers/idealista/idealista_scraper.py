@@ -1,25 +1,38 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 import sys
 import os
 import logging
-import logging.config
-import yaml
 import json
 import time
-import random
-import csv
+import argparse
 from datetime import datetime
-from urllib.parse import urljoin
-import re
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
 
+from src.scrapers.idealista.listing_parser import (
+    RECORD_FIELDS, ListingRecord, parse_listing_html
+)
+from src.scrapers.idealista.search_parser import next_page_url, parse_search_page
+from src.scrapers.idealista.fetcher import DETAIL_PAGE_MARKER, SEARCH_PAGE_MARKER, PageFetcher
+from src.scrapers.idealista.block_detector import GONE, SERVED, CircuitBreaker, PageBlocked
+from src.scrapers.idealista.browser import browser_rss_mb, create_chrome_driver, wait_for_element
+from src.scrapers.idealista.worker_pool import DetailWorkerPool
+from src.scrapers.idealista.rate_limiter import HostRateScheduler
+from src.scrapers.idealista.settings import load_scraping_config
+from src.scrapers.idealista.listing_index import ListingIndex
+from src.scrapers.idealista.page_archive import PageArchive, page_key
+from src.scrapers.idealista.output_sink import OutputSink
+from src.scrapers.idealista.description_log import DescriptionLog
+from src.scrapers.idealista.metrics import METRICS
+from src.scrapers.idealista.paginator import enumerate_pages, page_url, plan_pages
+from src.scrapers.idealista.structured_log import log_event, logging_stats, setup_logging
+from src.scrapers.idealista.work_queue import (
+    SHARDS_DIR, LeaseKeeper, default_worker_id, is_drained, merge_shards, open_work_queue, shard_path
+)
+
+detail_log = logging.getLogger('scraper.detail')
+debug_log = logging.getLogger('scraper.debug')
+
 class IdealistaScraperCSV:
     """
     Selenium-based scraper for Idealista real estate listings (Portugal).
@@ -27,93 +40,47 @@ class IdealistaScraperCSV:
     - Handles anti-bot detection and pagination
     - Outputs structured CSV files under data/bronze/idealista/
     """ 
-    def setup_logger(self, site_name="idealista"):
-        """Setup logger with dynamic file paths per site"""
+    def setup_logger(self, site_name="idealista", debug=None):
+        """Structured logging from config/logging_config.yaml, written by a background thread"""
         try:
-            # 1. Сначала создаем папки
-            os.makedirs("logs/scraping", exist_ok=True)
-            os.makedirs("logs/errors", exist_ok=True)
-            
-            # 2. Создаем логгер с нуля вместо использования конфига
-            self.logger = logging.getLogger(f'scraper_{site_name}')
-            self.logger.setLevel(logging.INFO)
-            
-            # Очищаем старые обработчики
-            for handler in self.logger.handlers[:]:
-                self.logger.removeHandler(handler)
-            
-            # 3. Создаем форматтер
-            formatter = logging.Formatter(
-                '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-            )
-            
-            # 4. Обработчик для основного лога
-            scraping_handler = logging.FileHandler(
-                f"logs/scraping/{site_name}.log", 
-                encoding='utf-8'
-            )
-            scraping_handler.setLevel(logging.INFO)
-            scraping_handler.setFormatter(formatter)
-            self.logger.addHandler(scraping_handler)
-            
-            # 5. Обработчик для ошибок
-            error_handler = logging.FileHandler(
-                f"logs/errors/{site_name}_errors.log", 
-                encoding='utf-8'
-            )
-            error_handler.setLevel(logging.ERROR)
-            error_handler.setFormatter(formatter)
-            self.logger.addHandler(error_handler)
-            
-            # 6. Консольный обработчик для отладки
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging.INFO)
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
-            
-            # Тестовое сообщение
-            self.logger.info(f"Logger setup completed for {site_name}")
-            
+            self.debug = setup_logging(site_name=site_name, debug=debug)
         except Exception as e:
-            # Простой fallback
+            # Plain console logging rather than no logging at all
             print(f"Error setting up logger: {e}")
-            self.logger = logging.getLogger('scraper_fallback')
-            if not self.logger.handlers:
-                handler = logging.StreamHandler()
-                handler.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
-                self.logger.addHandler(handler)
-                self.logger.setLevel(logging.INFO)
-            self.logger.error(f"Failed to setup proper logger: {e}")
-    def __init__(self, site_name="idealista"):
+            logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(name)s - %(message)s')
+            self.debug = bool(debug)
+        self.logger = logging.getLogger('scraper.crawl')
+        log_event(self.logger, 'logger.ready', f"Logger setup completed for {site_name}", debug=self.debug)
+
+    def __init__(self, site_name="idealista", debug=None):
         # Сначала настраиваем логгер
-        self.setup_logger(site_name=site_name)
+        self.setup_logger(site_name=site_name, debug=debug)
         
         # Потом загружаем конфиги (они используют уже настроенный логгер)
         self.load_configs()
         self.load_mapping()
+        self.config = load_scraping_config()
+        self.scheduler = HostRateScheduler.from_config(self.config)
+        self.breaker = CircuitBreaker.from_config(self.config)
         
         # Остальное без изменений
         self.setup_selenium()
-        self.csv_file = None
-        self.csv_writer = None
+        self.fetcher = PageFetcher(self.driver, scheduler=self.scheduler, breaker=self.breaker)
+        self.sink = None
+        self.frontier = None
+        self.index = None
+        self.archive = None
+        self.descriptions = None
+        self.worker_id = None
+        self.lease_keeper = None
      
     def setup_selenium(self):
         """Configure Selenium WebDriver - FIXED JAVASCRIPT ERROR"""
-        chrome_options = Options()
-        chrome_options.add_argument('--headless=new')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        chrome_options.add_argument('--disable-extensions')
-        chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+        self.driver = self.new_driver()
     
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        
-        # FIXED JavaScript - removed arrow function
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: function() { return undefined; }})")
+    def new_driver(self):
+        """Chrome with the browser section of scraping_config.yaml (lean mode, caps, cached driver)"""
+        return create_chrome_driver(browser_config=self.config['browser'])
     
     def load_configs(self):
         """Load main configurations"""
@@ -165,159 +132,184 @@ class IdealistaScraperCSV:
             city_pt = self.mapping['cities'].get(city, city)
             
             url_path = f"{op_pt}-{prop_pt}"
-            """self.logger.info(f"URL built successfully: {url}")"""
-            return f"https://www.idealista.pt/en/comprar-casas/lisboa/"
+            return f"{self.config['base_url']}/en/{url_path}/{city_pt}/"
         except Exception as e:
-            print(f"Error building URL: {e}")
             self.logger.error(f"Error building URL: {e}")
-            return f"https://www.idealista.pt/en/comprar-casas/lisboa/"
+            return None
     
-    def setup_csv(self):
-        """Initialize CSV file with headers"""
-        csv_path = f"{self.run_path}/idealista_data.csv"
-        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    def setup_output(self, append=False):
+        """Start the background output sink (append=True continues a resumed run's output)"""
+        output = self.config['output']
+        self.sink = OutputSink(
+            self.run_path, fmt=output['format'], chunk_rows=output['chunk_rows'],
+            flush_interval=output['flush_interval'], append=append
+        )
+        self.logger.info(f"Output ({output['format']}) in {self.run_path}, manifest: {self.sink.manifest_path}")
+        return self.sink.manifest_path
+    
+    def close_output(self):
+        """Write the last chunk and close the manifest"""
+        if self.sink:
+            stats = self.sink.close()
+            self.sink = None
+            self.logger.info(f"Output closed: {stats}")
+    
+    def extract_listing_cards(self, operation='', property_type='', city='', html=None):
+        """Parse every article.item card of a search page (fetched HTML or the driver's page_source)"""
+        if html is None:
+            try:
+                # Wait for listing containers to load
+                wait_for_element(self.driver, "article.item", 15)
+            except Exception as e:
+                log_event(self.logger, 'page.no_containers', f"Listing containers not found: {e}", logging.WARNING)
+                return []
+            html = self.driver.page_source
         
-        self.csv_file = open(csv_path, 'w', newline='', encoding='utf-8')
-        self.csv_writer = csv.writer(self.csv_file)
+        cards = parse_search_page(
+            html, base_url=self.config['base_url'],
+            operation=operation, property_type=property_type, city=city
+        )
+        log_event(self.logger, 'page.parsed', "Listing cards parsed", logging.DEBUG, cards=len(cards))
+        return cards
+    
+    def extract_listing_links_simple(self, html=None):
+        """Find listings through article.item containers - RELIABLE VERSION"""
+        links = [card.url for card in self.extract_listing_cards(html=html)]
+        if links and debug_log.isEnabledFor(logging.DEBUG):
+            log_event(debug_log, 'page.links', "Links extracted from containers", logging.DEBUG, links=len(links),
+                      regular=sum(1 for link in links if '/imovel/' in link),
+                      developments=sum(1 for link in links if '/empreendimento/' in link))
         
-        headers = [
-            'listing_id', 'url', 'scraped_at', 'operation', 'property_type', 'city',
-            'title', 'price', 'area', 'bedrooms', 'bathrooms', 'location',
-            'description', 'property_type_detail', 'update_date', 
-            'agency', 'energy_certificate'
-        ]
+        return links
+    
+    def select_detail_urls(self, cards, full_refresh=False):
+        """Detail URLs of the cards the listing index reports as new or changed"""
+        detail_urls = []
+        for card in cards:
+            needs_detail = True
+            if self.index is not None:
+                _, needs_detail = self.index.classify(card)
+                self.index.observe(card)
+            if needs_detail or full_refresh:
+                detail_urls.append(card.url)
+        return detail_urls
+    
+    def process_cards_page(self, operation, property_type, city, detail_changed=False, html=None):
+        """Save all cards of the loaded search page; with detail_changed new/changed ids go to detail URLs instead"""
+        cards = self.extract_listing_cards(operation, property_type, city, html=html)
+        scraped_at = datetime.now().isoformat()
+        # Classify every card so the index and freshness stats stay current in pure cards runs too
+        changed_urls = self.select_detail_urls(cards)
+        detail_urls = set(changed_urls) if detail_changed else set()
+        saved = 0
+        
+        for card in cards:
+            if card.url in detail_urls:
+                continue
+            card.scraped_at = scraped_at
+            if self.save_record(card):
+                saved += 1
         
-        self.csv_writer.writerow(headers)
-        self.logger.info(f"CSV created: {csv_path}")
-        return csv_path
+        log_event(self.logger, 'page.cards_saved', "Cards saved", logging.DEBUG, saved=saved, detail=len(detail_urls))
+        return cards, saved, [card.url for card in cards if card.url in detail_urls]
     
-    def close_csv(self):
-        """Close CSV file properly"""
-        if self.csv_file:
-            self.csv_file.close()
-            self.logger.info("CSV file closed")
+    def get_next_page(self, page):
+        """Next search page URL: read from the fetched HTML, via the driver waits only when it has no pagination bar"""
+        if page.via == 'http' or 'class="pagination"' in page.html:
+            return next_page_url(page.html, self.config['base_url'])
+        return self.get_next_page_reliable()
     
-    def extract_listing_links_simple(self):
-        """Find listings through article.item containers - RELIABLE VERSION"""
-        try:
-            # Wait for listing containers to load
-            WebDriverWait(self.driver, 15).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "article.item"))
-            )
-            
-            # 1. First find ALL listing containers
-            article_containers = self.driver.find_elements(By.CSS_SELECTOR, "article.item")
-            print(f"Found listing containers (article.item): {len(article_containers)}")
-            
-            links = []
-            
-            # 2. Extract link from each container
-            for article in article_containers:
-                try:
-                    # Find link inside container
-                    link_element = article.find_element(By.CSS_SELECTOR, "a.item-link")
-                    href = link_element.get_attribute('href')
-                    
-                    if href:
-                        if href.startswith('/'):
-                            absolute_url = urljoin("https://www.idealista.pt", href)
-                            links.append(absolute_url)
-                        else:
-                            links.append(href)
-                            
-                except Exception as e:
-                    # If one container doesn't have link - skip
-                    continue
-            
-            print(f"Links extracted from containers: {len(links)}")
-            
-            # DEBUG: show types of found links
-            if links:
-                imovel_count = sum(1 for link in links if '/imovel/' in link)
-                empreendimento_count = sum(1 for link in links if '/empreendimento/' in link)
-                print(f"Regular listings: {imovel_count}")
-                print(f"New developments: {empreendimento_count}")
-                
-                # Show examples
-                for i, link in enumerate(links[:2]):
-                    print(f"   Example {i+1}: {link}")
-            
-            return links
-            
-        except Exception as e:
-            print(f"Error extracting links through containers: {e}")
-            return []
+    def queue_more_pages(self, item, page, cards, max_pages=100):
+        """Queue the rest of a search: every page up front from page 1's result count, else the next link"""
+        operation, property_type, city = item['operation'], item['property_type'], item['city']
+        search = (operation, property_type, city)
+        if item['page'] == 1:
+            plan = plan_pages(page.html, len(cards))
+            if plan is not None:
+                self.page_plans[search] = plan
+                pages = enumerate_pages(item['url'], plan, max_pages)
+                queued = self.frontier.add_many(
+                    'pages', [url for _, url in pages], operation, property_type, city,
+                    pages=[number for number, _ in pages]
+                )
+                log_event(self.logger, 'search.planned', "Pagination planned", pages=plan.pages,
+                          results=plan.results, source=plan.source, queued=queued, url=item['url'])
+                return queued
+        elif search in self.page_plans or self.frontier.has('pages', page_url(item['url'], item['page'] + 1)):
+            # Enumerated from page 1 (also in an earlier session of a resumed run)
+            return 0
+        
+        # Fallback: no count on page 1, walk the "Next" links one page at a time
+        next_url = self.get_next_page(page)
+        if next_url and next_url != item['url'] and item['page'] < max_pages:
+            self.frontier.add('pages', next_url, operation, property_type, city, page=item['page'] + 1)
+            log_event(self.logger, 'search.next_page', "Queued next page", logging.DEBUG, page=item['page'] + 1)
+            return 1
+        log_event(self.logger, 'search.done', "Pagination completed or page limit reached", logging.DEBUG,
+                  url=item['url'], page=item['page'])
+        return 0
     
     def get_next_page_reliable(self):
         try:
-            print("next page search...")
+            debug_log.debug("next page search...")
             
             try:
-                next_element = WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "li.next a"))
-                )
+                next_element = wait_for_element(self.driver, "li.next a", 10)
                 href = self.driver.execute_script('return arguments[0].getAttribute("href")', next_element)
                 
                 if href:
-                    print(f"next page is found: {href}")
+                    debug_log.debug(f"next page is found: {href}")
                     if href.startswith('/'):
-                        return "https://www.idealista.pt" + href
+                        return self.config['base_url'] + href
                     return href
                     
             except Exception as e:
-                print(f"first selector has is not working: {e}")
+                debug_log.debug(f"first selector has is not working: {e}")
             
             # trying alternative selector
             try:
-                next_element = WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "a.icon-arrow-right-after"))
-                )
+                next_element = wait_for_element(self.driver, "a.icon-arrow-right-after", 5)
                 href = self.driver.execute_script('return arguments[0].getAttribute("href")', next_element)
                 
                 if href:
-                    print(f"next page is found (alternative selector): {href}")
+                    debug_log.debug(f"next page is found (alternative selector): {href}")
                     if href.startswith('/'):
-                        return "https://www.idealista.pt" + href
+                        return self.config['base_url'] + href
                     return href
                     
             except Exception as e:
-                print(f"alternative selector did not work: {e}")
+                debug_log.debug(f"alternative selector did not work: {e}")
             
             # text search
             try:
-                next_element = WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.XPATH, "//a[contains(text(), 'Next') or contains(text(), 'Seguinte')]"))
+                next_element = wait_for_element(
+                    self.driver, "//a[contains(text(), 'Next') or contains(text(), 'Seguinte')]", 5, by=By.XPATH
                 )
                 href = self.driver.execute_script('return arguments[0].getAttribute("href")', next_element)
                 
                 if href:
-                    print(f"next page is found in text: {href}")
+                    debug_log.debug(f"next page is found in text: {href}")
                     if href.startswith('/'):
-                        return "https://www.idealista.pt" + href
+                        return self.config['base_url'] + href
                     return href
                     
             except Exception as e:
-                print(f"in text did not work: {e}")
+                debug_log.debug(f"in text did not work: {e}")
             
-            print("could not find the next page")
+            self.logger.info("could not find the next page")
             return None
             
         except Exception as e:
-            print(f"general pafination mistake: {e}")
+            self.logger.warning(f"general pafination mistake: {e}")
             return None
     
     def debug_page_content(self, url):
-        """Debug method to see what's on the page"""
+        """Debug method to see what's on the page (only with --debug: one driver round trip per selector)"""
+        if not self.debug:
+            return
         try:
-            print(f"PAGE DEBUG: {url}")
-            
-            # Check page title
-            title = self.driver.title
-            print(f"   Page title: {title}")
-            
-            # Check if it's a new development page
-            if 'empreendimento' in url:
-                print("   This is a new development page (empreendimento)")
+            # Check page title, and if it's a new development page
+            found = {}
             
             # Try to find any price elements
             price_selectors = ["[class*='price']", "[class*='Price']", ".price", ".preco"]
@@ -325,297 +317,67 @@ class IdealistaScraperCSV:
                 try:
                     elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
                     if elements:
-                        print(f"   Found elements with selector '{selector}': {len(elements)}")
-                        for i, elem in enumerate(elements[:2]):
-                            print(f"     Element {i+1}: {elem.text[:50]}...")
+                        found[selector] = {'count': len(elements), 'first': [elem.text[:50] for elem in elements[:2]]}
                 except:
                     pass
+            log_event(debug_log, 'page.debug', "PAGE DEBUG", logging.DEBUG, url=url, title=self.driver.title,
+                      development='empreendimento' in url, price_elements=found)
                     
         except Exception as e:
-            print(f"Debug error: {e}")
+            debug_log.warning(f"Debug error: {e}")
     
     def extract_listing_data(self, url, operation, property_type, city):
         """Extract structured data from listing page - IMPROVED VERSION"""
-        try:
-            print(f"Processing listing: {url}")
-            self.driver.get(url)
-            
-            # Wait for page load
-            WebDriverWait(self.driver, 20).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            time.sleep(random.uniform(3, 5))
-            
-            # Debug page content
-            self.debug_page_content(url)
-            
-            # Extract listing ID from URL
-            listing_id = url.split('/')[-2] if '/' in url else f"temp_{hash(url)}"
-            
-            # Initialize data dictionary
-            data = {
-                'listing_id': listing_id,
-                'url': url,
-                'scraped_at': datetime.now().isoformat(),
-                'operation': operation,
-                'property_type': property_type,
-                'city': city
-            }
-            
-            # Extract basic info
-            data.update(self.extract_basic_info())
-            
-            # Save to CSV
-            self.save_to_csv(data)
-            print(f"Data saved: {data.get('title', 'N/A')}")
-            
-            return True
-            
-        except Exception as e:
-            print(f"Error processing {url}: {e}")
-            return False
-
-    def extract_features_from_details(self, description=''):
-        """IMPROVED version - extracts all features using JavaScript"""
-        features_data = {
-            'bathrooms': None,
-            'bedrooms': None,
-            'property_type_detail': None,
-            'completion_year': None,
-            'status': None,
-            'energy_certificate': None,
-            'update_date': None,
-            'agency': None
-        }
-        
-        try:
-            # 1. Search ALL elements with features using JavaScript
-            features_text = self.safe_extract_text_js(".details-property_features") or \
-                        self.safe_extract_text_js(".info-features") or \
-                        self.safe_extract_text_js(".details-property")
-            
-            if not features_text:
-                print("   Features block not found")
-                # Continue execution for other fields
-            else:
-                text_lower = features_text.lower()
-                print(f"   Features text: '{features_text}'")
-                
-                # 2. BATHROOMS - improved search
-                bathroom_patterns = [
-                    r'(\d+)\s*bathroom',
-                    r'(\d+)\s*banho',
-                    r'(\d+)\s*casa de banho',
-                    r'(\d+)\s*wc',
-                    r'(\d+)\s*bath'
-                ]
-                
-                for pattern in bathroom_patterns:
-                    match = re.search(pattern, text_lower)
-                    if match:
-                        features_data['bathrooms'] = int(match.group(1))
-                        print(f"   Bathrooms found: {features_data['bathrooms']}")
-                        break
-                
-                # 3. BEDROOMS - improved search
-                bedroom_patterns = [
-                    r'(\d+)\s*bedroom', 
-                    r'(\d+)\s*quarto',
-                    r't(\d+)',  # T3, T2 etc.
-                    r'(\d+)\s*quartos',
-                    r'(\d+)\s*room',
-                    r'(\d+)\s*hab'
-                ]
-                
-                for pattern in bedroom_patterns:
-                    match = re.search(pattern, text_lower)
-                    if match:
-                        features_data['bedrooms'] = int(match.group(1))
-                        print(f"   Bedrooms found: {features_data['bedrooms']}")
-                        break
-                
-                # 4. ADDITIONAL CHARACTERISTICS
-                # Property type (apartment, house, etc.)
-                type_patterns = [
-                    r'terraced house', r'apartment', r'studio', r'villa', 
-                    r'house', r'flat', r'penthouse'
-                ]
-                
-                for pattern in type_patterns:
-                    if re.search(pattern, text_lower):
-                        features_data['property_type_detail'] = pattern.replace('_', ' ')
-                        print(f"   Property type: {features_data['property_type_detail']}")
-                        break
-                
-                # 5. CONSTRUCTION YEAR / DELIVERY DATE
-                year_match = re.search(r'(\d{4})', features_text)
-                if year_match:
-                    year = int(year_match.group(1))
-                    if 1900 < year < 2030:  # Realistic range
-                        features_data['completion_year'] = year
-                        print(f"   Completion year: {features_data['completion_year']}")
-                
-                # 6. STATUS (new, renovated, etc.)
-                status_patterns = [
-                    r'new build', r'new construction', r'renovated', r'to renovate',
-                    r'new home', r'brand new'
-                ]
-                
-                for pattern in status_patterns:
-                    if re.search(pattern, text_lower):
-                        features_data['status'] = pattern.replace('_', ' ')
-                        print(f"   Status: {features_data['status']}")
-                        break
-
-            # 7. LISTING UPDATE DATE
+        with METRICS.timer('stage', stage='listing'):
             try:
-                update_element = WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".stats-text"))
-                )
-                features_data['update_date'] = self.driver.execute_script('return arguments[0].textContent', update_element).strip()
-                print(f"   Update date FOUND: '{features_data['update_date']}'")
+                page = self.fetcher.fetch(url, required_marker=DETAIL_PAGE_MARKER)
+                if page.verdict != SERVED:
+                    # Removed listing or no listing content: nothing to wait for or extract
+                    log_event(detail_log, 'listing.skipped', "Skipping page", url=url, verdict=page.verdict)
+                    if page.verdict == GONE:
+                        self.frontier.mark_failed('listings', url, "listing removed", retry=False)
+                    return False
+            
+                if page.via == 'browser' and self.debug:
+                    # Debug page content
+                    self.debug_page_content(url)
+            
+                # Extract everything from one page snapshot
+                record = self.extract_basic_info(url, html=None if page.via == 'browser' else page.html)
+                self.archive_page(page.html, operation, property_type, city, listing_id=record.listing_id)
+                record.scraped_at = datetime.now().isoformat()
+                record.operation = operation
+                record.property_type = property_type
+                record.city = city
+            
+                # Queue for output; done in the frontier once the row is on disk
+                self.save_record(record, on_commit=lambda: self.listing_saved(record))
+                log_event(detail_log, 'listing.saved', "Data saved", url=url, via=page.via,
+                          elapsed=round(page.elapsed, 3), title=record.title or 'N/A', price=record.price)
+            
+                return True
+            
+            except PageBlocked:
+                raise
             except Exception as e:
-                print(f"   Update date not found: {e}")
-
-            # 9. ENERGY CERTIFICATE - improved search
-            if description:
-                energy_patterns = [
-                    r'Energy Rating:\s*([A-Z][+\-]?)',
-                    r'Energy Certificate:\s*([A-Z][+\-]?)', 
-                    r'Energy certification:\s*([A-Z][+\-]?)',
-                    r'Certificado Energético:\s*([A-Z][+\-]?)',
-                    r'Classificação Energética:\s*([A-Z][+\-]?)'
-                ]
-                
-                for pattern in energy_patterns:
-                    energy_match = re.search(pattern, description, re.IGNORECASE)
-                    if energy_match:
-                        features_data['energy_certificate'] = energy_match.group(1)
-                        print(f"   Energy certificate: {features_data['energy_certificate']}")
-                        break
-                else:
-                    # If not found in description, search in other places
-                    try:
-                        energy_elements = self.driver.find_elements(By.XPATH, "//*[contains(text(), 'Energy Rating') or contains(text(), 'Certificado')]")
-                        for elem in energy_elements:
-                            text = self.driver.execute_script('return arguments[0].textContent', elem)
-                            for pattern in energy_patterns:
-                                energy_match = re.search(pattern, text, re.IGNORECASE)
-                                if energy_match:
-                                    features_data['energy_certificate'] = energy_match.group(1)
-                                    print(f"   Energy certificate (alternative): {features_data['energy_certificate']}")
-                                    break
-                            if features_data['energy_certificate']:
-                                break
-                    except:
-                        pass
-
-        except Exception as e:
-            print(f"   Error extracting features: {e}")
-
-        return features_data
-
-    def safe_extract_text_js(self, css_selector, timeout=10):
-        """Universal method for extracting text via JavaScript"""
-        try:
-            element = WebDriverWait(self.driver, timeout).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, css_selector))
-            )
-            return self.driver.execute_script('return arguments[0].textContent', element).strip()
-        except:
-            return ""
-
-    def extract_basic_info(self):
-        """FIXED version using JavaScript for hidden elements"""
-        data = {}
-        
-        # Give time for full load
-        time.sleep(3)
-        
-        # 1. TITLE - use JavaScript for hidden elements
-        try:
-            title_element = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".main-info__title-main"))
-            )
-            # FIXED: get text via JavaScript
-            data['title'] = self.driver.execute_script('return arguments[0].textContent', title_element).strip()
-            print(f"   Title FOUND: '{data['title']}'")
-        except Exception as e:
-            print(f"   Title not found: {e}")
-            data['title'] = ""
-
-        # 2. PRICE - also use JavaScript
-        try:
-            price_element = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".info-data-price"))
-            )
-            data['price'] = self.driver.execute_script('return arguments[0].textContent', price_element).strip()
-            print(f"   Price FOUND: '{data['price']}'")
-        except Exception as e:
-            print(f"   Price not found: {e}")
-            data['price'] = ""
+                METRICS.inc('listing_errors')
+                log_event(detail_log, 'listing.error', f"Error processing listing: {e}", logging.WARNING, url=url)
+                return False
 
-        # 3. AREA - use JavaScript
-        try:
-            # Find element containing m² via XPath, but get text via JS
-            area_element = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'm²')]"))
-            )
-            data['area'] = self.driver.execute_script('return arguments[0].textContent', area_element).strip()
-            print(f"   Area FOUND: '{data['area']}'")
-        except Exception as e:
-            print(f"   Area not found: {e}")
-            data['area'] = ""
-
-        # 4. LOCATION - use JavaScript
-        try:
-            location_element = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".main-info__title-minor"))
-            )
-            data['location'] = self.driver.execute_script('return arguments[0].textContent', location_element).strip()
-            print(f"   Location FOUND: '{data['location']}'")
-        except Exception as e:
-            print(f"   Location not found: {e}")
-            data['location'] = ""
-
-        # 5. DESCRIPTION - use JavaScript
-        try:
-            desc_element = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".adCommentsLanguage"))
-            )
-            full_description = self.driver.execute_script('return arguments[0].textContent', desc_element).strip()
-            data['description'] = full_description[:200] + "..." if len(full_description) > 200 else full_description
-            print(f"   Description FOUND: '{data['description'][:100]}...'")
-        except Exception as e:
-            print(f"   Description not found: {e}")
-            data['description'] = ""
-
-        # 6. CHARACTERISTICS (bedrooms, bathrooms)
-        features_data = self.extract_features_from_details(data.get('description', ''))
-        data.update(features_data)
-        # Listing update date
-        try:
-            update_element = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".stats-text"))
-            )
-            data['update_date'] = self.driver.execute_script('return arguments[0].textContent', update_element).strip()
-            print(f"   Update date FOUND: '{data['update_date']}'")
-        except Exception as e:
-            print(f"   Update date not found: {e}")
-            data['update_date'] = ""
+    def extract_basic_info(self, url='', html=None):
+        """Parse every field from one snapshot: fetched HTML or driver.page_source"""
+        if html is None:
+            # Single readiness check instead of one wait per field
+            try:
+                wait_for_element(self.driver, ".main-info__title-main", 10)
+            except Exception as e:
+                log_event(detail_log, 'listing.no_title', f"Title not found: {e}", logging.DEBUG, url=url)
+            html = self.driver.page_source
 
-        # Agency
-        try:
-            agency_element = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".professional-name .name"))
-            )
-            data['agency'] = self.driver.execute_script('return arguments[0].textContent', agency_element).strip()
-            print(f"   Agency FOUND: '{data['agency']}'")
-        except Exception as e:
-            print(f"   Agency not found: {e}")
-            data['agency'] = ""
-        
-        return data
+        record = parse_listing_html(html, url=url)
+        log_event(detail_log, 'listing.parsed', "Listing parsed", logging.DEBUG, url=url, title=record.title,
+                  price=record.price, area=record.area)
+        return record
 
     def safe_extract_text(self, selectors, max_chars=None):
         """Safely extract text using multiple selectors"""
@@ -631,126 +393,343 @@ class IdealistaScraperCSV:
                 continue
         return ""
     
-    def save_to_csv(self, data):
-        """Save extracted data to CSV with updated fields"""
+    def save_record(self, data, on_commit=None):
+        """Hand a record to the output sink; on_commit runs once it is written"""
         try:
-            row = [
-                data.get('listing_id', ''),
-                data.get('url', ''),
-                data.get('scraped_at', ''),
-                data.get('operation', ''),
-                data.get('property_type', ''),
-                data.get('city', ''),
-                data.get('title', ''),
-                data.get('price', ''),
-                data.get('area', ''),
-                data.get('bedrooms', ''),
-                data.get('bathrooms', ''),
-                data.get('location', ''),
-                data.get('description', ''),
-                data.get('property_type_detail', ''),
-                data.get('update_date', ''),
-                data.get('agency', ''),                    # Agency
-                data.get('energy_certificate', '')         # Energy certificate
-            ]
-            self.csv_writer.writerow(row)
-            return True
+            if isinstance(data, dict):
+                data = ListingRecord(**{k: v for k, v in data.items() if k in RECORD_FIELDS})
+            return self.sink.put(data, on_commit=on_commit)
         except Exception as e:
-            print(f"Error writing to CSV: {e}")
+            self.logger.error(f"Error queueing record for output: {e}")
             return False
     
-    def process_lisbon_apartments(self):
-        """Process Lisbon apartments (regular listings, not new developments)"""
-        operation = "sale"
-        property_type = "apartments" 
-        city = "lisbon"
+    def listing_saved(self, record):
+        """A detail record reached disk: mark it done and remember it in the listing index"""
+        if self.index is not None:
+            self.index.record_detail(record)
+        if self.descriptions is not None:
+            self.descriptions.add(record)
+        self.frontier.mark_done('listings', record.url)
+    
+    def expand_frontier(self, operations=None, property_types=None, cities=None):
+        """Seed page 1 of every operation x property type x city search"""
+        added = 0
+        for operation in operations or self.operations:
+            for property_type in property_types or self.property_types:
+                for city in cities or self.cities:
+                    url = self.build_url(operation, property_type, city)
+                    if url and self.frontier.add('pages', url, operation, property_type, city, page=1):
+                        added += 1
+        log_event(self.logger, 'frontier.seeded', f"Frontier seeded with {added} new searches", searches=added)
+        return added
+    
+    def process_search_page(self, item, mode, detail_changed=False, full_refresh=False, max_pages=100):
+        """Fetch one search page, queue its listings and the rest of its search in the frontier"""
+        operation, property_type, city = item['operation'], item['property_type'], item['city']
         
-        print(f"Testing: {operation} + {property_type} + {city}")
+        # Load list page (plain HTTP unless it needs the browser)
+        page = self.fetcher.fetch(item['url'], required_marker=SEARCH_PAGE_MARKER, wait_selector="article.item")
+        self.archive_page(page.html, operation, property_type, city, page_number=item['page'])
         
-        base_url = self.build_url(operation, property_type, city)
-        current_url = base_url
-        page_num = 1
-        max_pages = 100  # Increased page limit
-        processed_links = set()
-        total_listings = 0
+        saved = 0
+        if mode == "cards":
+            cards, saved, detail_urls = self.process_cards_page(
+                operation, property_type, city, detail_changed, html=page.html
+            )
+            listing_links = [card.url for card in cards]
+        else:
+            # Extract listing cards, visit only new or changed ones
+            cards = self.extract_listing_cards(operation, property_type, city, html=page.html)
+            listing_links = [card.url for card in cards]
+            detail_urls = self.select_detail_urls(cards, full_refresh)
         
-        while current_url and page_num <= max_pages:
-            print(f"\n{'='*60}")
-            print(f"PAGE {page_num}: {current_url}")
-            print(f"{'='*60}")
-            
-            # Load list page
-            self.driver.get(current_url)
-            time.sleep(random.uniform(5, 7))
-            
-            # Extract listing links
-            listing_links = self.extract_listing_links_simple()
-            
-            if not listing_links:
-                print("No listings found on page")
-                # Try to find next page even if no listings
-                next_url = self.get_next_page_simple()
-                if next_url and next_url != current_url:
-                    current_url = next_url
-                    page_num += 1
-                    continue
-                else:
-                    break
-            
-            # Filter already processed links
-            new_links = [link for link in listing_links if link not in processed_links]
-            print(f"New listings to process: {len(new_links)}")
-            
-            # FIX: remove [:3] limitation - process ALL new links
-            for i, listing_url in enumerate(new_links):  # ← REMOVED [:3]
-                success = self.extract_listing_data(listing_url, operation, property_type, city)
-                if success:
-                    processed_links.add(listing_url)
-                    total_listings += 1
-                    print(f"   Processed {i+1}/{len(new_links)} (total: {total_listings})")
-                time.sleep(random.uniform(2, 4))  # Reduced delay
-            
-            # Go to next page
-            next_url = self.get_next_page_reliable()
-            
-            if next_url and next_url != current_url:
-                current_url = next_url
-                page_num += 1
-                print(f"Moving to page {page_num}...")
-                time.sleep(random.uniform(3, 5))
+        queued = self.frontier.add_many('listings', detail_urls, operation, property_type, city)
+        log_event(self.logger, 'page.done', f"PAGE {item['page']} [{operation}/{property_type}/{city}]",
+                  logging.INFO if listing_links else logging.WARNING, url=item['url'], via=page.via,
+                  elapsed=round(page.elapsed, 3), cards=len(listing_links), saved=saved,
+                  unchanged=len(cards) - len(detail_urls) if mode != "cards" else None, queued=queued)
+        
+        self.queue_more_pages(item, page, cards, max_pages)
+        return saved
+    
+    def process_pending_listings(self, pool=None, backlog=None):
+        """Work off pending detail URLs, in this process or through the worker pool
+        
+        backlog caps the URLs claimed ahead into the pool, so a shared run's
+        listings stay in the queue for the other workers.
+        """
+        processed = 0
+        while True:
+            while pool and backlog and pool.tasks.qsize() >= backlog and not self.breaker.exhausted():
+                time.sleep(0.2)
+            if self.breaker.exhausted() or self.driver is None or (pool and not pool.running()):
+                return processed
+            item = self.frontier.claim('listings')
+            if item is None:
+                return processed
+            if pool:
+                try:
+                    pool.submit(item['url'], operation=item['operation'],
+                                property_type=item['property_type'], city=item['city'])
+                except RuntimeError:
+                    # The last worker went down after the check above
+                    self.frontier.requeue('listings', item['url'])
+                    return processed
+                continue
+            try:
+                success = self.extract_listing_data(item['url'], item['operation'], item['property_type'], item['city'])
+            except PageBlocked as e:
+                self.handle_block('listings', item['url'], e)
+                continue
+            if success:
+                processed += 1
             else:
-                print("Pagination completed or page limit reached")
+                self.frontier.mark_failed('listings', item['url'], "extraction failed")
+    
+    def rotate_driver(self):
+        """Replace the browser (fresh profile and cookies) and clear the HTTP session's cookies"""
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        try:
+            self.driver = self.new_driver()
+        except Exception as e:
+            # crawl() stops on a missing driver; the blocked URL stays pending for --resume
+            self.logger.error(f"Could not start a new driver: {e}")
+            self.driver = None
+            return
+        self.fetcher.reset(self.driver)
+        METRICS.inc('driver_rotations')
+    
+    def handle_block(self, kind, url, error):
+        """A challenge/block page: put the URL back without using up an attempt, then rotate the driver"""
+        log_event(self.logger, 'page.blocked', "Blocked: requeued, rotating driver", logging.WARNING,
+                  verdict=error.verdict, url=url, kind=kind)
+        self.frontier.requeue(kind, url)
+        self.rotate_driver()
+    
+    def archive_page(self, html, operation, property_type, city, page_number=None, listing_id=None):
+        """Keep the raw HTML in the compressed page archive (deduplicated across runs)"""
+        if self.archive is None:
+            return
+        try:
+            self.archive.put(page_key(self.run_id, operation, property_type, city, page_number, listing_id), html)
+        except Exception as e:
+            self.logger.error(f"Error archiving page: {e}")
+    
+    def save_pool_record(self, record):
+        self.save_record(record, on_commit=lambda: self.listing_saved(record))
+    
+    def crawl(self, mode="detail", detail_changed=False, workers=1, max_pages=100, full_refresh=False):
+        """Work through the frontier until no search page or listing URL is pending
+        
+        mode="detail" visits the listing pages the listing index reports as new
+        or changed (every one with full_refresh); mode="cards" saves the search
+        cards in bulk and, with detail_changed, visits only new or changed ids.
+        With workers > 1 detail pages are fetched by a pool of browsers while
+        self.driver keeps walking the search pages.
+        """
+        log_event(self.logger, 'crawl.start', f"Crawl mode: {mode}", mode=mode, workers=workers)
+        self.page_plans = {}
+        pool = None
+        if workers > 1:
+            pool = DetailWorkerPool(
+                self.new_driver, self.save_pool_record, workers=workers, scheduler=self.scheduler,
+                breaker=self.breaker,
+                # The pool already retried on other workers
+                on_failed=lambda url, error: self.frontier.mark_failed('listings', url, error, retry=False),
+                on_page=lambda page, record: self.archive_page(
+                    page.html, record.operation, record.property_type, record.city, listing_id=record.listing_id
+                )
+            ).start()
+        
+        backlog = workers * 2 if self.worker_id else None
+        total_listings = 0
+        while True:
+            # Listings first: leftovers of a resumed run, then those of the last page
+            total_listings += self.process_pending_listings(pool, backlog)
+            if self.breaker.exhausted():
+                self.logger.error(f"Host keeps blocking after {self.breaker.max_trips} pauses: stopping, "
+                                  f"continue later with {'--join' if self.worker_id else '--resume'} {self.run_id}")
+                break
+            if pool and not pool.running():
+                self.logger.error(f"No browser workers running: stopping, "
+                                  f"continue later with {'--join' if self.worker_id else '--resume'} {self.run_id}")
+                break
+            if self.driver is None:
+                self.logger.error(f"No browser after a block: stopping, "
+                                  f"continue later with {'--join' if self.worker_id else '--resume'} {self.run_id}")
                 break
+            
+            item = self.frontier.claim('pages')
+            if item is None:
+                break
+            try:
+                with METRICS.timer('stage', stage='search_page'):
+                    total_listings += self.process_search_page(item, mode, detail_changed, full_refresh, max_pages)
+                self.frontier.mark_done('pages', item['url'])
+            except PageBlocked as e:
+                self.handle_block('pages', item['url'], e)
+            except Exception as e:
+                METRICS.inc('page_errors')
+                log_event(self.logger, 'page.error', f"Error processing page: {e}", logging.ERROR, url=item['url'])
+                self.frontier.mark_failed('pages', item['url'], e)
+        
+        if pool:
+            pool.close()
+            stats = pool.stats()
+            total_listings += sum(worker['processed'] for worker in stats.values())
+            log_event(self.logger, 'crawl.workers', "Worker stats", workers=stats)
         
-        print(f"\nTOTAL: Processed {total_listings} listings")
+        # Pending commits still update the frontier and the listing index
+        self.sink.sync()
+        log_event(self.logger, 'crawl.stats', "Crawl stats", output=self.sink.stats, fetcher=self.fetcher.stats.to_dict(),
+                  scheduler=self.scheduler.stats(), frontier=self.frontier.counts(), pages=self.breaker.stats(),
+                  freshness=self.save_freshness() if self.index is not None else None,
+                  archive=self.archive.stats if self.archive is not None else None, logging=logging_stats())
+        self.save_metrics(total_listings)
+        log_event(self.logger, 'crawl.done', f"TOTAL: Processed {total_listings} listings", listings=total_listings)
         return total_listings
     
-    def run(self):
-        """Run the scraper with direct CSV output"""
-        self.run_id = datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
-        self.run_path = f"data/bronze/idealista/run_{self.run_id}/"
+    def open_index(self):
+        """Open the cross-run listing index, seeding it from earlier runs' CSVs the first time"""
+        self.index = ListingIndex(run_id=self.run_id)
+        if len(self.index) == 0:
+            loaded = self.index.bootstrap_from_bronze()
+            self.logger.info(f"Listing index seeded from earlier runs: {loaded} rows")
+        self.logger.info(f"Listing index: {len(self.index)} known listings")
+    
+    def save_freshness(self):
+        """Write this run's new/changed/unchanged counters to freshness.json"""
+        stats = self.index.freshness()
+        with open(os.path.join(self.run_path, "freshness.json"), 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2)
+        return stats
+    
+    def save_metrics(self, total_listings):
+        """Write metrics.json (and metrics.prom when enabled) next to the output"""
+        summary = METRICS.write_summary(self.run_path, run_id=self.run_id, listings=total_listings,
+                                        pages=self.breaker.stats(), browser_rss_mb=browser_rss_mb(self.driver))
+        slowest = sorted(summary['histograms'].items(), key=lambda item: -item[1]['sum'])[:5]
+        log_event(self.logger, 'crawl.metrics', f"Time split in {summary['wall_seconds']}s",
+                  time_split=summary['time_split'], browser_rss_mb=summary['browser_rss_mb'],
+                  slowest={key: {'sum': round(h['sum'], 2), 'p95': round(h['p95'], 3)} for key, h in slowest},
+                  counters=summary['counters'] or None)
+        if self.config['metrics']['prometheus']:
+            self.logger.info(f"Prometheus metrics: {METRICS.write_prometheus(self.run_path)}")
+        return summary
+    
+    def merge_if_drained(self):
+        """Shared run: once no worker has anything left, merge every shard's output into the run directory"""
+        counts = self.frontier.counts()
+        if not is_drained(counts):
+            log_event(self.logger, 'shards.pending', "Queue not drained yet, the last worker to finish merges the shards",
+                      counts=counts)
+            return None
+        merged = merge_shards(self.run_root)
+        log_event(self.logger, 'shards.merged', f"Merged {len(merged['shards'])} shards", rows=merged['total_rows'],
+                  path=self.run_root)
+        return merged
+    
+    def run(self, mode="detail", detail_changed=False, workers=1, resume=None,
+            operations=None, property_types=None, cities=None, full_refresh=False, worker_id=None):
+        """Run the scraper with buffered output; resume=<run_id> continues an interrupted run
         
-        print(f"SCRAPER START: {self.run_path}")
-        print("TARGET: Regular listings (apartments) instead of new developments")
+        With worker_id, this process is one worker of the shared run resume:
+        it pulls from the run's work queue under leases and writes its output
+        to shards/<worker_id>, merged into the run directory at the end.
+        """
+        self.run_id = resume or datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
+        self.run_root = f"data/bronze/idealista/run_{self.run_id}/"
+        self.worker_id = worker_id
+        self.run_path = shard_path(self.run_root, worker_id) if worker_id else self.run_root
+        
+        log_event(self.logger, 'run.start', f"SCRAPER START: {self.run_path}", run_id=self.run_id, worker_id=worker_id)
+        METRICS.reset()
         
         try:
-            csv_path = self.setup_csv()
-            
-            total_processed = self.process_lisbon_apartments()
-            
-            print(f"\nSCRAPING COMPLETED!")
-            print(f"Processed listings: {total_processed}")
-            print(f"Data saved to: {csv_path}")
+            manifest_path = self.setup_output(append=resume is not None)
+            self.descriptions = DescriptionLog(self.run_path)
+            self.frontier = open_work_queue(self.run_root, self.config['queue'], worker_id)
+            recovered = self.frontier.recover()
+            if recovered:
+                self.logger.info(f"Resuming: {recovered} in-flight URLs back to pending")
+            if worker_id:
+                self.lease_keeper = LeaseKeeper(self.frontier, self.config['queue']['lease_seconds'] / 3).start()
+            self.expand_frontier(operations, property_types, cities)
+            self.open_index()
+            if self.config['archive']['enabled']:
+                # The pack files take one writer at a time: every worker of a shared run gets its own archive
+                archive_path = self.config['archive']['path']
+                if worker_id:
+                    archive_path = os.path.join(archive_path, SHARDS_DIR, worker_id)
+                self.archive = PageArchive(archive_path, codec=self.config['archive']['codec'])
+            
+            total_processed = self.crawl(mode, detail_changed, workers, full_refresh=full_refresh)
+            
+            log_event(self.logger, 'run.done', "SCRAPING COMPLETED!", listings=total_processed, path=self.run_path,
+                      manifest=manifest_path)
+            if worker_id:
+                self.close_output()
+                self.merge_if_drained()
             
         except Exception as e:
-            print(f"Critical error: {e}")
-            import traceback
-            traceback.print_exc()
+            self.logger.exception(f"Critical error: {e}")
         finally:
-            self.close_csv()
-            self.driver.quit()
-            print("Driver closed")
+            # Sink first: its last commits still update the frontier, the index and the descriptions
+            self.close_output()
+            if self.descriptions is not None:
+                self.descriptions.close()
+            if self.lease_keeper is not None:
+                self.lease_keeper.stop()
+            if self.frontier:
+                self.frontier.close()
+            if self.index is not None:
+                self.index.close()
+            if self.archive is not None:
+                self.archive.close()
+            self.fetcher.close()
+            if self.driver is not None:
+                self.driver.quit()
+            self.logger.info("Driver closed")
 
 if __name__ == "__main__":
-    scraper = IdealistaScraperCSV()
-    scraper.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Idealista scraper")
+    parser.add_argument("--mode", choices=["detail", "cards"], default="detail",
+                        help="detail: visit every listing page; cards: harvest search cards only")
+    parser.add_argument("--detail-changed", action="store_true",
+                        help="in cards mode, visit detail pages of new or re-priced listings")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="detail mode: number of parallel headless Chrome workers")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                        help="continue an interrupted run, e.g. 2025-10-08T17-18-55")
+    parser.add_argument("--join", metavar="RUN_ID",
+                        help="work on a run shared with other processes/hosts (started by whichever comes first)")
+    parser.add_argument("--worker-id", help="with --join: this worker's name and shard directory "
+                                            "(default: <hostname>-<pid>)")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="detail mode: visit every listing page, even those the listing index has unchanged")
+    parser.add_argument("--output-format", choices=["csv", "jsonl", "parquet"],
+                        help="override output.format from scraping_config.yaml")
+    parser.add_argument("--prometheus", action="store_true",
+                        help="also write metrics.prom (Prometheus text format) next to metrics.json")
+    parser.add_argument("--debug", action="store_true",
+                        help="DEBUG level for every scraper logger and per-page selector debugging (slow)")
+    parser.add_argument("--operations", nargs="+", help="subset of config/idealista/operations.json")
+    parser.add_argument("--property-types", nargs="+", help="subset of config/idealista/property_types.json")
+    parser.add_argument("--cities", nargs="+", help="subset of config/idealista/cities.json")
+    args = parser.parse_args()
+    if args.join and args.resume:
+        parser.error("--join and --resume are exclusive (a worker rejoining its run resumes its shard)")
+    
+    scraper = IdealistaScraperCSV(debug=args.debug or None)
+    if args.output_format:
+        scraper.config['output']['format'] = args.output_format
+    if args.prometheus:
+        scraper.config['metrics']['prometheus'] = True
+    scraper.run(mode=args.mode, detail_changed=args.detail_changed, workers=args.workers,
+                resume=args.join or args.resume, operations=args.operations,
+                property_types=args.property_types, cities=args.cities,
+                full_refresh=args.full_refresh,
+                worker_id=(args.worker_id or default_worker_id()) if args.join else None)
\ No newline at end of file
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+INDEX_PATH = "data/bronze/idealista/listing_index.sqlite"
+
+# Fields that make up a listing's content hash
+CONTENT_FIELDS = (
+    'title', 'price', 'area', 'bedrooms', 'bathrooms', 'location',
+    'description', 'property_type_detail', 'agency', 'energy_certificate'
+)
+# Filled only from a detail page; search cards also carry a description snippet, so it can't tell them apart
+DETAIL_FIELDS = ('bathrooms', 'energy_certificate', 'completion_year', 'status')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing_id TEXT PRIMARY KEY,
+    url TEXT,
+    last_price TEXT,
+    update_date TEXT,
+    content_hash TEXT,
+    first_seen TEXT,
+    last_seen TEXT,
+    last_run TEXT,
+    detail_price TEXT,
+    detail_at TEXT
+);
+"""
+
+AGE_RE = re.compile(r'^(\d+)\s*(minute|hour|day)s?$')
+DAY_MONTH_RE = re.compile(r'^(\d{1,2})\s+([A-Z][a-z]{2})$')
+MONTHS = {m: i for i, m in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], start=1)}
+
+
+def card_updated_at(text, now=None):
+    """Absolute time from a card's age label ("42 minutes", "3 days", "25 Sep"), or None"""
+    now = now or datetime.now()
+    text = (text or '').strip()
+    match = AGE_RE.match(text)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        return now - timedelta(**{f"{unit}s": amount})
+    match = DAY_MONTH_RE.match(text)
+    if match and match.group(2) in MONTHS:
+        try:
+            date = now.replace(month=MONTHS[match.group(2)], day=int(match.group(1)),
+                               hour=0, minute=0, second=0, microsecond=0)
+        except ValueError:
+            return None
+        # "25 Dec" seen in January belongs to last year
+        return date.replace(year=date.year - 1) if date > now else date
+    return None
+
+
+def content_hash(data):
+    """Stable hash of a record's content fields (dict or ListingRecord)"""
+    if not isinstance(data, dict):
+        data = data.to_dict()
+    payload = "\x1f".join('' if data.get(name) is None else str(data.get(name)) for name in CONTENT_FIELDS)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ListingIndex:
+    """
+    Persistent index of every listing seen across runs (SQLite, keyed on listing_id).
+    - classify(card) says whether a search card is new / changed / unchanged
+      and whether its detail page has to be (re)fetched
+    - observe(card) and record_detail(record) keep last price, update date and content hash
+    - freshness() returns this run's counters
+    """
+    def __init__(self, path=INDEX_PATH, run_id=''):
+        self.path = path
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Workers of a shared run write to the same index
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.stats = {
+            'cards_seen': 0, 'new': 0, 'changed': 0, 'unchanged': 0,
+            'detail_queued': 0, 'detail_skipped': 0,
+            'details_recorded': 0, 'content_changed': 0,
+        }
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def get(self, listing_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT listing_id, url, last_price, update_date, content_hash, first_seen, "
+                "last_seen, last_run, detail_price, detail_at FROM listings WHERE listing_id = ?",
+                (listing_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ('listing_id', 'url', 'last_price', 'update_date', 'content_hash', 'first_seen',
+                'last_seen', 'last_run', 'detail_price', 'detail_at')
+        return dict(zip(keys, row))
+
+    def classify(self, card, now=None):
+        """(status, needs_detail) for a search card; status is new / changed / unchanged"""
+        now = now or datetime.now()
+        row = self.get(card.listing_id)
+        if row is None:
+            status, needs_detail = 'new', True
+        else:
+            updated_at = card_updated_at(card.update_date, now)
+            changed = card.price != row['last_price'] or (
+                updated_at is not None and row['last_seen'] is not None
+                and updated_at.isoformat() > row['last_seen']
+            )
+            status = 'changed' if changed else 'unchanged'
+            needs_detail = changed or row['detail_at'] is None or card.price != row['detail_price']
+
+        with self.lock:
+            self.stats['cards_seen'] += 1
+            self.stats[status] += 1
+            self.stats['detail_queued' if needs_detail else 'detail_skipped'] += 1
+        return status, needs_detail
+
+    def observe(self, card, now=None):
+        """Remember a search card sighting (price, card date, last seen)"""
+        now = (now or datetime.now()).isoformat()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO listings (listing_id, url, last_price, update_date, first_seen, last_seen, last_run) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(listing_id) DO UPDATE SET url = excluded.url, last_price = excluded.last_price, "
+                "update_date = COALESCE(NULLIF(excluded.update_date, ''), update_date), "
+                "last_seen = excluded.last_seen, last_run = excluded.last_run",
+                (card.listing_id, card.url, card.price, card.update_date, now, now, self.run_id)
+            )
+
+    def record_detail(self, record, seen_at=None, run_id=None):
+        """Remember a fetched detail page; returns True if its content differs from the last one"""
+        seen_at = seen_at or record.scraped_at or datetime.now().isoformat()
+        digest = content_hash(record)
+        previous = self.get(record.listing_id)
+        changed = previous is not None and previous['content_hash'] not in (None, digest)
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO listings (listing_id, url, last_price, update_date, content_hash, first_seen, "
+                "last_seen, last_run, detail_price, detail_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(listing_id) DO UPDATE SET url = excluded.url, "
+                # New-development pages carry no single price: keep the one from the card
+                "last_price = COALESCE(NULLIF(excluded.last_price, ''), last_price), "
+                "update_date = excluded.update_date, content_hash = excluded.content_hash, "
+                "last_seen = MAX(COALESCE(last_seen, ''), excluded.last_seen), last_run = excluded.last_run, "
+                "detail_price = COALESCE(NULLIF(excluded.detail_price, ''), last_price), "
+                "detail_at = excluded.detail_at",
+                (record.listing_id, record.url, record.price, record.update_date, digest,
+                 seen_at, seen_at, run_id or self.run_id, record.price, seen_at)
+            )
+            self.stats['details_recorded'] += 1
+            if changed:
+                self.stats['content_changed'] += 1
+        return changed
+
+    def bootstrap_from_bronze(self, pattern="data/bronze/idealista/run_*/idealista_data*"):
+        """Fill an empty index from the detail rows of earlier runs' outputs (CSV, JSONL or parquet)
+
+        Rows saved from search cards (cards mode) carry none of DETAIL_FIELDS and are
+        skipped, so --detail-changed still visits those listings' pages.
+        """
+        from src.scrapers.idealista.listing_parser import ListingRecord, RECORD_FIELDS
+        from src.scrapers.idealista.output_sink import find_outputs, iter_output
+
+        stats = dict(self.stats)
+        loaded = 0
+        for path in find_outputs(pattern):
+            run_id = os.path.basename(os.path.dirname(path))[len('run_'):]
+            for frame in iter_output(path, chunk_rows=5000):
+                for row in frame.to_dict('records'):
+                    if not row.get('listing_id') or not any(row.get(name) for name in DETAIL_FIELDS):
+                        continue
+                    record = ListingRecord(**{k: v for k, v in row.items() if k in RECORD_FIELDS})
+                    self.record_detail(record, seen_at=record.scraped_at or None, run_id=run_id)
+                    loaded += 1
+        # Seeding isn't part of this run's freshness
+        self.stats = stats
+        return loaded
+
+    def freshness(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['index_size'] = len(self)
+        stats['skip_ratio'] = round(stats['detail_skipped'] / stats['cards_seen'], 3) if stats['cards_seen'] else 0.0
+        return stats
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,173 @@
+import re
+from dataclasses import dataclass, asdict, fields
+from typing import Optional
+
+import soupsieve as sv
+from bs4 import BeautifulSoup
+
+from src.scrapers.idealista.feature_extractor import extract_features
+from src.scrapers.idealista.metrics import METRICS
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+
+# Column order of idealista_data.csv
+CSV_FIELDS = [
+    'listing_id', 'url', 'scraped_at', 'operation', 'property_type', 'city',
+    'title', 'price', 'area', 'bedrooms', 'bathrooms', 'location',
+    'description', 'property_type_detail', 'update_date',
+    'agency', 'energy_certificate', 'completion_year', 'status'
+]
+
+DESCRIPTION_PREVIEW_CHARS = 200
+
+# Compiled once, reused for every snapshot
+SELECTORS = {
+    'title': sv.compile(".main-info__title-main"),
+    'price': sv.compile(".info-data-price"),
+    'area': sv.compile(".info-features span"),
+    'location': sv.compile(".main-info__title-minor"),
+    'description': sv.compile(".adCommentsLanguage"),
+    'update_date': sv.compile(".stats-text"),
+    'agency': sv.compile(".professional-name .name"),
+    'canonical': sv.compile("link[rel='canonical']"),
+}
+
+# Features block, in order of preference
+FEATURE_SELECTORS = [
+    sv.compile(".details-property_features"),
+    sv.compile(".info-features"),
+    sv.compile(".details-property"),
+]
+
+AREA_RE = re.compile('m²')
+AREA_MAX_CHARS = 40
+
+
+@dataclass
+class ListingRecord:
+    """One listing detail page, as written to idealista_data.csv"""
+    listing_id: str = ''
+    url: str = ''
+    scraped_at: str = ''
+    operation: str = ''
+    property_type: str = ''
+    city: str = ''
+    title: str = ''
+    price: str = ''
+    area: str = ''
+    bedrooms: Optional[int] = None
+    bathrooms: Optional[int] = None
+    location: str = ''
+    description: str = ''
+    property_type_detail: Optional[str] = None
+    update_date: str = ''
+    agency: str = ''
+    energy_certificate: Optional[str] = None
+    completion_year: Optional[int] = None
+    status: Optional[str] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_row(self):
+        """CSV row in CSV_FIELDS order, with the description shortened to a preview"""
+        data = self.to_dict()
+        description = data['description']
+        if len(description) > DESCRIPTION_PREVIEW_CHARS:
+            data['description'] = description[:DESCRIPTION_PREVIEW_CHARS] + "..."
+        return ['' if data[name] is None else data[name] for name in CSV_FIELDS]
+
+
+RECORD_COLUMNS = [f.name for f in fields(ListingRecord)]
+RECORD_FIELDS = set(RECORD_COLUMNS)
+
+
+def make_soup(html):
+    """Parse a page snapshot once; all field lookups run on the returned tree"""
+    return BeautifulSoup(html, HTML_PARSER)
+
+
+def node_text(node):
+    """textContent of a node with whitespace collapsed"""
+    if node is None:
+        return ""
+    return " ".join(node.get_text(" ").split())
+
+
+def select_text(soup, name):
+    with METRICS.timer('field', field=name):
+        return node_text(SELECTORS[name].select_one(soup))
+
+
+def listing_id_from_url(url):
+    """Same rule the scraper always used: the last path segment of /imovel/<id>/"""
+    if not url:
+        return ""
+    return url.split('/')[-2] if '/' in url else f"temp_{hash(url)}"
+
+
+def extract_area(soup):
+    """Area from the features line, else the first element whose text contains m²"""
+    for span in SELECTORS['area'].select(soup):
+        text = node_text(span)
+        if 'm²' in text:
+            return text
+    for node in soup.find_all(string=AREA_RE):
+        parent = node.parent
+        if parent is None or parent.name in ('script', 'style'):
+            continue
+        text = node_text(parent)
+        # Skip description paragraphs that merely mention an area
+        if len(text) <= AREA_MAX_CHARS:
+            return text
+    return ""
+
+
+def parse_listing_soup(soup, url='', **context):
+    """Build a ListingRecord from an already parsed detail page"""
+    if not url:
+        canonical = SELECTORS['canonical'].select_one(soup)
+        url = canonical.get('href', '') if canonical is not None else ''
+
+    record = ListingRecord(url=url, listing_id=listing_id_from_url(url))
+    for key, value in context.items():
+        if key in RECORD_FIELDS:
+            setattr(record, key, value)
+
+    record.title = select_text(soup, 'title')
+    record.price = select_text(soup, 'price')
+    with METRICS.timer('field', field='area'):
+        record.area = extract_area(soup)
+    record.location = select_text(soup, 'location')
+    record.description = select_text(soup, 'description')
+    record.update_date = select_text(soup, 'update_date')
+    record.agency = select_text(soup, 'agency')
+
+    with METRICS.timer('field', field='features'):
+        features_text = ""
+        for selector in FEATURE_SELECTORS:
+            features_text = node_text(selector.select_one(soup))
+            if features_text:
+                break
+        details_text = " ".join(node_text(node) for node in FEATURE_SELECTORS[2].select(soup))
+
+        for key, value in extract_features(features_text, record.description, details_text).items():
+            setattr(record, key, value)
+    return record
+
+
+def parse_listing_html(html, url='', **context):
+    """Extract every detail-page field from one HTML snapshot (driver.page_source or a saved file)"""
+    with METRICS.timer('parse', page='detail'):
+        return parse_listing_soup(make_soup(html), url=url, **context)
+
+
+def parse_listing_file(path, url='', **context):
+    """Parse a saved detail page, e.g. data/bronze/idealista/run_*/.../listings/<id>.html"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_listing_html(f.read(), url=url, **context)
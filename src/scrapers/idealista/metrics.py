@@ -0,0 +1,207 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_NAME = "metrics.json"
+PROMETHEUS_NAME = "metrics.prom"
+PROMETHEUS_PREFIX = "idealista"
+
+# Upper bounds in seconds; the last bucket is +Inf. Covers field parsing (sub-ms) to page loads (tens of s)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1, 2.5, 5, 10, 20, 30, 60)
+
+
+def metric_key(name, labels):
+    """'wait{selector=article.item}' - flat keys, so two runs' summaries diff line by line"""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations (count, sum, min, max, bucket counts)"""
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimated from the buckets, interpolating inside the one holding the rank"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = BUCKETS[i - 1] if i > 0 else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else self.max
+                value = low + (high - low) * (rank - seen) / n
+                return min(max(value, self.min), self.max)
+            seen += n
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else 0.0,
+            'min': round(self.min or 0.0, 6),
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'max': round(self.max, 6),
+            'buckets': self.counts,
+        }
+
+
+class RunMetrics:
+    """
+    Run-level timing registry shared by the fetcher, parsers, scheduler and scraper.
+    - observe(name, seconds, **labels) / timer(name, **labels) feed duration histograms
+    - inc(name, **labels) counts events such as selector timeouts
+    - summary() adds wall time and the sleep / load / wait / parse split
+    - Thread-safe; one process-wide instance, METRICS, reset at the start of a run
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.counter_labels = {}
+            self.started = time.perf_counter()
+            self.started_at = datetime.now().isoformat()
+
+    def observe(self, name, seconds, **labels):
+        key = metric_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(name, labels)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the with-block into histogram name, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def inc(self, name, value=1, **labels):
+        key = metric_key(name, labels)
+        with self.lock:
+            if key not in self.counters:
+                self.counters[key] = 0
+                self.counter_labels[key] = (name, labels)
+            self.counters[key] += value
+
+    def total(self, name):
+        """Summed seconds of every histogram called name, across labels"""
+        return sum(h.sum for h in self.histograms.values() if h.name == name)
+
+    def summary(self, **extra):
+        with self.lock:
+            wall = time.perf_counter() - self.started
+            data = {
+                'started_at': self.started_at,
+                'written_at': datetime.now().isoformat(),
+                'wall_seconds': round(wall, 3),
+                # Summed over all threads, so with workers these can exceed wall time
+                'time_split': {
+                    'sleep': round(self.total('sleep'), 3),
+                    'page_load': round(self.total('page_load'), 3),
+                    'wait': round(self.total('wait'), 3),
+                    'parse': round(self.total('parse'), 3),
+                },
+                'histograms': {key: h.to_dict() for key, h in sorted(self.histograms.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+        data.update(extra)
+        return data
+
+    def write_summary(self, run_path, **extra):
+        """run_path/metrics.json; returns the summary"""
+        data = self.summary(**extra)
+        with open(os.path.join(run_path, METRICS_NAME), 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        return data
+
+    def write_prometheus(self, run_path):
+        """run_path/metrics.prom in the Prometheus text format (for the node_exporter textfile collector)"""
+        lines = []
+        with self.lock:
+            by_name = {}
+            for h in self.histograms.values():
+                by_name.setdefault(h.name, []).append(h)
+            for name, histograms in sorted(by_name.items()):
+                metric = f"{PROMETHEUS_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for h in histograms:
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS + ('+Inf',), h.counts):
+                        cumulative += n
+                        lines.append(f"{metric}_bucket{prometheus_labels(h.labels, le=bound)} {cumulative}")
+                    lines.append(f"{metric}_sum{prometheus_labels(h.labels)} {h.sum:.6f}")
+                    lines.append(f"{metric}_count{prometheus_labels(h.labels)} {h.count}")
+            counters = {}
+            for key, value in self.counters.items():
+                name, labels = self.counter_labels[key]
+                counters.setdefault(name, []).append((labels, value))
+            for name, values in sorted(counters.items()):
+                metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in values:
+                    lines.append(f"{metric}{prometheus_labels(labels)} {value}")
+        path = os.path.join(run_path, PROMETHEUS_NAME)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+
+def prometheus_labels(labels, **extra):
+    pairs = dict(labels, **extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for v in pairs.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(pairs, escaped)) + "}"
+
+
+def compare_summaries(old, new, min_count=1):
+    """(key, old p50, new p50, old p95, new p95, p95 change %) for histograms both runs have"""
+    rows = []
+    for key, current in new['histograms'].items():
+        previous = old['histograms'].get(key)
+        if previous is None or min(previous['count'], current['count']) < min_count:
+            continue
+        change = (current['p95'] - previous['p95']) / previous['p95'] * 100 if previous['p95'] else 0.0
+        rows.append((key, previous['p50'], current['p50'], previous['p95'], current['p95'], change))
+    return sorted(rows, key=lambda row: -abs(row[5]))
+
+
+def load_summary(path):
+    """metrics.json of a run directory (or the file itself)"""
+    if os.path.isdir(path):
+        path = os.path.join(path, METRICS_NAME)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+METRICS = RunMetrics()
@@ -0,0 +1,405 @@
+import csv
+import glob
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from src.scrapers.idealista.listing_parser import CSV_FIELDS
+
+log = logging.getLogger('scraper.output')
+
+MANIFEST_NAME = "manifest.json"
+OUTPUT_NAME = "idealista_data"
+
+
+def fsync_file(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def write_json_atomic(path, data):
+    """Write JSON through a temp file + rename, so readers never see a half-written file"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        fsync_file(f)
+    os.replace(tmp_path, path)
+
+
+class AppendFileBackend(ABC):
+    """Rows appended to one file; each chunk is a committed byte range [offset, end)"""
+    extension = None
+
+    def __init__(self, run_path):
+        self.path = os.path.join(run_path, f"{OUTPUT_NAME}.{self.extension}")
+        self.file = None
+
+    def open(self, chunks=()):
+        """Open for appending; after a crash, cut anything written past the last committed chunk
+        (every row when the manifest lists none)"""
+        exists = os.path.exists(self.path)
+        self.file = open(self.path, 'r+b' if exists else 'wb')
+        if exists:
+            self.file.truncate(chunks[-1]['end'] if chunks else 0)
+        self.file.seek(0, os.SEEK_END)
+        if self.file.tell() == 0:
+            self.file.write(self.header())
+            fsync_file(self.file)
+
+    def header(self):
+        return b''
+
+    @abstractmethod
+    def encode(self, rows): ...
+
+    def write_chunk(self, seq, rows):
+        offset = self.file.tell()
+        try:
+            self.file.write(self.encode(rows))
+            fsync_file(self.file)
+        except Exception:
+            # Leave the file ending on the last good chunk
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            raise
+        return {'file': os.path.basename(self.path), 'offset': offset, 'end': self.file.tell()}
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class CsvBackend(AppendFileBackend):
+    """idealista_data.csv, same columns as always"""
+    extension = "csv"
+
+    def header(self):
+        return self.encode([CSV_FIELDS])
+
+    def encode(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+
+class JsonlBackend(AppendFileBackend):
+    """idealista_data.jsonl, one JSON object per listing"""
+    extension = "jsonl"
+
+    def encode(self, rows):
+        return "".join(
+            json.dumps(dict(zip(CSV_FIELDS, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode('utf-8')
+
+
+class ParquetBackend:
+    """idealista_data/part-NNNNN.parquet, one file (row group) per chunk, renamed into place when complete"""
+
+    def __init__(self, run_path):
+        self.dir = os.path.join(run_path, OUTPUT_NAME)
+
+    def open(self, chunks=()):
+        os.makedirs(self.dir, exist_ok=True)
+        # Parts of a crashed chunk (never renamed, or not in the manifest yet) are dropped
+        committed = {os.path.basename(chunk['file']) for chunk in chunks}
+        for name in os.listdir(self.dir):
+            if name not in committed:
+                os.remove(os.path.join(self.dir, name))
+
+    def write_chunk(self, seq, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Bronze stays raw strings; typing happens in the silver layer
+        table = pa.table({
+            name: pa.array(['' if row[i] is None else str(row[i]) for row in rows], type=pa.string())
+            for i, name in enumerate(CSV_FIELDS)
+        })
+        name = f"part-{seq:05d}.parquet"
+        tmp_path = os.path.join(self.dir, name + ".tmp")
+        pq.write_table(table, tmp_path)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.dir, name))
+        return {'file': f"{OUTPUT_NAME}/{name}"}
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    'csv': CsvBackend,
+    'jsonl': JsonlBackend,
+    'parquet': ParquetBackend,
+}
+
+
+class OutputSink:
+    """
+    Buffered, crash-safe record output.
+    - put() only enqueues; a background thread batches records into chunks of chunk_rows
+      (or whatever arrived within flush_interval seconds) and writes them
+    - Every chunk is fsync-ed, then recorded in manifest.json (rows, file, byte range);
+      the manifest is replaced atomically, so a crash leaves every listed chunk readable
+    - Backends: csv, jsonl, parquet (one part file per chunk)
+    - A chunk that fails to write stays buffered and is retried on the next flush
+    - put(record, on_commit) calls on_commit() on the sink thread once the row is on disk,
+      so callers can mark work done only when it is durable
+    """
+    def __init__(self, run_path, fmt='csv', chunk_rows=200, flush_interval=5.0, append=False):
+        if fmt not in BACKENDS:
+            raise ValueError(f"Unknown output format: {fmt}")
+        self.run_path = run_path
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.manifest_path = os.path.join(run_path, MANIFEST_NAME)
+        os.makedirs(run_path, exist_ok=True)
+
+        self.manifest = self.load_manifest() if append else None
+        if self.manifest is None or self.manifest.get('format') != fmt:
+            self.manifest = {'format': fmt, 'fields': list(CSV_FIELDS), 'chunks': [],
+                             'total_rows': 0, 'closed': False}
+        self.manifest['closed'] = False
+
+        self.backend = BACKENDS[fmt](run_path)
+        self.backend.open(self.manifest['chunks'])
+
+        self.queue = queue.Queue()
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.stats = {'queued': 0, 'written': 0, 'chunks': 0, 'write_errors': 0, 'write_seconds': 0.0}
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="output-sink", daemon=True)
+        self.thread.start()
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"Unreadable {self.manifest_path}, starting a new one: {e}")
+            return None
+
+    def put(self, record, on_commit=None):
+        """Queue one record (ListingRecord or CSV row list); never blocks on disk"""
+        row = record if isinstance(record, (list, tuple)) else record.to_row()
+        self.queue.put((row, on_commit))
+        with self.lock:
+            self.stats['queued'] += 1
+        return True
+
+    def run(self):
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = False
+            if item is None:
+                self.flush()
+                return
+            if isinstance(item, threading.Event):
+                self.flush()
+                item.set()
+                continue
+            if item is not False:
+                self.buffer.append(item)
+            if len(self.buffer) >= self.chunk_rows or time.monotonic() >= deadline:
+                self.flush()
+                deadline = time.monotonic() + self.flush_interval
+
+    def flush(self):
+        """Write buffered rows in chunk_rows slices; runs on the sink thread"""
+        while self.buffer:
+            items = self.buffer[:self.chunk_rows]
+            rows = [row for row, _ in items]
+            seq = len(self.manifest['chunks'])
+            start = time.perf_counter()
+            try:
+                location = self.backend.write_chunk(seq, rows)
+            except Exception as e:
+                self.stats['write_errors'] += 1
+                self.error = e
+                log.error(f"Output chunk {seq} failed, keeping {len(rows)} rows buffered: {e}")
+                return
+            self.stats['write_seconds'] += time.perf_counter() - start
+            del self.buffer[:len(rows)]
+
+            self.manifest['chunks'].append(dict(
+                seq=seq, rows=len(rows), written_at=datetime.now().isoformat(), **location
+            ))
+            self.manifest['total_rows'] += len(rows)
+            write_json_atomic(self.manifest_path, self.manifest)
+            with self.lock:
+                self.stats['written'] += len(rows)
+                self.stats['chunks'] += 1
+
+            for _, on_commit in items:
+                if on_commit is not None:
+                    try:
+                        on_commit()
+                    except Exception as e:
+                        log.error(f"Output commit callback failed: {e}")
+
+    def sync(self, timeout=None):
+        """Block until everything queued so far is written (or failed to write)"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Drain the queue, write the last chunk and mark the manifest closed"""
+        self.queue.put(None)
+        self.thread.join()
+        if self.buffer:
+            log.error(f"Output sink closing with {len(self.buffer)} unwritten rows: {self.error}")
+        self.backend.close()
+        self.manifest['closed'] = not self.buffer
+        write_json_atomic(self.manifest_path, self.manifest)
+        return self.stats
+
+
+def copy_range(source, target, offset, end, block=1024 * 1024):
+    source.seek(offset)
+    remaining = end - offset
+    while remaining > 0:
+        data = source.read(min(block, remaining))
+        if not data:
+            raise ValueError(f"{source.name} ends before byte {end}")
+        target.write(data)
+        remaining -= len(data)
+
+
+def merge_outputs(shard_paths, run_path):
+    """Combine the committed chunks of several sink outputs into run_path's output + manifest
+
+    Only chunks listed in each shard's manifest are copied, so rows of a shard
+    still being written (or cut off by a crash) are left out. The result is
+    written next to temp names and renamed into place; running it again
+    rebuilds it from the shards.
+    """
+    shards = []
+    for path in shard_paths:
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                shards.append((path, json.load(f)))
+    if not shards:
+        return None
+    formats = {manifest['format'] for _, manifest in shards}
+    if len(formats) > 1:
+        raise ValueError(f"Shards were written in different formats: {sorted(formats)}")
+    fmt = formats.pop()
+
+    merged = {'format': fmt, 'fields': list(CSV_FIELDS), 'chunks': [], 'total_rows': 0,
+              'closed': all(manifest['closed'] for _, manifest in shards),
+              'shards': [os.path.relpath(path, run_path) for path, _ in shards]}
+    backend = BACKENDS[fmt](run_path)
+    if fmt == 'parquet':
+        os.makedirs(backend.dir, exist_ok=True)
+        for name in os.listdir(backend.dir):
+            os.remove(os.path.join(backend.dir, name))
+        for path, manifest in shards:
+            for chunk in manifest['chunks']:
+                seq = len(merged['chunks'])
+                name = f"part-{seq:05d}.parquet"
+                shutil.copyfile(os.path.join(path, chunk['file']), os.path.join(backend.dir, name + ".tmp"))
+                os.replace(os.path.join(backend.dir, name + ".tmp"), os.path.join(backend.dir, name))
+                merged['chunks'].append(dict(chunk, seq=seq, file=f"{OUTPUT_NAME}/{name}",
+                                             shard=os.path.basename(os.path.normpath(path))))
+                merged['total_rows'] += chunk['rows']
+    else:
+        tmp_path = backend.path + ".tmp"
+        with open(tmp_path, 'wb') as target:
+            target.write(backend.header())
+            for path, manifest in shards:
+                with open(os.path.join(path, os.path.basename(backend.path)), 'rb') as source:
+                    for chunk in manifest['chunks']:
+                        offset = target.tell()
+                        copy_range(source, target, chunk['offset'], chunk['end'])
+                        merged['chunks'].append(dict(chunk, seq=len(merged['chunks']), offset=offset,
+                                                     end=target.tell(),
+                                                     shard=os.path.basename(os.path.normpath(path))))
+                        merged['total_rows'] += chunk['rows']
+            fsync_file(target)
+        os.replace(tmp_path, backend.path)
+    write_json_atomic(os.path.join(run_path, MANIFEST_NAME), merged)
+    return merged
+
+
+def output_path(run_path):
+    """A run's data file (parquet: its directory of parts), by the manifest's format; CSV without a manifest"""
+    fmt = 'csv'
+    manifest_path = os.path.join(run_path, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                fmt = json.load(f).get('format', 'csv')
+        except (OSError, ValueError) as e:
+            log.warning(f"Unreadable {manifest_path}, reading the run as CSV: {e}")
+    return os.path.join(run_path, OUTPUT_NAME if fmt == 'parquet' else f"{OUTPUT_NAME}.{fmt}")
+
+
+def find_outputs(pattern):
+    """Data paths of the runs pattern matches, one per run in run order
+
+    pattern may match data files (run_*/idealista_data.csv, as before, or
+    run_*/idealista_data*) or run directories; each run is read in the
+    format its manifest names, so jsonl and parquet runs are not skipped.
+    """
+    runs = {os.path.dirname(match) if os.path.basename(match).startswith(OUTPUT_NAME) else match
+            for match in glob.glob(pattern)}
+    return [path for path in map(output_path, sorted(runs)) if os.path.exists(path)]
+
+
+def iter_output(path, chunk_rows=None):
+    """Rows of one run output (CSV, JSONL or parquet parts) as raw string DataFrames, chunk_rows at a time"""
+    import pandas as pd
+
+    if os.path.isdir(path):
+        import pyarrow.parquet as pq
+
+        for name in sorted(name for name in os.listdir(path) if name.endswith(".parquet")):
+            frame = pq.read_table(os.path.join(path, name)).to_pandas()
+            if not chunk_rows:
+                yield frame
+                continue
+            for start in range(0, len(frame), chunk_rows):
+                yield frame.iloc[start:start + chunk_rows]
+    elif path.endswith(".jsonl"):
+        with open(path, 'r', encoding='utf-8') as f:
+            records = []
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+                if chunk_rows and len(records) >= chunk_rows:
+                    yield pd.DataFrame.from_records(records).astype(str)
+                    records = []
+            if records:
+                yield pd.DataFrame.from_records(records).astype(str)
+    else:
+        # index_col=False stops rows with a trailing comma from shifting into the index
+        options = dict(dtype=str, keep_default_na=False, index_col=False, encoding='utf-8')
+        if chunk_rows:
+            yield from pd.read_csv(path, chunksize=chunk_rows, **options)
+        else:
+            yield pd.read_csv(path, **options)
+
+
+def read_output(path):
+    """One run output as a single raw string DataFrame (empty when it has no rows)"""
+    import pandas as pd
+
+    frames = list(iter_output(path))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=CSV_FIELDS, dtype=str)
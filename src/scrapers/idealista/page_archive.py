@@ -0,0 +1,277 @@
+import bisect
+import gzip
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_PATH = "data/bronze/idealista/archive"
+
+GZIP, ZSTD = 1, 2
+CODECS = {'gzip': GZIP, 'zstd': ZSTD}
+
+MAX_PACK_BYTES = 512 * 1024 * 1024
+
+INDEX_MAGIC = b'PGIX'
+INDEX_HEADER = struct.Struct('<4sIIQ')  # magic, version, record count, journal bytes covered
+# key digest, pack number, offset, compressed length, codec (+3 pad bytes)
+INDEX_RECORD = struct.Struct('<16sIQIB3x')
+INDEX_VERSION = 1
+
+
+def page_key(run_id, operation, property_type, city, page=None, listing_id=None):
+    """Archive key of a search page (page=N) or a listing detail page (listing_id=...)"""
+    target = f"listing:{listing_id}" if listing_id is not None else f"page:{page}"
+    return f"{run_id}|{operation}|{property_type}|{city}|{target}"
+
+
+def key_digest(key):
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+def default_codec():
+    return ZSTD if zstandard is not None else GZIP
+
+
+def compress(data, codec):
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def decompress(data, codec):
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("page was stored with zstd; pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class PageArchive:
+    """
+    Content-addressed store for raw HTML pages.
+    - Pages are compressed (zstd when installed, gzip otherwise) and appended to large pack files
+    - Identical pages are stored once: the blob is keyed by the SHA-1 of the HTML
+    - journal.tsv records key -> blob location as pages arrive; close() writes index.bin,
+      a sorted fixed-size record table that readers mmap and binary-search, so a single
+      page lookup needs neither a directory walk nor loading the journal
+    - iter_pages() streams pages back in pack order for the parsers
+    """
+    def __init__(self, path=ARCHIVE_PATH, codec=None, max_pack_bytes=MAX_PACK_BYTES):
+        self.path = path
+        self.codec = CODECS[codec] if isinstance(codec, str) else (codec or default_codec())
+        self.max_pack_bytes = max_pack_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(path, "packs"), exist_ok=True)
+        self.journal_path = os.path.join(path, "journal.tsv")
+        self.index_path = os.path.join(path, "index.bin")
+
+        # key -> (sha1, pack, offset, length, codec, raw length); sha1 -> location, for dedup.
+        # Loaded on first write/listing only - lookups go through index.bin
+        self.entries = None
+        self.blobs = None
+        self.pack_no = 0
+        self.pack = None
+        self.journal = None
+        self.index_mmap = None
+        self.index_count = 0
+        self.index_dirty = False
+        self.stats = {'stored': 0, 'deduplicated': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+
+    def journal_size(self):
+        return os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+
+    def load_journal(self):
+        if self.entries is not None:
+            return
+        self.entries, self.blobs = {}, {}
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) != 7:
+                    continue  # torn last line after a crash
+                key, sha1 = parts[0], parts[1]
+                entry = (sha1,) + tuple(int(value) for value in parts[2:])
+                self.entries[key] = entry
+                self.blobs[sha1] = entry[1:]
+
+    def pack_path(self, pack_no):
+        return os.path.join(self.path, "packs", f"pack-{pack_no:05d}.pk")
+
+    def open_pack(self):
+        """Current pack file for appending; a new one is started once it reaches max_pack_bytes"""
+        if self.pack is None:
+            packs = sorted(os.listdir(os.path.join(self.path, "packs")))
+            self.pack_no = int(packs[-1][len("pack-"):-len(".pk")]) if packs else 0
+            self.pack = open(self.pack_path(self.pack_no), 'ab')
+        if self.pack.tell() >= self.max_pack_bytes:
+            self.pack.close()
+            self.pack_no += 1
+            self.pack = open(self.pack_path(self.pack_no), 'ab')
+        return self.pack
+
+    def put(self, key, html):
+        """Store one page under key; returns False when its content was already archived"""
+        raw = html.encode('utf-8') if isinstance(html, str) else html
+        sha1 = hashlib.sha1(raw).hexdigest()
+        with self.lock:
+            self.load_journal()
+            location = self.blobs.get(sha1)
+            new_blob = location is None
+            if new_blob:
+                blob = compress(raw, self.codec)
+                pack = self.open_pack()
+                offset = pack.tell()
+                pack.write(blob)
+                pack.flush()
+                location = (self.pack_no, offset, len(blob), self.codec, len(raw))
+                self.blobs[sha1] = location
+                self.stats['stored'] += 1
+                self.stats['stored_bytes'] += len(blob)
+            else:
+                self.stats['deduplicated'] += 1
+            self.stats['raw_bytes'] += len(raw)
+            if self.entries.get(key, (None,))[0] == sha1:
+                return new_blob
+
+            if self.journal is None:
+                self.journal = open(self.journal_path, 'a', encoding='utf-8')
+            self.journal.write('\t'.join([key, sha1] + [str(value) for value in location]) + '\n')
+            self.journal.flush()
+            self.entries[key] = (sha1,) + location
+            self.index_dirty = True
+        return new_blob
+
+    def write_index(self):
+        """Rewrite index.bin from the journal: records sorted by key digest, fixed size"""
+        self.load_journal()
+        records = sorted(
+            (key_digest(key), entry[1], entry[2], entry[3], entry[4])
+            for key, entry in self.entries.items()
+        )
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(records), self.journal_size()))
+            for record in records:
+                f.write(INDEX_RECORD.pack(*record))
+            f.flush()
+            os.fsync(f.fileno())
+        self.close_index()
+        os.replace(tmp_path, self.index_path)
+        self.index_dirty = False
+        return len(records)
+
+    def open_index(self):
+        """mmap index.bin; False when it is missing or older than the journal"""
+        if self.index_mmap is not None:
+            return True
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as f:
+            self.index_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.index_count, covered = INDEX_HEADER.unpack_from(self.index_mmap, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or covered != self.journal_size():
+            # Stale (a writer crashed before close) or foreign: answer from the journal instead
+            self.close_index()
+            return False
+        return True
+
+    def close_index(self):
+        if self.index_mmap is not None:
+            self.index_mmap.close()
+            self.index_mmap = None
+
+    def index_digest(self, i):
+        start = INDEX_HEADER.size + i * INDEX_RECORD.size
+        return self.index_mmap[start:start + 16]
+
+    def lookup(self, key):
+        """(pack, offset, length, codec) for key, from the mmap-ed index (journal if not indexed yet)"""
+        if not self.index_dirty and self.open_index():
+            digest = key_digest(key)
+            digests = _DigestView(self)
+            i = bisect.bisect_left(digests, digest)
+            if i < self.index_count and digests[i] == digest:
+                _, pack, offset, length, codec = INDEX_RECORD.unpack_from(
+                    self.index_mmap, INDEX_HEADER.size + i * INDEX_RECORD.size)
+                return pack, offset, length, codec
+            return None
+        self.load_journal()
+        entry = self.entries.get(key)
+        return entry[1:5] if entry else None
+
+    def read_blob(self, pack, offset, length, codec):
+        with open(self.pack_path(pack), 'rb') as f:
+            f.seek(offset)
+            return decompress(f.read(length), codec).decode('utf-8')
+
+    def get(self, key):
+        """HTML stored under key, or None"""
+        location = self.lookup(key)
+        return self.read_blob(*location) if location else None
+
+    def get_page(self, run_id, operation, property_type, city, page=None, listing_id=None):
+        return self.get(page_key(run_id, operation, property_type, city, page, listing_id))
+
+    def keys(self, run_id=None):
+        self.load_journal()
+        prefix = f"{run_id}|" if run_id else ''
+        return sorted(key for key in self.entries if key.startswith(prefix))
+
+    def iter_pages(self, run_id=None):
+        """Yield (key, html) for a run (or everything), reading each pack file sequentially"""
+        keys = self.keys(run_id)
+        keys.sort(key=lambda k: self.entries[k][1:3])
+        handles = {}
+        try:
+            for key in keys:
+                _, pack, offset, length, codec, _ = self.entries[key]
+                if pack not in handles:
+                    handles[pack] = open(self.pack_path(pack), 'rb')
+                handle = handles[pack]
+                handle.seek(offset)
+                yield key, decompress(handle.read(length), codec).decode('utf-8')
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def close(self):
+        with self.lock:
+            if self.pack is not None:
+                self.pack.close()
+                self.pack = None
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            if self.index_dirty:
+                self.write_index()
+            self.close_index()
+
+
+class _DigestView:
+    """Sequence view over the index's sorted key digests, for bisect"""
+    def __init__(self, archive):
+        self.archive = archive
+
+    def __len__(self):
+        return self.archive.index_count
+
+    def __getitem__(self, i):
+        return self.archive.index_digest(i)
+
+
+def parse_key(key):
+    """page_key() back into its parts: dict with run_id, operation, property_type, city, page / listing_id"""
+    run_id, operation, property_type, city, target = key.split('|')
+    kind, value = target.split(':', 1)
+    parts = {'run_id': run_id, 'operation': operation, 'property_type': property_type, 'city': city}
+    parts['listing_id' if kind == 'listing' else 'page'] = value
+    return parts
@@ -0,0 +1,85 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urljoin
+
+import soupsieve as sv
+
+from src.scrapers.idealista.listing_parser import make_soup, node_text
+
+RESULTS_PER_PAGE = 30
+
+PAGINATION_SELECTORS = {
+    'heading': sv.compile("#h1-container, h1"),
+    'page_link': sv.compile(".pagination a[href*='pagina-']"),
+    'next': sv.compile(".pagination li.next a"),
+}
+
+# "4,793 houses and flats for rent in Lisbon" / "Property for sale in Lisbon, Portugal: 10,342 houses and flats"
+# / "There are no listings ..."
+RESULT_COUNT_RE = re.compile(r'(?:^|:)\s*(\d{1,3}(?:[.,]\d{3})+|\d+)\s')
+NO_RESULTS_RE = re.compile(r'\bno (?:listings|results)\b', re.IGNORECASE)
+PAGE_NUMBER_RE = re.compile(r'pagina-(\d+)')
+
+
+@dataclass
+class PagePlan:
+    """How many result pages a search has, and where the number came from"""
+    pages: int
+    source: str  # 'count' (heading result count) or 'last_link' (complete pagination bar)
+    results: Optional[int] = None
+    per_page: int = RESULTS_PER_PAGE
+
+
+def result_count(soup):
+    """Total results from the page heading; 0 for "no listings", None when there is no count"""
+    heading = node_text(PAGINATION_SELECTORS['heading'].select_one(soup))
+    if not heading:
+        return None
+    match = RESULT_COUNT_RE.search(heading)
+    if match:
+        return int(re.sub(r'[.,]', '', match.group(1)))
+    if NO_RESULTS_RE.search(heading):
+        return 0
+    return None
+
+
+def last_page_link(soup):
+    """Highest pagina-N linked from the pagination bar (0 without one)"""
+    numbers = [int(match.group(1))
+               for link in PAGINATION_SELECTORS['page_link'].select(soup)
+               for match in [PAGE_NUMBER_RE.search(link.get('href', ''))] if match]
+    return max(numbers, default=0)
+
+
+def page_url(first_url, page):
+    """URL of result page N of the search whose page 1 is first_url"""
+    if page <= 1:
+        return first_url
+    return urljoin(first_url if first_url.endswith('/') else first_url + '/', f"pagina-{page}")
+
+
+def plan_pages(html, cards_on_page=None):
+    """PagePlan of a search from its page 1, or None when only the next-link walk can tell
+
+    The heading count divided by the page size gives the total; without a
+    count, the pagination bar is only trusted when it has no "Next" link,
+    i.e. when it already shows every page.
+    """
+    soup = make_soup(html) if isinstance(html, str) else html
+    count = result_count(soup)
+    if count is not None:
+        per_page = RESULTS_PER_PAGE
+        if cards_on_page and cards_on_page < count:
+            per_page = cards_on_page
+        return PagePlan(pages=max(1, math.ceil(count / per_page)), source='count', results=count, per_page=per_page)
+    if PAGINATION_SELECTORS['next'].select_one(soup) is None:
+        return PagePlan(pages=max(1, last_page_link(soup)), source='last_link')
+    return None
+
+
+def enumerate_pages(first_url, plan, max_pages=None):
+    """(page number, URL) of pages 2..N of a planned search, capped at max_pages"""
+    last = plan.pages if max_pages is None else min(plan.pages, max_pages)
+    return [(page, page_url(first_url, page)) for page in range(2, last + 1)]
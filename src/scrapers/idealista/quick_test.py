@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from src.scrapers.idealista.fetcher import (
+    DETAIL_PAGE_MARKER, SEARCH_PAGE_MARKER, BrowserRequired, PageFetcher
+)
+from src.scrapers.idealista.listing_parser import parse_listing_html
+from src.scrapers.idealista.search_parser import next_page_url, parse_search_page
+from src.scrapers.idealista.utils.replay_server import ReplayServer
+
+
+def main():
+    """Offline smoke check: fetch bronze fixtures over HTTP from a local replay server"""
+    with ReplayServer(challenge_paths={"/en/arrendar-casas/lisboa/"}) as server:
+        fetcher = PageFetcher()
+        print(f"Replay server: {server.base_url} ({len(server.routes)} routes)")
+
+        # 1. Search page over plain HTTP
+        page = fetcher.fetch(f"{server.base_url}/en/comprar-casas/lisboa/", required_marker=SEARCH_PAGE_MARKER)
+        cards = parse_search_page(page.html, base_url=server.base_url)
+        print(f"Search page via {page.via}: {len(cards)} cards, next: {next_page_url(page.html, server.base_url)}")
+        assert page.via == 'http' and cards
+
+        # 2. Detail page over plain HTTP
+        page = fetcher.fetch(f"{server.base_url}/en/empreendimento/32950621/", required_marker=DETAIL_PAGE_MARKER)
+        record = parse_listing_html(page.html, url=page.url)
+        print(f"Detail page via {page.via}: {record.title} | {record.area}")
+        assert page.via == 'http' and record.title
+
+        # 3. Challenge page is detected and needs the browser
+        try:
+            fetcher.fetch(f"{server.base_url}/en/arrendar-casas/lisboa/", required_marker=SEARCH_PAGE_MARKER)
+            raise AssertionError("challenge page was accepted")
+        except BrowserRequired:
+            print("Challenge page detected: browser fallback required")
+
+        print(f"Fetcher stats: {fetcher.stats.to_dict()}")
+        fetcher.close()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from src.scrapers.idealista.metrics import METRICS
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `capacity`"""
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    def reserve(self):
+        """Take one token; returns how long the caller has to wait for it"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class HostState:
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.requests = 0
+        self.blocked = 0
+        self.slow = 0
+        self.waited = 0.0
+        self.latency = 0.0
+        self.timed = 0
+
+
+class HostRateScheduler:
+    """
+    Central request pacing, one token bucket per host.
+    - wait(url) blocks until the host's bucket allows the next request (+ jitter)
+    - record(url, latency, blocked) adapts the host rate AIMD-style:
+      fast responses add increase_step req/s, blocks/slow responses multiply by decrease_factor
+    - Thread-safe, so sequential runs and worker pools share one instance
+    """
+    def __init__(self, request_delay=2, burst=1, jitter=0.3, min_delay=0.5, max_delay=30,
+                 target_latency=3, increase_step=0.05, decrease_factor=0.5, sleep=time.sleep):
+        self.initial_rate = 1.0 / request_delay
+        self.burst = burst
+        self.jitter = jitter
+        self.min_rate = 1.0 / max_delay
+        self.max_rate = 1.0 / min_delay
+        self.target_latency = target_latency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.sleep = sleep
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Build from load_scraping_config(): request_delay + the rate_limit section"""
+        return cls(request_delay=config.get('request_delay', 2), **config.get('rate_limit', {}), **kwargs)
+
+    def host_state(self, url):
+        host = urlparse(url).netloc
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.initial_rate, self.burst)
+        return state
+
+    def wait(self, url):
+        """Block until a request to url's host is allowed; returns the seconds slept"""
+        with self.lock:
+            state = self.host_state(url)
+            delay = state.bucket.reserve()
+            delay += random.uniform(0, self.jitter / state.bucket.rate)
+            state.requests += 1
+            state.waited += delay
+        if delay > 0:
+            self.sleep(delay)
+        METRICS.observe('sleep', delay, reason='rate_limit')
+        return delay
+
+    def record(self, url, latency=None, blocked=False):
+        """Feed back one response: its latency (None = not comparable, e.g. a full browser render)
+        and whether it was a block/challenge"""
+        with self.lock:
+            state = self.host_state(url)
+            bucket = state.bucket
+            slow = latency is not None and latency > self.target_latency
+            if latency is not None:
+                state.latency += latency
+                state.timed += 1
+            if blocked or slow:
+                if blocked:
+                    state.blocked += 1
+                else:
+                    state.slow += 1
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+            else:
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase_step)
+
+    def stats(self):
+        with self.lock:
+            return {
+                host: {
+                    'requests': state.requests,
+                    'blocked': state.blocked,
+                    'slow': state.slow,
+                    'seconds_waited': round(state.waited, 3),
+                    'avg_latency': round(state.latency / state.timed, 3) if state.timed else 0.0,
+                    'current_delay': round(1.0 / state.bucket.rate, 3),
+                }
+                for host, state in self.hosts.items()
+            }
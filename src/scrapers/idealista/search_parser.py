@@ -0,0 +1,93 @@
+import re
+from urllib.parse import urljoin
+
+import soupsieve as sv
+
+from src.scrapers.idealista.feature_extractor import match_type
+from src.scrapers.idealista.listing_parser import (
+    ListingRecord, RECORD_FIELDS, listing_id_from_url, make_soup, node_text
+)
+from src.scrapers.idealista.metrics import METRICS
+
+BASE_URL = "https://www.idealista.pt"
+
+CARD_SELECTORS = {
+    'card': sv.compile("article.item"),
+    'link': sv.compile("a.item-link"),
+    'price': sv.compile(".item-price"),
+    'details': sv.compile(".item-detail"),
+    'description': sv.compile(".item-description"),
+    'agency': sv.compile(".logo-branding a"),
+    'next': sv.compile("li.next a, a.icon-arrow-right-after"),
+}
+
+CARD_BEDROOMS_RE = re.compile(r'^t(\d+)$|^(\d+)\s*bed', re.IGNORECASE)
+# "1 hour", "42 minutes", "3 days", "25 Sep" - how long ago the card was (re)published
+CARD_AGE_RE = re.compile(r'^\d+\s*(minutes?|hours?|days?)$|^\d{1,2}\s+[A-Z][a-z]{2}$')
+
+
+def parse_card(card, base_url=BASE_URL, **context):
+    """Map one article.item card onto the idealista_data.csv schema, or None for ad placeholders"""
+    link = CARD_SELECTORS['link'].select_one(card)
+    if link is None or not link.get('href'):
+        return None
+
+    url = urljoin(base_url, link['href'])
+    record = ListingRecord(url=url, listing_id=card.get('data-element-id') or listing_id_from_url(url))
+    for key, value in context.items():
+        if key in RECORD_FIELDS:
+            setattr(record, key, value)
+
+    record.title = link.get('title') or node_text(link)
+    record.location = record.title.split(' in ', 1)[1] if ' in ' in record.title else record.title
+    record.price = node_text(CARD_SELECTORS['price'].select_one(card))
+    record.description = node_text(CARD_SELECTORS['description'].select_one(card))
+
+    agency = CARD_SELECTORS['agency'].select_one(card)
+    record.agency = agency.get('title', '') if agency is not None else ''
+
+    for detail in CARD_SELECTORS['details'].select(card):
+        text = node_text(detail)
+        if not text:
+            continue
+        if 'm²' in text and not record.area:
+            record.area = text
+        elif CARD_AGE_RE.match(text):
+            record.update_date = text
+        elif record.bedrooms is None:
+            match = CARD_BEDROOMS_RE.match(text)
+            if match:
+                record.bedrooms = int(match.group(1) or match.group(2))
+
+    record.property_type_detail = match_type(record.title)
+
+    return record
+
+
+def parse_search_page(html, base_url=BASE_URL, **context):
+    """All listing cards of one search results page as ListingRecords"""
+    with METRICS.timer('parse', page='search'):
+        soup = make_soup(html)
+        records = []
+        seen = set()
+        for card in CARD_SELECTORS['card'].select(soup):
+            record = parse_card(card, base_url=base_url, **context)
+            if record is None or record.listing_id in seen:
+                continue
+            seen.add(record.listing_id)
+            records.append(record)
+    return records
+
+
+def parse_search_file(path, base_url=BASE_URL, **context):
+    """Parse a saved search page, e.g. data/bronze/idealista/run_*/<op>/<type>/<city>/page_1.html"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_search_page(f.read(), base_url=base_url, **context)
+
+
+def next_page_url(html, base_url=BASE_URL):
+    """Absolute URL of the "Next" pagination link, or None on the last page"""
+    link = CARD_SELECTORS['next'].select_one(make_soup(html))
+    if link is None or not link.get('href'):
+        return None
+    return urljoin(base_url, link['href'])
@@ -0,0 +1,88 @@
+import codecs
+import logging
+import copy
+
+import yaml
+
+log = logging.getLogger('scraper.settings')
+
+SCRAPING_CONFIG_PATH = 'config/idealista/scraping_config.yaml'
+
+DEFAULT_SCRAPING_CONFIG = {
+    'base_url': 'https://www.idealista.pt',
+    'request_delay': 2,
+    'rate_limit': {
+        'burst': 1,
+        'jitter': 0.3,
+        'min_delay': 0.5,
+        'max_delay': 30,
+        'target_latency': 3,
+        'increase_step': 0.05,
+        'decrease_factor': 0.5,
+    },
+    'output': {
+        'format': 'csv',  # csv / jsonl / parquet
+        'chunk_rows': 200,
+        'flush_interval': 5,
+    },
+    'archive': {
+        'enabled': True,
+        'path': 'data/bronze/idealista/archive',
+        'codec': None,  # zstd when installed, gzip otherwise
+    },
+    'browser': {
+        'lean': True,  # block images/media/fonts/trackers, no background work
+        'page_load_strategy': 'eager',  # return at DOMContentLoaded (normal = wait for every resource)
+        'driver_path': None,  # chromedriver binary; None = webdriver-manager once, then the cached path
+        'js_heap_mb': 512,
+        'disk_cache_mb': 32,
+        'renderer_processes': 2,
+        'blocked_urls': [],  # extra Network.setBlockedURLs patterns, e.g. '*example.com*'
+    },
+    'block': {
+        'failure_threshold': 3,  # blocked pages in a row that pause the host
+        'cooldown': 60,
+        'max_cooldown': 900,
+        'max_trips': 5,  # pauses in a row before the run stops (resume later)
+    },
+    'queue': {
+        'backend': 'sqlite',  # frontier.sqlite in the run directory, shared by the workers of a run
+        'lease_seconds': 600,  # visibility timeout of a claimed URL in shared runs (renewed while alive)
+        'max_attempts': 3,
+    },
+    'metrics': {
+        'prometheus': False,  # also write metrics.prom next to metrics.json
+    },
+}
+
+
+def read_text(path):
+    """Read a config file saved as UTF-8 or UTF-16 (some configs here carry a UTF-16 BOM)"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return raw.decode('utf-16')
+    return raw.decode('utf-8-sig')
+
+
+def load_yaml(path):
+    return yaml.safe_load(read_text(path)) or {}
+
+
+def merge(defaults, overrides):
+    merged = copy.deepcopy(defaults)
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_scraping_config(path=SCRAPING_CONFIG_PATH):
+    """scraping_config.yaml on top of DEFAULT_SCRAPING_CONFIG"""
+    try:
+        return merge(DEFAULT_SCRAPING_CONFIG, load_yaml(path))
+    except Exception as e:
+        log.error(f"Error loading {path}: {e}")
+        return copy.deepcopy(DEFAULT_SCRAPING_CONFIG)
@@ -0,0 +1,187 @@
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime
+
+from src.scrapers.idealista.settings import load_yaml
+
+LOGGING_CONFIG_PATH = "config/logging_config.yaml"
+ROOT_LOGGER = "scraper"
+
+# Keys of logging_config.yaml that are not part of logging.config.dictConfig
+EXTRA_KEYS = ('queue', 'sampling', 'debug')
+
+DEFAULT_CONFIG = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {'text': {'()': 'src.scrapers.idealista.structured_log.TextFormatter'}},
+    'handlers': {'console': {'class': 'logging.StreamHandler', 'formatter': 'text', 'level': 'INFO'}},
+    'loggers': {ROOT_LOGGER: {'level': 'INFO', 'handlers': ['console'], 'propagate': False}},
+}
+
+_state = {'listeners': [], 'sampler': None}
+
+
+def log_event(logger, event, message=None, level=logging.INFO, **fields):
+    """One structured event: a name, an optional human message and JSON-serializable fields
+
+    Nothing is built when the logger's level filters the event out.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, message or event, extra={'event': event, 'fields': fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, event, msg, thread, the event's fields and exc"""
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': getattr(record, 'event', None),
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Console lines: time, level, logger, message and the event's fields as key=value"""
+    def __init__(self, fmt='%(asctime)s %(levelname)-7s %(name)s: %(message)s', datefmt='%H:%M:%S'):
+        super().__init__(fmt, datefmt)
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items() if value is not None)
+        return line
+
+
+class SampleFilter(logging.Filter):
+    """Keeps 1 in N records of each sampled event (the first one always); others pass untouched"""
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = {event: int(rate) for event, rate in (rates or {}).items() if int(rate) > 1}
+        self.seen = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, 'event', None))
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        with self.lock:
+            count = self.seen[record.event] = self.seen.get(record.event, 0) + 1
+            if (count - 1) % rate == 0:
+                record.fields = dict(record.fields or {}, sampled=rate)
+                return True
+            self.dropped += 1
+            return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller: when the queue is full the record is counted and dropped"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Render the message and traceback here, on the caller's thread; keep event and fields for the formatters
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def read_logging_config(path=LOGGING_CONFIG_PATH):
+    """logging_config.yaml as a dict (the file may be UTF-16 or UTF-8); DEFAULT_CONFIG when missing"""
+    if not os.path.exists(path):
+        return copy.deepcopy(DEFAULT_CONFIG)
+    return load_yaml(path) or copy.deepcopy(DEFAULT_CONFIG)
+
+
+def stop_logging():
+    """Flush and stop the background listeners (also registered with atexit)"""
+    while _state['listeners']:
+        listener, handlers, queue_handler = _state['listeners'].pop()
+        logging.getLogger(queue_handler.logger_name).removeHandler(queue_handler)
+        listener.stop()
+        for handler in handlers:
+            handler.close()
+
+
+def logging_stats():
+    """Records sampled out and records dropped on a full queue since setup_logging"""
+    sampler = _state['sampler']
+    return {
+        'sampled_out': sampler.dropped if sampler else 0,
+        'queue_full': sum(queue_handler.dropped for _, _, queue_handler in _state['listeners']),
+    }
+
+
+def setup_logging(config_path=LOGGING_CONFIG_PATH, site_name="idealista", debug=None):
+    """
+    Configure the scraper loggers from logging_config.yaml behind a background thread.
+    - dictConfig builds the handlers and per-module levels; the handlers of every logger
+      that has some are then moved behind one QueueListener, so callers only enqueue
+    - sampling: {event: N} keeps 1 in N of those events (warnings and errors are never sampled)
+    - debug (or debug: true in the file) lowers the scraper loggers to DEBUG
+    - {site} in handler filenames becomes site_name
+    Returns the resolved debug flag.
+    """
+    stop_logging()
+    config = read_logging_config(config_path)
+    extras = {key: config.pop(key, None) for key in EXTRA_KEYS}
+    debug = bool(extras['debug']) if debug is None else debug
+    for handler in config.get('handlers', {}).values():
+        if 'filename' in handler:
+            handler['filename'] = handler['filename'].format(site=site_name)
+            os.makedirs(os.path.dirname(handler['filename']) or '.', exist_ok=True)
+    if debug:
+        for name, logger_config in config.get('loggers', {}).items():
+            if name == ROOT_LOGGER or name.startswith(ROOT_LOGGER + "."):
+                logger_config['level'] = 'DEBUG'
+    logging.config.dictConfig(config)
+
+    queue_size = (extras['queue'] or {}).get('max_size', 10000)
+    sampler = _state['sampler'] = SampleFilter(extras['sampling'])
+    for name in list(config.get('loggers', {})) + ([''] if config.get('root', {}).get('handlers') else []):
+        logger = logging.getLogger(name)
+        handlers = list(logger.handlers)
+        if not handlers:
+            continue
+        for handler in handlers:
+            logger.removeHandler(handler)
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.logger_name = name
+        queue_handler.addFilter(sampler)
+        logger.addHandler(queue_handler)
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _state['listeners'].append((listener, handlers, queue_handler))
+    return debug
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,150 @@
+import glob
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RUN_DIRS = [
+    "data/bronze/idealista/run_2025-10-02T12-42-39",
+    "data/bronze/idealista/run_2025-10-03T17-43-03",
+]
+
+CHALLENGE_PAGE = (
+    "<html><head><title>idealista.pt</title></head><body>"
+    "<p>Please enable JS and disable any ad blocker</p>"
+    "<script>var dd={'host':'geo.captcha-delivery.com'}</script>"
+    "</body></html>"
+)
+
+
+def build_routes(run_dirs, mapping_path='config/idealista/url_mapping.json'):
+    """Map idealista URL paths onto saved bronze pages
+
+    <run>/<op>/<type>/<city>/page_N.html    -> /en/<op_pt>-<type_pt>/<city_pt>/[pagina-N]
+    <run>/<op>/<type>/<city>/listings/<id>  -> /en/imovel/<id>/ and /en/empreendimento/<id>/
+    """
+    with open(mapping_path, 'r') as f:
+        mapping = json.load(f)
+
+    routes = {}
+    for run_dir in run_dirs:
+        for path in glob.glob(os.path.join(run_dir, '*', '*', '*', 'page_*.html')):
+            city_dir = os.path.dirname(path)
+            city = os.path.basename(city_dir)
+            property_type = os.path.basename(os.path.dirname(city_dir))
+            operation = os.path.basename(os.path.dirname(os.path.dirname(city_dir)))
+            page = int(os.path.basename(path)[len('page_'):-len('.html')])
+
+            op_pt = mapping['operations'].get(operation, operation)
+            prop_pt = mapping['property_types'].get(property_type, property_type)
+            city_pt = mapping['cities'].get(city, city)
+            base = f"/en/{op_pt}-{prop_pt}/{city_pt}/"
+            routes[base if page == 1 else f"{base}pagina-{page}"] = path
+
+        for path in glob.glob(os.path.join(run_dir, '*', '*', '*', 'listings', '*.html')):
+            listing_id = os.path.basename(path)[:-len('.html')]
+            routes[f"/en/imovel/{listing_id}/"] = path
+            routes[f"/en/empreendimento/{listing_id}/"] = path
+    return routes
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?', 1)[0]
+        with server.lock:
+            server.hits[path] = server.hits.get(path, 0) + 1
+            # Drawn under the lock so a seeded server injects the same sequence every run
+            delay = server.latency
+            if server.latency_jitter:
+                delay += server.random.uniform(0, server.latency_jitter)
+            fail = server.error_rate > 0 and server.random.random() < server.error_rate
+            if fail:
+                server.injected_errors += 1
+        if delay > 0:
+            time.sleep(delay)
+
+        if fail:
+            self.send_page(server.error_status, b"<html><body>Service unavailable</body></html>")
+            return
+
+        if path in server.challenge_paths:
+            self.send_page(403, CHALLENGE_PAGE.encode('utf-8'))
+            return
+
+        file_path = server.routes.get(path)
+        if file_path is None:
+            self.send_page(404, b"<html><body>Not found</body></html>")
+            return
+        with open(file_path, 'rb') as f:
+            self.send_page(200, f.read())
+
+    def send_page(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    """
+    Local stand-in for idealista.pt serving the bronze HTML fixtures.
+    - Routes follow the live URL scheme, so scraper code only swaps the base URL
+    - challenge_paths are answered with a bot-challenge page (fallback testing)
+    - latency (+ up to latency_jitter) seconds is added to every response, and error_rate
+      of the requests get error_status instead of the page; both are reproducible with seed
+    """
+    def __init__(self, run_dirs=None, host='127.0.0.1', port=0, challenge_paths=(),
+                 mapping_path='config/idealista/url_mapping.json',
+                 latency=0.0, latency_jitter=0.0, error_rate=0.0, error_status=503, seed=None):
+        self.httpd = ThreadingHTTPServer((host, port), ReplayHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.routes = build_routes(run_dirs or DEFAULT_RUN_DIRS, mapping_path)
+        self.httpd.challenge_paths = set(challenge_paths)
+        self.httpd.hits = {}
+        self.httpd.lock = threading.Lock()
+        self.httpd.latency = latency
+        self.httpd.latency_jitter = latency_jitter
+        self.httpd.error_rate = error_rate
+        self.httpd.error_status = error_status
+        self.httpd.random = random.Random(seed)
+        self.httpd.injected_errors = 0
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def routes(self):
+        return self.httpd.routes
+
+    @property
+    def hits(self):
+        return self.httpd.hits
+
+    @property
+    def injected_errors(self):
+        return self.httpd.injected_errors
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,149 @@
+import logging
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from src.scrapers.idealista.frontier import CrawlFrontier
+from src.scrapers.idealista.output_sink import merge_outputs
+
+log = logging.getLogger('scraper.queue')
+
+SHARDS_DIR = "shards"
+MERGE_LOCK_NAME = ".merge.lock"
+
+
+class WorkQueue(ABC):
+    """
+    Lease-based queue of search pages ('pages') and detail URLs ('listings') for one run.
+    - claim() hands out the oldest pending URL under a lease held by this worker;
+      a URL whose lease expires (visibility timeout) goes back to the queue as another attempt
+    - mark_done / mark_failed / requeue settle a claimed URL; failed ones are retried
+      until max_attempts, requeue() does not count the attempt
+    - add() is idempotent, so every worker can seed the same searches
+    - CrawlFrontier (SQLite) is the local backend; a networked store implements the same methods
+    """
+    @abstractmethod
+    def add(self, kind, url, operation='', property_type='', city='', page=None): ...
+
+    @abstractmethod
+    def add_many(self, kind, urls, operation='', property_type='', city='', pages=None): ...
+
+    @abstractmethod
+    def has(self, kind, url): ...
+
+    @abstractmethod
+    def claim(self, kind): ...
+
+    @abstractmethod
+    def extend_leases(self): ...
+
+    @abstractmethod
+    def mark_done(self, kind, url): ...
+
+    @abstractmethod
+    def mark_failed(self, kind, url, error='', retry=True): ...
+
+    @abstractmethod
+    def requeue(self, kind, url): ...
+
+    @abstractmethod
+    def recover(self): ...
+
+    @abstractmethod
+    def counts(self): ...
+
+    @abstractmethod
+    def close(self): ...
+
+
+WorkQueue.register(CrawlFrontier)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def open_work_queue(run_path, queue_config, worker_id=None):
+    """The run's work queue; worker_id=None is a single-process run (no lease expiry)"""
+    backend = queue_config['backend']
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown work queue backend: {backend}")
+    return CrawlFrontier(
+        os.path.join(run_path, "frontier.sqlite"), max_attempts=queue_config['max_attempts'],
+        worker_id=worker_id, lease_seconds=queue_config['lease_seconds'] if worker_id else None,
+    )
+
+
+def is_drained(counts):
+    """No URL of any kind pending or in flight"""
+    return not any(states.get('pending') or states.get('in_flight') for states in counts.values())
+
+
+class LeaseKeeper:
+    """Renews a worker's leases in the background, so URLs waiting in its pool or output are not re-leased"""
+    def __init__(self, work_queue, interval):
+        self.work_queue = work_queue
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="lease-keeper", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.work_queue.extend_leases()
+            except Exception as e:
+                log.warning(f"Lease renewal failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def shard_path(run_path, worker_id):
+    """Output directory of one worker of a shared run"""
+    return os.path.join(run_path, SHARDS_DIR, worker_id)
+
+
+def shard_paths(run_path):
+    root = os.path.join(run_path, SHARDS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return [os.path.join(root, name) for name in sorted(os.listdir(root))
+            if os.path.isdir(os.path.join(root, name))]
+
+
+def merge_shards(run_path, timeout=600, stale_after=1800):
+    """Merge every shard's output into the run directory, one merger at a time
+
+    Each worker calls it when it finds the queue drained; the last one to
+    finish writes the complete result. A lock file older than stale_after
+    seconds is treated as left behind by a crashed merger.
+    """
+    lock_path = os.path.join(run_path, MERGE_LOCK_NAME)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{lock_path} held for more than {timeout}s")
+            time.sleep(1)
+    try:
+        os.write(fd, default_worker_id().encode('utf-8'))
+        os.close(fd)
+        return merge_outputs(shard_paths(run_path), run_path)
+    finally:
+        os.remove(lock_path)
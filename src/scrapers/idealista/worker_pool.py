@@ -0,0 +1,273 @@
+import logging
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from src.scrapers.idealista.block_detector import GONE, SERVED, PageBlocked, PageUnavailable
+from src.scrapers.idealista.fetcher import DETAIL_PAGE_MARKER, PageFetcher
+from src.scrapers.idealista.listing_parser import parse_listing_html
+from src.scrapers.idealista.metrics import METRICS
+from src.scrapers.idealista.structured_log import log_event
+
+log = logging.getLogger('scraper.workers')
+
+
+@dataclass
+class DetailTask:
+    """One detail URL waiting in the shared queue"""
+    seq: int
+    url: str
+    context: dict
+    attempts: int = 0
+    failed_on: set = field(default_factory=set)
+
+
+def fetch_listing_record(fetcher, url, on_page=None, **context):
+    """Fetch a detail page (HTTP first, browser fallback) and parse it from one snapshot
+
+    on_page(page, record) sees the raw FetchResult, e.g. to archive the HTML.
+    """
+    page = fetcher.fetch(url, required_marker=DETAIL_PAGE_MARKER, wait_selector=".main-info__title-main")
+    if page.verdict != SERVED:
+        raise PageUnavailable(url, page.verdict)
+    record = parse_listing_html(page.html, url=url, **context)
+    if on_page:
+        on_page(page, record)
+    return record
+
+
+class OrderedSink:
+    """
+    Releases per-worker results in submission order.
+    - Workers finish out of order; results wait until every earlier seq is done
+    - Failed tasks are released as None so they don't block the ones behind them
+    """
+    def __init__(self, on_result):
+        self.on_result = on_result
+        self.next_seq = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def put(self, seq, result):
+        with self.lock:
+            self.pending[seq] = result
+            while self.next_seq in self.pending:
+                ready = self.pending.pop(self.next_seq)
+                self.next_seq += 1
+                if ready is not None:
+                    self.on_result(ready)
+
+
+class BrowserWorker(threading.Thread):
+    """One headless Chrome pulling detail URLs from the shared queue"""
+    def __init__(self, pool, name):
+        super().__init__(name=name, daemon=True)
+        self.pool = pool
+        self.driver = None
+        self.fetcher = None
+        # Per-worker backoff state
+        self.consecutive_failures = 0
+        self.processed = 0
+        self.failed = 0
+        self.blocks = 0
+
+    def backoff_delay(self):
+        base = self.pool.backoff_base * (2 ** min(self.consecutive_failures, 5))
+        return min(base, self.pool.max_backoff) + random.uniform(0, 1)
+
+    def run(self):
+        try:
+            self.driver = self.pool.driver_factory()
+            self.fetcher = PageFetcher(self.driver, scheduler=self.pool.scheduler, breaker=self.pool.breaker)
+        except Exception as e:
+            log.error(f"[{self.name}] could not start driver: {e}")
+            self.pool.worker_down(self)
+            return
+
+        try:
+            while True:
+                task = self.pool.tasks.get()
+                if task is None:
+                    self.pool.tasks.task_done()
+                    break
+                if self.pool.breaker is not None and self.pool.breaker.exhausted():
+                    # The host keeps blocking: release without fetching, left in_flight for --resume
+                    self.pool.sink.put(task.seq, None)
+                    self.pool.tasks.task_done()
+                    continue
+                # Retries go to a different worker while one is available
+                if self.name in task.failed_on and not self.pool.all_workers_failed(task):
+                    self.pool.tasks.put(task)
+                    self.pool.tasks.task_done()
+                    time.sleep(0.1)
+                    continue
+                try:
+                    self.handle(task)
+                except Exception:
+                    # Never leave a task unfinished: close() waits on tasks.join()
+                    log.exception(f"[{self.name}] unexpected error handling {task.url}")
+                finally:
+                    self.pool.tasks.task_done()
+                if self.driver is None:
+                    self.pool.worker_down(self)
+                    break
+        finally:
+            self.fetcher.close()
+            try:
+                if self.driver is not None:
+                    self.driver.quit()
+            except Exception:
+                pass
+
+    def handle(self, task):
+        task.attempts += 1
+        try:
+            with METRICS.timer('stage', stage='listing'):
+                record = fetch_listing_record(self.fetcher, task.url, on_page=self.pool.on_page, **task.context)
+            record.scraped_at = datetime.now().isoformat()
+            self.consecutive_failures = 0
+            self.processed += 1
+            self.pool.sink.put(task.seq, record)
+            log_event(log, 'worker.done', f"[{self.name}] done", url=task.url)
+        except PageBlocked as e:
+            self.blocked(task, e)
+        except Exception as e:
+            self.consecutive_failures += 1
+            log_event(log, 'worker.error', f"[{self.name}] error: {e}", logging.WARNING, url=task.url,
+                      attempt=task.attempts)
+            # A removed listing stays removed; don't retry it on other workers
+            gone = isinstance(e, PageUnavailable) and e.verdict == GONE
+            if task.attempts < self.pool.max_attempts and not gone:
+                task.failed_on.add(self.name)
+                self.pool.tasks.put(task)
+            else:
+                self.failed += 1
+                self.pool.sink.put(task.seq, None)
+                if self.pool.on_failed:
+                    self.pool.on_failed(task.url, e)
+            delay = self.backoff_delay()
+            time.sleep(delay)
+            METRICS.observe('sleep', delay, reason='backoff')
+
+
+    def blocked(self, task, error):
+        """Requeue a blocked URL without using up an attempt and restart this worker's browser"""
+        log_event(log, 'worker.blocked', f"[{self.name}] blocked: rotating driver", logging.WARNING,
+                  verdict=error.verdict, url=task.url)
+        self.blocks += 1
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        try:
+            self.driver = self.pool.driver_factory()
+        except Exception as e:
+            # run() takes this worker down; the URL goes back to the queue for the others
+            log.error(f"[{self.name}] could not restart driver: {e}")
+            self.driver = None
+        else:
+            self.fetcher.reset(self.driver)
+            METRICS.inc('driver_rotations')
+        if self.pool.breaker is not None and self.pool.breaker.exhausted():
+            # Left in_flight in the frontier: a --resume run picks it up again
+            self.pool.sink.put(task.seq, None)
+            return
+        self.pool.tasks.put(task)
+
+
+class DetailWorkerPool:
+    """
+    Pool of N browser workers for detail-page extraction.
+    - The producer (search-page walk) calls submit() for each detail URL
+    - Each worker owns its driver, HTTP fetcher and backoff state
+    - Records reach on_record in submission order through one OrderedSink
+    - Request pacing comes from the shared scheduler, not per-worker sleeps
+    - Blocked pages go back to the queue and restart the worker's browser; the shared
+      circuit breaker pauses the host for every worker
+    """
+    def __init__(self, driver_factory, on_record, workers=4, max_attempts=3,
+                 scheduler=None, backoff_base=2, max_backoff=60, on_failed=None, on_page=None, breaker=None):
+        self.driver_factory = driver_factory
+        self.on_failed = on_failed
+        self.on_page = on_page
+        self.workers_count = workers
+        self.max_attempts = max_attempts
+        self.scheduler = scheduler
+        self.breaker = breaker
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.tasks = queue.Queue()
+        self.sink = OrderedSink(on_record)
+        self.workers = []
+        self.alive = set()
+        self.lock = threading.Lock()
+        self.next_seq = 0
+
+    def start(self):
+        for i in range(self.workers_count):
+            worker = BrowserWorker(self, name=f"worker-{i + 1}")
+            self.workers.append(worker)
+            self.alive.add(worker.name)
+            worker.start()
+        return self
+
+    def worker_down(self, worker):
+        with self.lock:
+            self.alive.discard(worker.name)
+            if self.alive:
+                return
+        # No browser left: release everything still queued as failed
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                self.sink.put(task.seq, None)
+                if self.on_failed:
+                    self.on_failed(task.url, "no browser workers running")
+            self.tasks.task_done()
+
+    def running(self):
+        """True while at least one browser worker is up"""
+        with self.lock:
+            return bool(self.alive)
+
+    def all_workers_failed(self, task):
+        with self.lock:
+            return self.alive <= task.failed_on
+
+    def submit(self, url, **context):
+        """Queue one detail URL; returns its sequence number"""
+        with self.lock:
+            if self.workers and not self.alive:
+                raise RuntimeError("No browser workers are running")
+            seq = self.next_seq
+            self.next_seq += 1
+        self.tasks.put(DetailTask(seq=seq, url=url, context=context))
+        return seq
+
+    def join(self):
+        """Wait until every submitted URL is done or out of retries"""
+        self.tasks.join()
+
+    def close(self):
+        self.join()
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def stats(self):
+        return {
+            worker.name: {
+                'processed': worker.processed,
+                'failed': worker.failed,
+                'blocked': worker.blocks,
+                'fetcher': worker.fetcher.stats.to_dict() if worker.fetcher else None,
+            }
+            for worker in self.workers
+        }